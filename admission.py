@@ -0,0 +1,205 @@
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+from instrumentation import counter, gauge, get_logger
+
+# Admission control and load shedding for the search apps.
+#
+# An AdmissionController holds a fixed number of in-flight slots. Requests
+# beyond that wait in per-client FIFO queues that are served round robin,
+# so one busy client cannot starve the others, while priority requests
+# (template cache hits, session refinements: work that never reaches the
+# LLM) wait in their own queue that is always served first.
+#
+# Waiting is only allowed while it fits the SLO. The expected wait is
+# estimated from the requests ahead and a moving average of how long a slot
+# is held; when it would exceed ADMISSION_SLO_MS, or a client already has
+# ADMISSION_CLIENT_QUEUE requests waiting, the request is refused right
+# away instead of timing out later:
+#
+#   429  this client has too many requests waiting
+#   503  the controller is saturated
+#
+# both with a Retry-After of the estimated wait. A request whose wait
+# overruns the SLO anyway is dropped with 503.
+#
+# Each app has one controller for /search as a whole and one per
+# extractor backend around the LLM call, so a slow provider backs up only
+# the requests that need it.
+#
+# Environment variables:
+#   ADMISSION_ENABLED          apply admission control (default 1)
+#   ADMISSION_SEARCH_IN_FLIGHT /search requests processed at once (default 32)
+#   ADMISSION_LLM_IN_FLIGHT    LLM calls in flight per backend (default 8);
+#                              ADMISSION_LLM_IN_FLIGHT_<BACKEND> overrides one backend
+#   ADMISSION_MAX_QUEUE        requests allowed to wait per controller (default 64)
+#   ADMISSION_CLIENT_QUEUE     requests one client may have waiting (default 4)
+#   ADMISSION_SLO_MS           longest acceptable queue wait (default 2000)
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+ADMISSION_SEARCH_IN_FLIGHT = int(os.getenv("ADMISSION_SEARCH_IN_FLIGHT", "32"))
+ADMISSION_LLM_IN_FLIGHT = int(os.getenv("ADMISSION_LLM_IN_FLIGHT", "8"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+ADMISSION_CLIENT_QUEUE = int(os.getenv("ADMISSION_CLIENT_QUEUE", "4"))
+ADMISSION_SLO_MS = float(os.getenv("ADMISSION_SLO_MS", "2000"))
+
+# Weight of the newest sample in the hold-time average
+HOLD_TIME_ALPHA = 0.2
+
+ADMISSION_REQUESTS = counter(
+    "admission_requests_total", "Requests by admission outcome", ("controller", "priority", "outcome")
+)
+ADMISSION_IN_FLIGHT = gauge("admission_in_flight", "Requests holding a slot", ("controller",))
+ADMISSION_QUEUED = gauge("admission_queue_depth", "Requests waiting for a slot", ("controller",))
+
+logger = get_logger("admission")
+
+
+class Overloaded(Exception):
+    def __init__(self, status_code, detail, retry_after):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class AdmissionController:
+    """
+    In-flight budget with fair, SLO-bounded queueing. Used from the event
+    loop only.
+    """
+
+    def __init__(self, name, max_in_flight, max_queue=ADMISSION_MAX_QUEUE,
+                 client_queue=ADMISSION_CLIENT_QUEUE, slo_ms=ADMISSION_SLO_MS):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.client_queue = client_queue
+        self.slo_s = slo_ms / 1000.0
+        self.in_flight = 0
+        self.hold_s = None  # Moving average of slot hold time
+        self._priority = deque()
+        self._clients = OrderedDict()  # client -> deque of waiters, in round-robin order
+        self._waiting = 0
+
+    def expected_wait(self, ahead):
+        # Requests ahead drain max_in_flight at a time, one hold time per round
+        hold = self.hold_s if self.hold_s is not None else self.slo_s / 4
+        return (ahead // self.max_in_flight + 1) * hold
+
+    def _outcome(self, priority, outcome):
+        ADMISSION_REQUESTS.inc(self.name, "high" if priority else "normal", outcome)
+
+    def _gauges(self):
+        ADMISSION_IN_FLIGHT.set(self.in_flight, self.name)
+        ADMISSION_QUEUED.set(self._waiting, self.name)
+
+    async def acquire(self, client, priority=False):
+        """
+        Take a slot, waiting for one if the SLO allows. Raises Overloaded.
+        """
+        if self.in_flight < self.max_in_flight and not self._waiting:
+            self.in_flight += 1
+            self._outcome(priority, "admitted")
+            self._gauges()
+            return
+
+        # Priority requests only queue behind other priority requests
+        ahead = len(self._priority) if priority else self._waiting
+        wait = self.expected_wait(ahead)
+        if wait > self.slo_s or self._waiting >= self.max_queue:
+            self._outcome(priority, "rejected_saturated")
+            raise Overloaded(503, f"{self.name} is overloaded, retry later", wait)
+        queue = self._priority if priority else self._clients.setdefault(client, deque())
+        if not priority and len(queue) >= self.client_queue:
+            self._outcome(priority, "rejected_client")
+            raise Overloaded(429, "Too many queued requests from this client", wait)
+
+        waiter = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        self._waiting += 1
+        self._gauges()
+        started = time.monotonic()
+        try:
+            done, _ = await asyncio.wait({waiter}, timeout=self.slo_s)
+        except asyncio.CancelledError:
+            # The client went away: give back the slot if it was granted meanwhile
+            if waiter.done():
+                self.release()
+            else:
+                self._forget(client, queue, waiter)
+            raise
+        if not done:
+            self._forget(client, queue, waiter)
+            self._outcome(priority, "timed_out")
+            raise Overloaded(503, f"{self.name} queue wait exceeded {self.slo_s * 1000:.0f} ms", self.expected_wait(self._waiting))
+        self._outcome(priority, "queued")
+        logger.debug("%s admitted %s after %.0f ms", self.name, client, (time.monotonic() - started) * 1000)
+
+    def _forget(self, client, queue, waiter):
+        queue.remove(waiter)
+        if not queue and self._clients.get(client) is queue:
+            del self._clients[client]
+        self._waiting -= 1
+        self._gauges()
+
+    def release(self, held_s=None):
+        if held_s is not None:
+            self.hold_s = held_s if self.hold_s is None else self.hold_s + HOLD_TIME_ALPHA * (held_s - self.hold_s)
+        self.in_flight -= 1
+        self._dispatch()
+        self._gauges()
+
+    def _next_waiter(self):
+        if self._priority:
+            return self._priority.popleft()
+        if self._clients:
+            client, queue = next(iter(self._clients.items()))
+            waiter = queue.popleft()
+            if queue:
+                self._clients.move_to_end(client)
+            else:
+                del self._clients[client]
+            return waiter
+        return None
+
+    def _dispatch(self):
+        while self.in_flight < self.max_in_flight:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            self._waiting -= 1
+            self.in_flight += 1
+            waiter.set_result(None)
+
+    @asynccontextmanager
+    async def admit(self, client, priority=False):
+        """
+        Hold a slot for the duration of the block.
+        """
+        if not ADMISSION_ENABLED:
+            yield
+            return
+        await self.acquire(client, priority)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+
+_backend_controllers = {}
+
+
+def backend_controller(backend):
+    """
+    The LLM admission controller for an extractor backend.
+    """
+    controller = _backend_controllers.get(backend)
+    if controller is None:
+        in_flight = int(os.getenv(f"ADMISSION_LLM_IN_FLIGHT_{backend.upper()}", ADMISSION_LLM_IN_FLIGHT))
+        controller = _backend_controllers[backend] = AdmissionController(f"llm:{backend}", in_flight)
+    return controller
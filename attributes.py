@@ -0,0 +1,190 @@
+import argparse
+import os
+import time
+
+from instrumentation import counter, get_logger
+
+# Flattened product attributes.
+#
+# Catalog products keep their attributes in `product_details`, an array of
+# single-key objects ({"Fabric": "Cotton"}, {"Color": "Black"}, ...), which
+# needs one index per key. Ingest also writes them as a uniform key/value
+# array:
+#
+#   attrs: [{"k": "Fabric", "v": "Cotton"}, {"k": "Color", "v": "Black"}, ...]
+#   color: "Black"
+#
+# One compound multikey index on (attrs.k, attrs.v) serves every attribute,
+# and `color` is a plain field the search response projects. Positive
+# product_details predicates from the LLM, dotted or as a single-key
+# $elemMatch, are rewritten into {"attrs": {"$elemMatch": {"k": ..., "v": ...}}};
+# negative ones ($ne, $nin, $not, ...) keep their array semantics on
+# product_details.
+#
+# Until a collection has been backfilled, each rewritten predicate also
+# matches products without attrs on the original product_details field:
+#
+#   {"$or": [{"attrs": {"$elemMatch": ...}},
+#            {"attrs.k": null, "product_details.Color": ...}]}
+#
+# Both branches lead with attrs.k, so both are served by the attrs index
+# (products without attrs are indexed under null).
+#
+# Environment variables:
+#   ATTRIBUTE_FILTERS      rewrite product_details filters onto attrs (default 1)
+#   ATTRIBUTE_UNFLATTENED  also match products that have no attrs yet (default 1;
+#                          set 0 once the collection is backfilled)
+#
+# Add attrs/color to products ingested before they existed:
+#   python attributes.py --backfill
+
+ATTRIBUTE_FILTERS = os.getenv("ATTRIBUTE_FILTERS", "1") == "1"
+ATTRIBUTE_UNFLATTENED = os.getenv("ATTRIBUTE_UNFLATTENED", "1") == "1"
+
+ATTRIBUTE_FIELD = "attrs"
+ATTRIBUTE_INDEX = [(f"{ATTRIBUTE_FIELD}.k", 1), (f"{ATTRIBUTE_FIELD}.v", 1)]
+
+# Value operators whose meaning is the same on a single attrs.v as on the product_details array
+POSITIVE_OPERATORS = {"$eq", "$in", "$regex", "$options", "$gt", "$gte", "$lt", "$lte"}
+
+ATTRIBUTE_REWRITES = counter("attribute_filter_rewrites_total", "product_details predicates rewritten onto attrs")
+
+logger = get_logger("attributes")
+
+
+def _normalize_key(key):
+    return str(key).strip().replace(" ", "_")
+
+
+def flatten_attributes(product):
+    """
+    Set `attrs` and `color` from a product's product_details.
+    """
+    attrs = []
+    for detail in product.get("product_details") or []:
+        if not isinstance(detail, dict):
+            continue
+        for key, value in detail.items():
+            if value is None or isinstance(value, (dict, list)):
+                continue
+            value = value.strip() if isinstance(value, str) else value
+            if value == "":
+                continue
+            attrs.append({"k": _normalize_key(key), "v": value})
+            if key == "Color" and "color" not in product:
+                product["color"] = value
+    product[ATTRIBUTE_FIELD] = attrs
+    return product
+
+
+def _is_positive(condition):
+    if not isinstance(condition, dict):
+        return not isinstance(condition, list)
+    return bool(condition) and set(condition) <= POSITIVE_OPERATORS
+
+
+def _match(key, condition):
+    return {"$elemMatch": {"k": _normalize_key(key), "v": condition}}
+
+
+def _detail_predicate(field, condition):
+    # Entries hold a single key, so {"product_details": {"$elemMatch": {"Color": c}}}
+    # matches the same products as {"product_details.Color": c}
+    if field == "product_details" and isinstance(condition, dict) and set(condition) == {"$elemMatch"}:
+        match = condition["$elemMatch"]
+        if isinstance(match, dict) and len(match) == 1:
+            (key, value), = match.items()
+            if not key.startswith("$"):
+                return f"product_details.{key}", value
+    return field, condition
+
+
+def _attribute_predicate(field, condition):
+    # attrs clause for a product_details predicate that can be rewritten, else None
+    field, condition = _detail_predicate(field, condition)
+    if not field.startswith("product_details.") or not _is_positive(condition):
+        return None
+    clause = {ATTRIBUTE_FIELD: _match(field.partition(".")[2], condition)}
+    if ATTRIBUTE_UNFLATTENED:
+        clause = {"$or": [clause, {f"{ATTRIBUTE_FIELD}.k": None, field: condition}]}
+    return clause
+
+
+def is_attribute_predicate(field, condition):
+    """
+    Whether attribute_filter moves this predicate onto the attrs index.
+    """
+    return ATTRIBUTE_FILTERS and _attribute_predicate(field, condition) is not None
+
+
+def attribute_filter(filter_query):
+    """
+    Rewrite the top-level product_details predicates of one filter document
+    onto the attrs index. Nested $and/$or branches are left to the caller.
+    """
+    if not ATTRIBUTE_FILTERS or not isinstance(filter_query, dict):
+        return filter_query
+    rewritten, predicates = {}, []
+    for field, condition in filter_query.items():
+        predicate = _attribute_predicate(field, condition)
+        if predicate is None:
+            rewritten[field] = condition
+        else:
+            predicates.append(predicate)
+    if not predicates:
+        return filter_query
+    ATTRIBUTE_REWRITES.inc(amount=len(predicates))
+    if len(predicates) == 1 and set(predicates[0]).isdisjoint(rewritten):
+        rewritten.update(predicates[0])
+    else:
+        # One $elemMatch per attribute, each its own index lookup
+        rewritten["$and"] = list(rewritten.get("$and", [])) + predicates
+    return rewritten
+
+
+def backfill_attributes(collection, batch_size=5000):
+    """
+    Add attrs/color to every product that does not have them yet. Returns
+    the number of products updated.
+    """
+    from pymongo import UpdateOne
+    from mongo_store import bulk_write_batched
+
+    operations = []
+    updated = 0
+    for product in collection.find({ATTRIBUTE_FIELD: {"$exists": False}}, {"product_details": 1}):
+        flatten_attributes(product)
+        fields = {ATTRIBUTE_FIELD: product[ATTRIBUTE_FIELD]}
+        if "color" in product:
+            fields["color"] = product["color"]
+        operations.append(UpdateOne({"_id": product["_id"]}, {"$set": fields}))
+        if len(operations) >= batch_size:
+            updated += bulk_write_batched(collection, operations)["modified"]
+            operations = []
+    if operations:
+        updated += bulk_write_batched(collection, operations)["modified"]
+    return updated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the flattened product attributes.")
+    parser.add_argument("--backfill", action="store_true", help="Add attrs/color to products that lack them")
+    parser.add_argument("--collection", default="flipKart_products", help="Product collection")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from mongo_store import write_collection
+
+    load_dotenv()
+    if args.backfill:
+        collection = write_collection(args.collection)
+        start = time.perf_counter()
+        updated = backfill_attributes(collection)
+        collection.create_index(ATTRIBUTE_INDEX)
+        print(f"Backfilled attributes on {updated} products in {time.perf_counter() - start:.1f}s")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+import bisect
+import heapq
+import math
+import os
+import threading
+import time
+from array import array
+
+from instrumentation import counter, gauge, get_logger
+
+# In-memory typeahead over product titles, brands, categories and
+# sub_categories.
+#
+# Every distinct (kind, text) is a suggestion, keyed by its lowercased,
+# whitespace-normalized text and scored by popularity weighted with rating:
+#
+#   score = products with that value * (0.5 + mean rating / 10)
+#
+# (unrated products count as rating 3). Keys live in one sorted array, so
+# a prefix is a contiguous range found with two binary searches, and a
+# max segment tree over the scores yields the best k of any range with a
+# best-first walk, O(k log n) no matter how many keys share the prefix.
+#
+# The index follows the catalog state (catalog_snapshot.py) instead of
+# reading Mongo: rows replayed after an ingest update the scores of known
+# suggestions in place and put new ones in a small sorted delta that is
+# searched alongside. Rows the state replaced in place (a changed title or
+# brand) take their previously indexed values out before adding the new
+# ones; suggestions left with no products are hidden and dropped at the next
+# rebuild. When the delta outgrows AUTOCOMPLETE_DELTA_MAX, the sorted array
+# is rebuilt off the request path and swapped in.
+#
+# Environment variables:
+#   AUTOCOMPLETE_SIZE       suggestions returned by default (default 8)
+#   AUTOCOMPLETE_DELTA_MAX  new suggestions kept beside the sorted array (default 1024)
+
+AUTOCOMPLETE_SIZE = int(os.getenv("AUTOCOMPLETE_SIZE", "8"))
+AUTOCOMPLETE_DELTA_MAX = int(os.getenv("AUTOCOMPLETE_DELTA_MAX", "1024"))
+
+KINDS = ("brand", "category", "sub_category", "title")
+DEFAULT_RATING = 3.0
+
+AUTOCOMPLETE_KEYS = gauge("autocomplete_keys", "Suggestions in the typeahead index")
+AUTOCOMPLETE_REBUILDS = counter("autocomplete_rebuilds_total", "Sorted typeahead index rebuilds")
+
+logger = get_logger("autocomplete")
+
+
+def normalize(text):
+    return " ".join(str(text).lower().split())
+
+
+class _Suggestion:
+    __slots__ = ("kind", "text", "count", "rating_sum")
+
+    def __init__(self, kind, text):
+        self.kind = kind
+        self.text = text
+        self.count = 0
+        self.rating_sum = 0.0
+
+    @property
+    def score(self):
+        return self.count * (0.5 + self.rating_sum / self.count / 10) if self.count else 0.0
+
+
+class _SortedIndex:
+    """
+    Sorted keys with a max segment tree over their scores. Scores can be
+    updated in place; the key set is fixed.
+    """
+
+    def __init__(self, keys, scores):
+        self.keys = keys
+        self.scores = array("d", scores)
+        self.positions = {key: index for index, key in enumerate(keys)}
+        size = 1
+        while size < max(1, len(keys)):
+            size *= 2
+        self.size = size
+        # tree[node] is the index of the best key under node, -1 when empty
+        tree = array("l", [-1]) * (2 * size)
+        tree[size:size + len(keys)] = array("l", range(len(keys)))
+        for node in range(size - 1, 0, -1):
+            tree[node] = self._better(tree[2 * node], tree[2 * node + 1], self.scores)
+        self.tree = tree
+
+    @staticmethod
+    def _better(left, right, scores):
+        if left < 0:
+            return right
+        if right < 0:
+            return left
+        return left if scores[left] >= scores[right] else right
+
+    def update(self, index, score):
+        scores, tree = self.scores, self.tree
+        scores[index] = score
+        node = (index + self.size) // 2
+        while node:
+            tree[node] = self._better(tree[2 * node], tree[2 * node + 1], scores)
+            node //= 2
+
+    def top(self, lo, hi, k):
+        """
+        Indexes of the best `k` keys in [lo, hi), best first.
+        """
+        scores, tree = self.scores, self.tree
+        # The O(log n) subtrees that exactly cover the range
+        heap = []
+        left, right = lo + self.size, hi + self.size
+        while left < right:
+            if left & 1:
+                best = tree[left]
+                if best >= 0:
+                    heap.append((-scores[best], left))
+                left += 1
+            if right & 1:
+                right -= 1
+                best = tree[right]
+                if best >= 0:
+                    heap.append((-scores[best], right))
+            left //= 2
+            right //= 2
+        heapq.heapify(heap)
+        result = []
+        size = self.size
+        while heap and len(result) < k:
+            _, node = heapq.heappop(heap)
+            # Walk down to the best leaf, queueing the siblings passed on the way
+            while node < size:
+                best = tree[node]
+                node *= 2
+                if tree[node] != best:
+                    node += 1
+                sibling = node ^ 1
+                if tree[sibling] >= 0:
+                    heapq.heappush(heap, (-scores[tree[sibling]], sibling))
+            result.append(node - size)
+        return result
+
+    def range(self, prefix):
+        lo = bisect.bisect_left(self.keys, prefix)
+        return lo, bisect.bisect_left(self.keys, prefix + "\uffff", lo)
+
+
+class AutocompleteIndex:
+    """
+    Typeahead index fed from a CatalogState. `ready` is False until the
+    first sync.
+    """
+
+    def __init__(self, delta_max=AUTOCOMPLETE_DELTA_MAX):
+        self.delta_max = delta_max
+        self._suggestions = {}  # key -> _Suggestion
+        self._sorted = _SortedIndex([], [])
+        self._delta = []  # sorted keys not in the sorted index yet
+        self._rows = 0
+        self._replaced = 0  # Position in the state's replaced_rows log
+        # What was indexed for each row, to take it back out when the row is replaced
+        self._indexed_titles = []
+        self._indexed_ratings = array("f")
+        self._indexed_codes = {kind: array("I") for kind in KINDS[:3]}
+        self._lock = threading.Lock()
+        self.ready = False
+
+    @staticmethod
+    def _key(kind, text):
+        key = normalize(text)
+        # Brands and categories are separate suggestions from equal titles
+        return key if kind == "title" else f"{key}\0{kind}"
+
+    def _observe(self, kind, text, rating, sign=1):
+        if not text:
+            return None
+        key = self._key(kind, text)
+        suggestion = self._suggestions.get(key)
+        if suggestion is None:
+            if sign < 0:
+                return None
+            suggestion = self._suggestions[key] = _Suggestion(kind, text)
+        suggestion.count += sign
+        suggestion.rating_sum += sign * (DEFAULT_RATING if math.isnan(rating) else rating)
+        return key
+
+    def _indexed_row(self, state, row):
+        return (self._indexed_titles[row], self._indexed_ratings[row],
+                [state.dictionaries[kind][self._indexed_codes[kind][row]] for kind in KINDS[:3]])
+
+    def _record_row(self, state, row):
+        # Remember the row's current values and return them
+        title, rating = state.titles[row], state.numbers["rating"][row]
+        if row == len(self._indexed_titles):
+            self._indexed_titles.append(title)
+            self._indexed_ratings.append(rating)
+            for kind in KINDS[:3]:
+                self._indexed_codes[kind].append(state.codes[kind][row])
+        else:
+            self._indexed_titles[row] = title
+            self._indexed_ratings[row] = rating
+            for kind in KINDS[:3]:
+                self._indexed_codes[kind][row] = state.codes[kind][row]
+        return title, rating, [state.dictionaries[kind][state.codes[kind][row]] for kind in KINDS[:3]]
+
+    def sync(self, state):
+        """
+        Index the catalog state's rows added or replaced since the last sync.
+        Returns the number of rows indexed.
+        """
+        with state._lock:
+            start, end = self._rows, len(state)
+            # Replaced rows indexed before; newer ones are read in full below
+            replaced = sorted({row for row in state.replaced_rows[self._replaced:] if row < start})
+            self._replaced = len(state.replaced_rows)
+            removed = [self._indexed_row(state, row) for row in replaced]
+            rows = [self._record_row(state, row) for row in replaced + list(range(start, end))]
+        touched = set()
+        for (title, rating, values), sign in [(row, -1) for row in removed] + [(row, 1) for row in rows]:
+            for kind, text in zip(KINDS, values + [title]):
+                key = self._observe(kind, text, rating, sign)
+                if key is not None:
+                    touched.add(key)
+
+        positions = self._sorted.positions
+        added = [key for key in touched if key not in positions]
+        if not self.ready or len(self._delta) + len(added) > self.delta_max:
+            # Too many new keys for the delta: re-sort everything, scores included
+            self._rebuild()
+        else:
+            with self._lock:
+                for key in touched:
+                    index = positions.get(key)
+                    if index is not None:
+                        self._sorted.update(index, self._suggestions[key].score)
+                    else:
+                        position = bisect.bisect_left(self._delta, key)
+                        if position == len(self._delta) or self._delta[position] != key:
+                            self._delta.insert(position, key)
+        self._rows = end
+        self.ready = True
+        AUTOCOMPLETE_KEYS.set(len(self._suggestions))
+        return len(rows)
+
+    def _rebuild(self):
+        started = time.perf_counter()
+        # Suggestions whose products were all replaced are dropped here
+        self._suggestions = {key: s for key, s in self._suggestions.items() if s.count > 0}
+        keys = sorted(self._suggestions)
+        rebuilt = _SortedIndex(keys, [self._suggestions[key].score for key in keys])
+        with self._lock:
+            self._sorted, self._delta = rebuilt, []
+        AUTOCOMPLETE_REBUILDS.inc()
+        logger.info("Rebuilt typeahead index: %d keys in %.2fs", len(keys), time.perf_counter() - started)
+
+    def suggest(self, prefix, size=AUTOCOMPLETE_SIZE):
+        """
+        Return up to `size` suggestions for a prefix, best first, as dicts
+        with text, kind and score.
+        """
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        with self._lock:
+            index, delta = self._sorted, self._delta
+            lo, hi = index.range(prefix)
+            found = [index.keys[i] for i in index.top(lo, hi, size)]
+            if delta:
+                start = bisect.bisect_left(delta, prefix)
+                end = bisect.bisect_left(delta, prefix + "\uffff", start)
+                found += delta[start:end]
+        suggestions = [s for s in map(self._suggestions.get, found) if s is not None and s.count > 0]
+        if delta:
+            suggestions = heapq.nlargest(size, suggestions, key=lambda s: s.score)
+        return [{"text": s.text, "kind": s.kind, "score": round(s.score, 2)} for s in suggestions]
@@ -0,0 +1,657 @@
+import argparse
+import importlib.util
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+
+from attributes import flatten_attributes
+from extractors import RuleBackend, register_backend
+from generate_catalog import generate
+from instrumentation import parse_server_timing
+from catalog_snapshot import LiveCatalog
+from facets import FacetSummary, count_facets
+from top_views import TopNViews, view_documents
+
+# Load-test and latency benchmark for the /search endpoint of every app.
+#
+# Each app is imported in-process with the deterministic "stub" extractor
+# backend (rule-based, with configurable injected latency) and its MongoDB
+# collection is either an in-memory stand-in or a real local MongoDB. With
+# the in-memory backend, the complex app's other Mongo readers (top-N
+# views, facet summary, catalog state) are pointed at in-memory collections
+# derived from the same catalog, so no request waits on a missing server.
+# The app is served with uvicorn on a free port and driven over HTTP with
+# a configurable number of concurrent clients.
+#
+# --cold-start N additionally imports each app N times in a fresh
+# interpreter with its real backend and records the import time. Point
+# --root at another checkout to measure an older tree.
+#
+# Example:
+#   python benchmark.py --app groq --app complex-groq --concurrency 16 \
+#       --requests 500 --llm-latency-ms 80 --output bench_results.json
+#   python benchmark.py --app groq --baseline bench_results.json
+#   python benchmark.py --cold-start 10 --requests 0
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# App name -> (file path, search route, catalog schema)
+APPS = {
+    "openai": ("openai-app.py", "/search/", "simple"),
+    "groq": ("groq-app.py", "/search", "simple"),
+    "llama": ("llama-app.py", "/search", "simple"),
+    "complex-groq": (os.path.join("complex data", "groq-app.py"), "/search", "flipkart"),
+}
+
+# Default fixture per catalog schema
+DEFAULT_DATA = {
+    "simple": os.path.join(ROOT_DIR, "ecom.json"),
+    "flipkart": None,
+}
+
+# Template cache file for the apps under test, never the one in the working directory
+TEMPLATE_CACHE_PATH = os.path.join(tempfile.mkdtemp(prefix="benchmark-"), "query_templates.json")
+
+# Placeholder settings so app modules import without a .env
+PLACEHOLDER_ENV = {
+    "DATABASE_NAME": "benchmark",
+    "COLLECTION_NAME": "products",
+    "OPENAI_API_KEY": "benchmark-stub",
+    "GROQ_API_KEY": "benchmark-stub",
+}
+
+# Queries used when no query file is given
+DEFAULT_QUERIES = [
+    "Show me red and black shirts",
+    "I want a blue jacket",
+    "white socks",
+    "black shoes and a gray hoodie",
+    "anything in purple",
+    "yellow hat",
+    "top 5 rated shirts",
+    "blue jeans under 2000",
+]
+
+
+# ---------------------------------------------------------------------------
+# In-memory MongoDB stand-in
+# ---------------------------------------------------------------------------
+
+def _resolve_path(doc, path):
+    # Return every value reachable through a dotted path, descending into arrays
+    values = [doc]
+    for part in path.split("."):
+        next_values = []
+        for value in values:
+            if isinstance(value, list):
+                for item in value:
+                    if isinstance(item, dict) and part in item:
+                        next_values.append(item[part])
+            elif isinstance(value, dict) and part in value:
+                next_values.append(value[part])
+        values = next_values
+    flat = []
+    for value in values:
+        if isinstance(value, list):
+            flat.extend(value)
+        flat.append(value)
+    return flat
+
+
+def _compare(op, left, right):
+    try:
+        if op == "$lt":
+            return left < right
+        if op == "$lte":
+            return left <= right
+        if op == "$gt":
+            return left > right
+        if op == "$gte":
+            return left >= right
+    except TypeError:
+        return False
+    return False
+
+
+def _match_condition(values, condition):
+    if not isinstance(condition, dict) or not any(k.startswith("$") for k in condition):
+        # As in MongoDB, equality with null also matches a missing field
+        return condition in values or (condition is None and not values)
+    for op, arg in condition.items():
+        if op == "$eq":
+            ok = arg in values
+        elif op == "$ne":
+            ok = arg not in values
+        elif op == "$in":
+            ok = any(a in values for a in arg)
+        elif op == "$nin":
+            ok = not any(a in values for a in arg)
+        elif op in ("$lt", "$lte", "$gt", "$gte"):
+            ok = any(_compare(op, v, arg) for v in values)
+        elif op == "$exists":
+            ok = bool(values) == bool(arg)
+        elif op == "$regex":
+            flags = re.IGNORECASE if "i" in condition.get("$options", "") else 0
+            pattern = re.compile(arg, flags)
+            ok = any(isinstance(v, str) and pattern.search(v) for v in values)
+        elif op == "$options":
+            continue
+        elif op == "$elemMatch":
+            ok = any(isinstance(v, dict) and _matches(v, arg) for v in values)
+        elif op == "$not":
+            ok = not _match_condition(values, arg)
+        else:
+            raise ValueError(f"Unsupported operator in in-memory collection: {op}")
+        if not ok:
+            return False
+    return True
+
+
+def _matches(doc, filter_query):
+    for key, condition in filter_query.items():
+        if key == "$and":
+            if not all(_matches(doc, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(_matches(doc, sub) for sub in condition):
+                return False
+        elif key == "$nor":
+            if any(_matches(doc, sub) for sub in condition):
+                return False
+        elif not _match_condition(_resolve_path(doc, key), condition):
+            return False
+    return True
+
+
+def _project(doc, projection):
+    if not projection:
+        return dict(doc)
+    includes = {k for k, v in projection.items() if v and k != "_id"}
+    if includes:
+        result = {k: doc[k] for k in includes if k in doc}
+        if projection.get("_id", 1) and "_id" in doc:
+            result["_id"] = doc["_id"]
+        return result
+    return {k: v for k, v in doc.items() if projection.get(k, 1)}
+
+
+class InMemoryCursor:
+    def __init__(self, docs, projection=None):
+        self._docs = docs
+        self._projection = projection
+        self._limit = 0
+
+    def sort(self, key, direction=1):
+        self._docs = sorted(self._docs, key=lambda d: (d.get(key) is None, d.get(key)), reverse=direction < 0)
+        return self
+
+    def limit(self, limit):
+        self._limit = limit
+        return self
+
+    def max_time_ms(self, max_time_ms):
+        return self
+
+    def __iter__(self):
+        docs = self._docs[: self._limit] if self._limit else self._docs
+        return (_project(doc, self._projection) for doc in docs)
+
+
+class InMemoryCollection:
+    """
+    Minimal stand-in for a pymongo collection supporting the query operators
+    the search apps and their LLM-generated filters use.
+    """
+
+    def __init__(self, name="products"):
+        self.name = name
+        self._docs = []
+        self._lock = threading.Lock()
+
+    def insert_many(self, docs, **kwargs):
+        with self._lock:
+            start = len(self._docs)
+            for i, doc in enumerate(docs):
+                doc = dict(doc)
+                doc.setdefault("_id", f"{start + i:024x}")
+                self._docs.append(doc)
+        return type("InsertManyResult", (), {"inserted_ids": list(range(start, start + len(docs)))})()
+
+    def find(self, filter_query=None, projection=None, limit=0, **kwargs):
+        filter_query = filter_query or {}
+        with self._lock:
+            docs = [doc for doc in self._docs if _matches(doc, filter_query)]
+        return InMemoryCursor(docs, projection).limit(limit)
+
+    def find_one(self, filter_query=None, projection=None, **kwargs):
+        return next(iter(self.find(filter_query, projection, limit=1)), None)
+
+    def count_documents(self, filter_query, **kwargs):
+        return sum(1 for _ in self.find(filter_query))
+
+    def with_options(self, **kwargs):
+        # A single copy of the data: every read preference sees the same documents
+        return self
+
+
+# ---------------------------------------------------------------------------
+# Deterministic stub LLM backend
+# ---------------------------------------------------------------------------
+
+@register_backend("stub")
+class StubBackend(RuleBackend):
+    """
+    Rule-based extractor with injected latency, standing in for a model.
+    Configured per run through class attributes.
+    """
+
+    latency_ms = 0.0
+    jitter_ms = 0
+    recorder = None
+
+    def _sleep(self, user_query):
+        start = time.perf_counter()
+        if self.latency_ms or self.jitter_ms:
+            # Deterministic jitter derived from the query text
+            jitter = (sum(map(ord, user_query)) % (self.jitter_ms + 1)) if self.jitter_ms else 0
+            time.sleep((self.latency_ms + jitter) / 1000.0)
+        return start
+
+    def extract(self, user_query):
+        start = self._sleep(user_query)
+        result = super().extract(user_query)
+        if self.recorder:
+            self.recorder.record("llm", time.perf_counter() - start)
+        return result
+
+    def generate_filter(self, user_query, prompt=None):
+        start = self._sleep(user_query)
+        result = super().generate_filter(user_query, prompt)
+        if self.recorder:
+            self.recorder.record("llm", time.perf_counter() - start)
+        return result
+
+
+# ---------------------------------------------------------------------------
+# Stage timing
+# ---------------------------------------------------------------------------
+
+class StageRecorder:
+    def __init__(self):
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self._samples.setdefault(stage, []).append(seconds * 1000.0)
+
+    def samples(self):
+        with self._lock:
+            return {stage: list(values) for stage, values in self._samples.items()}
+
+
+class TimedCursor:
+    # Times both query dispatch and result iteration as the "db" stage
+    def __init__(self, cursor, recorder, started):
+        self._cursor = cursor
+        self._recorder = recorder
+        self._elapsed = time.perf_counter() - started
+
+    def __getattr__(self, name):
+        attr = getattr(self._cursor, name)
+        if not callable(attr):
+            return attr
+
+        def chained(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if result is self._cursor:
+                return self
+            return result
+        return chained
+
+    def __iter__(self):
+        start = time.perf_counter()
+        docs = list(self._cursor)
+        self._recorder.record("db", self._elapsed + time.perf_counter() - start)
+        return iter(docs)
+
+
+class TimedCollection:
+    def __init__(self, collection, recorder):
+        self._collection = collection
+        self._recorder = recorder
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+    def find(self, *args, **kwargs):
+        start = time.perf_counter()
+        return TimedCursor(self._collection.find(*args, **kwargs), self._recorder, start)
+
+
+def percentile(values, pct):
+    # Nearest-rank percentile
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100.0 * len(ordered) + 0.5)))
+    return round(ordered[min(rank, len(ordered)) - 1], 3)
+
+
+def summarize(values):
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values), 3) if values else None,
+        "p50_ms": percentile(values, 50),
+        "p95_ms": percentile(values, 95),
+        "p99_ms": percentile(values, 99),
+        "max_ms": round(max(values), 3) if values else None,
+    }
+
+
+# ---------------------------------------------------------------------------
+# App loading and serving
+# ---------------------------------------------------------------------------
+
+def load_app_module(app_name):
+    relative_path = APPS[app_name][0]
+    path = os.path.join(ROOT_DIR, relative_path)
+    module_name = "bench_" + re.sub(r"\W", "_", app_name)
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_documents(path):
+    if path.endswith(".jsonl"):
+        with open(path, "r") as file:
+            return [json.loads(line) for line in file if line.strip()]
+    with open(path, "r") as file:
+        return json.load(file)
+
+
+def prepare_app(app_name, args, recorder):
+    schema = APPS[app_name][2]
+
+    for key, value in PLACEHOLDER_ENV.items():
+        os.environ.setdefault(key, value)
+    if args.mongo_uri:
+        os.environ["MONGO_URI"] = args.mongo_uri
+    # Start from an empty template cache and keep learned templates out of the working directory
+    os.environ["TEMPLATE_CACHE_PATH"] = TEMPLATE_CACHE_PATH
+
+    # Every app picks its extractor from EXTRACTOR_BACKEND
+    os.environ["EXTRACTOR_BACKEND"] = "stub"
+    StubBackend.latency_ms = args.llm_latency_ms
+    StubBackend.jitter_ms = args.llm_jitter_ms
+    StubBackend.recorder = recorder
+
+    module = load_app_module(app_name)
+    # The simple apps keep their collection on app.state, the complex app on the module
+    holder = module if hasattr(module, "collection") else module.app.state
+
+    data_path = args.data or DEFAULT_DATA[schema]
+    if data_path:
+        documents = load_documents(data_path)
+    else:
+        # No Flipkart-schema fixture ships with the repo; synthesize one
+        documents = generate(args.catalog_size, seed=args.catalog_seed)
+    if schema == "flipkart":
+        # Searches filter on the flattened attributes ingest writes (see attributes.py)
+        for document in documents:
+            flatten_attributes(document)
+    if args.mongo_uri:
+        collection = holder.collection
+        if args.seed and documents:
+            collection.delete_many({})
+            collection.insert_many(documents)
+    else:
+        collection = InMemoryCollection()
+        if documents:
+            collection.insert_many(documents)
+        if hasattr(module, "live_catalog"):
+            stub_complex_app(module, collection)
+
+    holder.collection = TimedCollection(collection, recorder)
+    return module
+
+
+def stub_complex_app(module, collection):
+    """
+    Point the complex app's module-level Mongo readers at in-memory
+    collections holding what ingest would have written for `collection`.
+    """
+    products = list(collection.find())
+    # The top-N views ingest would have materialized
+    views = InMemoryCollection("top_views")
+    views.insert_many(view_documents(products))
+    module.top_views = TopNViews(views)
+    # The facet summary ingest would have counted
+    facets = InMemoryCollection("facets")
+    facets.insert_many([
+        {"_id": f"{facet}:{value}", "facet": facet, "value": value, "count": count}
+        for (facet, value), count in count_facets(products).items()
+    ])
+    module.facet_summary = FacetSummary(facets)
+    # Catalog state built by scanning the collection, never from or into a snapshot file
+    live_catalog = LiveCatalog(
+        collection, InMemoryCollection("catalog_meta"), path=os.path.join(os.path.dirname(TEMPLATE_CACHE_PATH), "catalog.snapshot")
+    )
+    live_catalog.subscribe(module.autocomplete_index.sync)
+    module.live_catalog = live_catalog
+
+
+def serve(app, port):
+    import uvicorn
+
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.time() + 10
+    while not server.started:
+        if time.time() > deadline:
+            raise RuntimeError("Timed out waiting for benchmark server to start")
+        time.sleep(0.01)
+    return server, thread
+
+
+def free_port():
+    import socket
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def drive(url, queries, total_requests, concurrency, warmup):
+    session_local = threading.local()
+
+    def send(index):
+        session = getattr(session_local, "session", None)
+        if session is None:
+            session = session_local.session = requests.Session()
+        query = queries[index % len(queries)]
+        start = time.perf_counter()
+        response = session.post(url, json={"query": query})
+        latency = (time.perf_counter() - start) * 1000.0
+        return latency, response.status_code, parse_server_timing(response.headers.get("Server-Timing"))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, range(warmup)))
+        start = time.perf_counter()
+        results = list(pool.map(send, range(total_requests)))
+        elapsed = time.perf_counter() - start
+    return results, elapsed
+
+
+def run_app(app_name, args, queries):
+    recorder = StageRecorder()
+    module = prepare_app(app_name, args, recorder)
+    port = free_port()
+    server, thread = serve(module.app, port)
+    try:
+        url = f"http://127.0.0.1:{port}{APPS[app_name][1]}"
+        results, elapsed = drive(url, queries, args.requests, args.concurrency, args.warmup)
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
+
+    # Warm-up requests are recorded by the server-side wrappers too; drop them
+    stages = {stage: values[args.warmup:] for stage, values in recorder.samples().items()}
+    # Stages the app reports itself through its Server-Timing header
+    for _, _, server_timings in results:
+        for stage, duration in server_timings.items():
+            stages.setdefault("server_total" if stage == "total" else stage, []).append(duration)
+    stages["total"] = [latency for latency, _, _ in results]
+    statuses = {}
+    for _, status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    return {
+        "requests": len(results),
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(len(results) / elapsed, 2) if elapsed else None,
+        "status_counts": statuses,
+        "stages": {stage: summarize(values) for stage, values in stages.items()},
+    }
+
+
+COLD_START_SNIPPET = """
+import importlib.util, sys, time
+start = time.perf_counter()
+spec = importlib.util.spec_from_file_location("cold_start_app", sys.argv[1])
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+print(time.perf_counter() - start)
+"""
+
+
+def measure_cold_start(app_name, root, runs):
+    """
+    Import an app in `runs` fresh interpreters with its real backend and
+    return import-time statistics in milliseconds.
+    """
+    env = dict(os.environ)
+    env.pop("EXTRACTOR_BACKEND", None)
+    env["TEMPLATE_CACHE_PATH"] = TEMPLATE_CACHE_PATH
+    for key, value in PLACEHOLDER_ENV.items():
+        env.setdefault(key, value)
+    path = os.path.join(root, APPS[app_name][0])
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", COLD_START_SNIPPET, path], cwd=root, env=env, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"Cold start of {app_name} failed:\n{result.stderr}")
+        samples.append(float(result.stdout.strip().splitlines()[-1]) * 1000.0)
+    return summarize(samples)
+
+
+def git_commit(root=ROOT_DIR):
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=root, capture_output=True, text=True
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(current, baseline):
+    # Print per-stage p50/p95/p99 and RPS deltas against a previous results file
+    for app_name, result in current["results"].items():
+        old = baseline.get("results", {}).get(app_name)
+        if not old:
+            continue
+        if "cold_start" in result and "cold_start" in old:
+            print(f"\n{app_name}: cold start p50 {old['cold_start']['p50_ms']} -> {result['cold_start']['p50_ms']} ms")
+        if "stages" not in result or "stages" not in old:
+            continue
+        print(f"\n{app_name}: rps {old['rps']} -> {result['rps']}")
+        for stage, stats in result["stages"].items():
+            old_stats = old["stages"].get(stage)
+            if not old_stats:
+                continue
+            for key in ("p50_ms", "p95_ms", "p99_ms"):
+                before, after = old_stats[key], stats[key]
+                if before and after is not None:
+                    change = (after - before) / before * 100.0
+                    print(f"  {stage:<16} {key:<7} {before:>10.3f} -> {after:>10.3f} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the /search endpoint of each app.")
+    parser.add_argument("--app", action="append", choices=sorted(APPS), help="App to benchmark (repeatable, default: all)")
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests per app")
+    parser.add_argument("--warmup", type=int, default=10, help="Unmeasured warm-up requests per app")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="Latency injected into the stub LLM")
+    parser.add_argument("--llm-jitter-ms", type=int, default=0, help="Deterministic extra latency range for the stub LLM")
+    parser.add_argument("--mongo-uri", help="Use a real MongoDB instead of the in-memory stand-in")
+    parser.add_argument("--seed", action="store_true", help="Replace the MongoDB collection contents with --data")
+    parser.add_argument("--data", help="JSON array or JSONL file of products to load")
+    parser.add_argument("--catalog-size", type=int, default=10000, help="Generated catalog size when --data is not given")
+    parser.add_argument("--catalog-seed", type=int, default=42, help="Seed for the generated catalog")
+    parser.add_argument("--queries", help="Text file with one query per line")
+    parser.add_argument("--output", default="bench_results.json", help="Where to write machine-readable results")
+    parser.add_argument("--baseline", help="Previous results file to diff against")
+    parser.add_argument("--cold-start", type=int, default=0, metavar="N", help="Also time N fresh-interpreter imports per app")
+    parser.add_argument("--root", default=ROOT_DIR, help="Checkout to measure cold start in (default: this tree)")
+    args = parser.parse_args()
+
+    if args.queries:
+        with open(args.queries, "r") as file:
+            queries = [line.strip() for line in file if line.strip()]
+    else:
+        queries = DEFAULT_QUERIES
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "cold_start_commit": git_commit(args.root) if args.cold_start else None,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "backend": "mongodb" if args.mongo_uri else "in-memory",
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "llm_latency_ms": args.llm_latency_ms,
+            "llm_jitter_ms": args.llm_jitter_ms,
+            "data": args.data,
+            "catalog_size": None if args.data else args.catalog_size,
+        },
+        "results": {},
+    }
+
+    for app_name in args.app or sorted(APPS):
+        result = {}
+        if args.cold_start:
+            result["cold_start"] = measure_cold_start(app_name, args.root, args.cold_start)
+            print(f"{app_name}: cold start p50 {result['cold_start']['p50_ms']} ms")
+        if args.requests:
+            print(f"Benchmarking {app_name} ...")
+            result.update(run_app(app_name, args, queries))
+            total = result["stages"]["total"]
+            print(f"  {result['rps']} req/s, p50 {total['p50_ms']} ms, p95 {total['p95_ms']} ms, p99 {total['p99_ms']} ms")
+        report["results"][app_name] = result
+
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2, sort_keys=True)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as file:
+            compare(report, json.load(file))
+
+
+if __name__ == "__main__":
+    main()
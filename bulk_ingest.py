@@ -0,0 +1,375 @@
+import argparse
+import glob
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from attributes import ATTRIBUTE_INDEX, flatten_attributes
+from catalog_snapshot import (
+    CATALOG_META_COLLECTION, commit_catalog_version, next_catalog_version, update_snapshot,
+)
+from dedup import DEDUP_ENABLED, DuplicateIndex, annotate
+from facets import FACET_COLLECTION, update_facets
+from filter_guard import INDEXED_FIELDS
+from instrumentation import get_logger
+from top_views import TOPN_COLLECTION, refresh_views
+
+# Parallel ingest of many catalog files into flipKart_products.
+#
+# Sources are files, directories (searched recursively) or glob patterns
+# matching .json (array), .jsonl and their .gz variants. Files are parsed
+# and prepared on a process pool, and the parsed batches are written by a
+# bounded pool of writer threads, so decompression and JSON parsing use
+# every core while the number of concurrent Mongo writes stays fixed.
+# Facet counts and top-N views are updated with the products each batch
+# actually wrote, and each file is stamped with a new catalog version (see
+# catalog_snapshot.py).
+# Near-duplicates are grouped under a canonical product (see dedup.py) and
+# product_details are flattened into indexed attrs (see attributes.py).
+#
+# Environment variables:
+#   INGEST_PROCESSES   parser processes (default: CPU count)
+#   INGEST_WRITERS     concurrent insert_many calls (default 4)
+#   MONGO_BULK_BATCH_SIZE  documents per insert_many (default 1000)
+#   INGEST_MAX_DOCS_PER_S  write throttle for background jobs (default 5000, 0 = unlimited)
+#
+# Example:
+#   python bulk_ingest.py "crawl/shards/*.jsonl.gz" extra/ --writers 8
+
+INGEST_PROCESSES = int(os.getenv("INGEST_PROCESSES", "0")) or os.cpu_count() or 1
+INGEST_WRITERS = int(os.getenv("INGEST_WRITERS", "4"))
+INGEST_MAX_DOCS_PER_S = float(os.getenv("INGEST_MAX_DOCS_PER_S", "5000"))
+
+EXTENSIONS = (".json", ".jsonl", ".json.gz", ".jsonl.gz")
+
+logger = get_logger("bulk_ingest")
+
+
+def expand_sources(sources):
+    """
+    Resolve files, directories and glob patterns to a sorted list of
+    catalog files.
+    """
+    files = set()
+    for source in sources:
+        matches = glob.glob(source, recursive=True) if glob.has_magic(source) else [source]
+        if not matches:
+            raise FileNotFoundError(f"No files match {source}")
+        for match in matches:
+            if os.path.isdir(match):
+                for root, _, names in os.walk(match):
+                    files.update(os.path.join(root, name) for name in names if name.endswith(EXTENSIONS))
+            elif os.path.isfile(match):
+                files.add(match)
+            else:
+                raise FileNotFoundError(f"File not found: {match}")
+    return sorted(files)
+
+
+def prepare_product(doc):
+    # Give every product its _id up front so facets and views can reference it before the insert
+    if "_id" not in doc:
+        from bson import ObjectId
+
+        doc["_id"] = str(ObjectId())
+    flatten_attributes(doc)
+    # MinHash signatures are computed here, on the parser processes
+    return annotate(doc) if DEDUP_ENABLED else doc
+
+
+def parse_file(path):
+    """
+    Parse one catalog file. Returns (path, products, errors, size in bytes).
+    Runs in a worker process.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    name = path[:-3] if path.endswith(".gz") else path
+    products, errors = [], []
+    try:
+        with opener(path, "rt", encoding="utf-8") as file:
+            if name.endswith(".jsonl"):
+                for number, line in enumerate(file, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        doc = json.loads(line)
+                    except json.JSONDecodeError as e:
+                        errors.append(f"{path}:{number}: {e}")
+                        continue
+                    if isinstance(doc, dict):
+                        products.append(prepare_product(doc))
+                    else:
+                        errors.append(f"{path}:{number}: not a JSON object")
+            else:
+                data = json.load(file)
+                if not isinstance(data, list):
+                    raise ValueError("JSON data should be a list of products")
+                for index, doc in enumerate(data):
+                    if isinstance(doc, dict):
+                        products.append(prepare_product(doc))
+                    else:
+                        errors.append(f"{path}[{index}]: not a JSON object")
+    except (OSError, EOFError, ValueError) as e:
+        errors.append(f"{path}: {e}")
+    return path, products, errors, os.path.getsize(path)
+
+
+class RateLimiter:
+    """
+    Token bucket over documents written per second, shared by all writer
+    threads of a load. Bursts are limited to 100 ms worth of writes; a
+    batch larger than the bucket goes through and the caller waits off the
+    debt.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or rate / 10.0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if delay:
+            time.sleep(delay)
+
+
+class IngestProgress:
+    """
+    Thread-safe ingest counters with a point-in-time summary.
+    """
+
+    def __init__(self, total_files=0):
+        self.total_files = total_files
+        self.files_done = 0
+        self.parsed = 0
+        self.inserted = 0
+        self.failed = 0
+        self.bytes_read = 0
+        self.errors = []
+        self.started = time.monotonic()
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def add(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def error(self, message, keep=100):
+        with self._lock:
+            if len(self.errors) < keep:
+                self.errors.append(message)
+
+    def snapshot(self):
+        with self._lock:
+            elapsed = (self.finished or time.monotonic()) - self.started
+            return {
+                "files": self.files_done,
+                "total_files": self.total_files,
+                "parsed": self.parsed,
+                "inserted": self.inserted,
+                "failed": self.failed,
+                "errors": list(self.errors),
+                "seconds": round(elapsed, 2),
+                "docs_per_s": round(self.inserted / elapsed, 1) if elapsed else 0.0,
+                "mb_per_s": round(self.bytes_read / 1e6 / elapsed, 2) if elapsed else 0.0,
+            }
+
+
+def _insert_batch(collection, batch, progress):
+    """
+    Insert one batch, returning the documents that were actually written.
+    """
+    from pymongo.errors import BulkWriteError
+
+    try:
+        result = collection.insert_many(batch, ordered=False)
+        progress.add(inserted=len(result.inserted_ids))
+        return batch
+    except BulkWriteError as e:
+        # Unordered inserts keep going past duplicates; keep what landed
+        write_errors = e.details.get("writeErrors", [])
+        rejected = {write_error.get("index") for write_error in write_errors}
+        inserted = [doc for index, doc in enumerate(batch) if index not in rejected]
+        progress.add(inserted=len(inserted), failed=len(batch) - len(inserted))
+        for write_error in write_errors[:5]:
+            progress.error(write_error.get("errmsg", str(write_error)))
+        return inserted
+    except Exception as e:
+        progress.add(failed=len(batch))
+        progress.error(str(e))
+        return []
+
+
+def _parsed_files(files, processes):
+    # Yield parse results as they finish, keeping at most 2 * processes files in flight
+    if processes <= 1:
+        for path in files:
+            yield parse_file(path)
+        return
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        pending = set()
+        queue = iter(files)
+        for path in queue:
+            pending.add(pool.submit(parse_file, path))
+            if len(pending) >= 2 * processes:
+                break
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+                path = next(queue, None)
+                if path is not None:
+                    pending.add(pool.submit(parse_file, path))
+
+
+def ingest(sources, collection, facet_collection=None, view_collection=None,
+           processes=INGEST_PROCESSES, writers=INGEST_WRITERS, batch_size=None, progress=None,
+           max_docs_per_s=0, meta_collection=None):
+    """
+    Load every catalog file under `sources` into `collection`. Returns the
+    progress summary. Pass an IngestProgress to watch a running load and
+    `max_docs_per_s` to throttle writes. With `meta_collection`, products
+    are stamped with catalog versions that are committed once every write
+    has finished.
+    """
+    files = expand_sources(sources)
+    batch_size = batch_size or int(os.getenv("MONGO_BULK_BATCH_SIZE", "1000"))
+    progress = progress or IngestProgress()
+    progress.total_files = len(files)
+
+    # Bounded writers; the semaphore stops parsing from running ahead of Mongo
+    slots = threading.BoundedSemaphore(writers * 2)
+    throttle = RateLimiter(max_docs_per_s) if max_docs_per_s else None
+    duplicates = DuplicateIndex(collection) if DEDUP_ENABLED else None
+    version = None
+
+    def write(batch):
+        try:
+            if throttle:
+                throttle.acquire(len(batch))
+            inserted = _insert_batch(collection, batch, progress)
+            # Facet counts and top-N views only take products that landed, so failed inserts
+            # and rejected duplicates neither inflate counts nor show up in a view
+            if inserted and facet_collection is not None:
+                try:
+                    update_facets(facet_collection, inserted)
+                except Exception as e:
+                    progress.error(f"Updating facets failed: {e}")
+            if inserted and view_collection is not None:
+                try:
+                    refresh_views(view_collection, inserted)
+                except Exception as e:
+                    progress.error(f"Refreshing top-N views failed: {e}")
+        finally:
+            slots.release()
+
+    with ThreadPoolExecutor(max_workers=writers, thread_name_prefix="ingest-writer") as pool:
+        for path, products, errors, size in _parsed_files(files, processes):
+            for message in errors:
+                progress.error(message)
+            progress.add(parsed=len(products), failed=len(errors), bytes_read=size)
+            if products and meta_collection is not None:
+                version = next_catalog_version(meta_collection)
+                for product in products:
+                    product["_catalog_version"] = version
+            if products and duplicates is not None:
+                duplicates.assign(products)
+            for start in range(0, len(products), batch_size):
+                slots.acquire()
+                pool.submit(write, products[start:start + batch_size])
+            progress.add(files_done=1)
+            logger.debug("Parsed %s: %d products, %d errors", path, len(products), len(errors))
+
+    # The writer pool has drained, so every canonical exists and every stamped version is readable
+    if duplicates is not None:
+        duplicates.link_variants()
+    if meta_collection is not None and version is not None:
+        commit_catalog_version(meta_collection, version)
+    progress.finished = time.monotonic()
+    return progress.snapshot()
+
+
+def ensure_indexes(collection):
+    # Create the indexes search queries rely on (no-op if they exist)
+    for field in INDEXED_FIELDS:
+        collection.create_index(field)
+    # Every product_details attribute filter (see attributes.py)
+    collection.create_index(ATTRIBUTE_INDEX)
+    # Catalog state replay reads products by version
+    collection.create_index("_catalog_version")
+    # Near-duplicate candidate lookup and group collapsing
+    collection.create_index("_lsh")
+    collection.create_index("_group")
+
+
+def _report(progress, stop, interval=1.0):
+    while not stop.wait(interval):
+        s = progress.snapshot()
+        sys.stderr.write(
+            f"\r{s['files']}/{s['total_files']} files  {s['inserted']} inserted  "
+            f"{s['failed']} failed  {s['docs_per_s']:.0f} docs/s  {s['mb_per_s']:.1f} MB/s"
+        )
+        sys.stderr.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load catalog files into MongoDB in parallel.")
+    parser.add_argument("sources", nargs="+", help="Files, directories or glob patterns (.json, .jsonl, .gz)")
+    parser.add_argument("--collection", default="flipKart_products", help="Target collection")
+    parser.add_argument("--processes", type=int, default=INGEST_PROCESSES, help="Parser processes")
+    parser.add_argument("--writers", type=int, default=INGEST_WRITERS, help="Concurrent Mongo writers")
+    parser.add_argument("--batch-size", type=int, help="Documents per insert_many")
+    parser.add_argument("--max-docs-per-s", type=float, default=0, help="Throttle writes (0 = unlimited)")
+    parser.add_argument("--skip-derived", action="store_true", help="Do not update facets, top-N views or the catalog snapshot")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from mongo_store import write_collection
+
+    load_dotenv()
+    collection = write_collection(args.collection)
+    facet_collection = None if args.skip_derived else write_collection(FACET_COLLECTION)
+    view_collection = None if args.skip_derived else write_collection(TOPN_COLLECTION)
+    meta_collection = write_collection(CATALOG_META_COLLECTION)
+
+    progress = IngestProgress()
+    stop = threading.Event()
+    reporter = threading.Thread(target=_report, args=(progress, stop), daemon=True)
+    reporter.start()
+    try:
+        summary = ingest(
+            args.sources, collection, facet_collection, view_collection,
+            processes=args.processes, writers=args.writers, batch_size=args.batch_size, progress=progress,
+            max_docs_per_s=args.max_docs_per_s, meta_collection=meta_collection,
+        )
+    finally:
+        stop.set()
+        reporter.join()
+        sys.stderr.write("\n")
+    ensure_indexes(collection)
+    if not args.skip_derived:
+        update_snapshot(collection, meta_collection)
+
+    print(
+        f"Ingested {summary['inserted']} of {summary['parsed']} products from {summary['files']} files "
+        f"in {summary['seconds']}s ({summary['docs_per_s']:.0f} docs/s, {summary['mb_per_s']:.1f} MB/s), "
+        f"{summary['failed']} failed"
+    )
+    for message in summary["errors"][:10]:
+        print(f"  {message}")
+
+
+if __name__ == "__main__":
+    main()
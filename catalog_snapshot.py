@@ -0,0 +1,549 @@
+import argparse
+import bisect
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from array import array
+from collections import Counter
+
+from dedup import is_variant
+from facets import price_bucket
+from instrumentation import counter, gauge, get_logger
+
+# Versioned binary snapshot of the in-memory catalog state.
+#
+# Search processes keep a columnar copy of the catalog (ids, titles,
+# dictionary-coded brand / category / sub_category / colour / price bucket, numeric
+# price / discount / rating columns and an availability flag) for work that
+# should not go to Mongo per request. Near-duplicate variants are left out. Rebuilding it means scanning the
+# whole collection, so ingest writes it to a compact binary file that
+# workers mmap at startup.
+#
+# Filtered facet counts are answered from the state: counts per facet value
+# and availability are precomputed for every single-value filter, and
+# sorted posting lists of rows per value are intersected for filters on
+# several columns. Both are built once in the background after a load and
+# kept current as products are replayed.
+#
+# Every ingested file is stamped with a catalog version (`_catalog_version`
+# on each product, allocated from CATALOG_META_COLLECTION). The snapshot
+# records the version it includes, and a worker that loads it only replays
+# products with a newer version. Versions become visible to replay once the
+# ingest that wrote them has committed, which assumes one ingest job at a
+# time (the default INGEST_JOB_WORKERS=1). The committed version and the
+# replayed products are read from the primary, whatever read preference
+# the handles passed in carry.
+#
+# File layout, little endian:
+#   header   magic "CATSNAP1", format version (I), catalog version (Q),
+#            rows (I), sections (I), CRC-32 of everything after the table (I)
+#   table    per section: name (32s), typecode (c), offset (Q), length (Q)
+#   payload  numeric sections are raw arrays; "s" sections are NUL-joined UTF-8
+#
+# Environment variables:
+#   CATALOG_SNAPSHOT_PATH        snapshot file (default "catalog.snapshot")
+#   CATALOG_META_COLLECTION      version counter collection (default "catalog_meta")
+#   CATALOG_REFRESH_S            how often workers replay new versions (default 30)
+#
+# Write or refresh the snapshot by hand:
+#   python catalog_snapshot.py --update
+
+CATALOG_SNAPSHOT_PATH = os.getenv("CATALOG_SNAPSHOT_PATH", "catalog.snapshot")
+CATALOG_META_COLLECTION = os.getenv("CATALOG_META_COLLECTION", "catalog_meta")
+CATALOG_REFRESH_S = float(os.getenv("CATALOG_REFRESH_S", "30"))
+
+MAGIC = b"CATSNAP1"
+FORMAT_VERSION = 2  # 2: variants left out
+HEADER = struct.Struct("<8sIQIII")
+SECTION = struct.Struct("<32scQQ")
+
+# Dictionary-coded columns, named after the facet each one answers
+CODED_COLUMNS = ("brand", "category", "sub_category", "color", "price")
+NUMERIC_COLUMNS = ("selling_price", "actual_price", "discount", "rating")
+
+SNAPSHOT_ROWS = gauge("catalog_snapshot_rows", "Products in the in-memory catalog state")
+SNAPSHOT_VERSION = gauge("catalog_snapshot_version", "Catalog version the in-memory state includes")
+SNAPSHOT_REPLAYED = counter("catalog_snapshot_replayed_total", "Products replayed on top of a snapshot")
+
+logger = get_logger("catalog_snapshot")
+
+# Fields read from Mongo to build or replay the state
+STATE_PROJECTION = {
+    "title": 1, "brand": 1, "category": 1, "sub_category": 1, "product_details": 1,
+    "selling_price": 1, "actual_price": 1, "discount": 1, "average_rating": 1,
+    "out_of_stock": 1, "_catalog_version": 1, "_canonical": 1,
+}
+
+
+def _number(value):
+    digits = "".join(ch for ch in str(value or "") if ch.isdigit() or ch == ".")
+    try:
+        return float(digits)
+    except ValueError:
+        return math.nan
+
+
+def _color(product):
+    for detail in product.get("product_details") or []:
+        if isinstance(detail, dict) and detail.get("Color"):
+            return detail["Color"]
+    return ""
+
+
+# -- catalog versions ---------------------------------------------------------
+
+def next_catalog_version(meta_collection):
+    """
+    Allocate the version stamped on the next ingested file.
+    """
+    from pymongo import ReturnDocument
+
+    doc = meta_collection.find_one_and_update(
+        {"_id": "catalog"}, {"$inc": {"allocated": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+    )
+    return doc["allocated"]
+
+
+def commit_catalog_version(meta_collection, version):
+    # Make every version up to `version` visible to replay
+    meta_collection.update_one({"_id": "catalog"}, {"$max": {"committed": version}}, upsert=True)
+
+
+def _primary(collection):
+    # Replay reads go to the primary even from search handles: a lagging secondary could
+    # report a committed version before it has that version's products, which would then
+    # never be replayed
+    from pymongo import ReadPreference
+
+    return collection.with_options(read_preference=ReadPreference.PRIMARY)
+
+
+def committed_catalog_version(meta_collection):
+    doc = _primary(meta_collection).find_one({"_id": "catalog"}, {"committed": 1})
+    return (doc or {}).get("committed", 0)
+
+
+# -- in-memory state ----------------------------------------------------------
+
+class _FacetIndex:
+    """
+    Posting lists and precomputed facet counts over a CatalogState's coded
+    columns. Availability is posted as a pseudo-column with codes 0 (in
+    stock) and 1 (out of stock).
+    """
+
+    def __init__(self, state):
+        flags = state.out_of_stock
+        # column -> code -> sorted array of rows
+        self.postings = {column: {} for column in CODED_COLUMNS + ("availability",)}
+        # (column, code, flag) -> Counter of (column, code) over those rows, plus ("availability", flag)
+        self.by_value = {}
+        # flag -> Counter of (column, code)
+        self.by_flag = {0: Counter(), 1: Counter()}
+        for row, flag in enumerate(flags):
+            self.postings["availability"].setdefault(flag, array("I")).append(row)
+        for column in CODED_COLUMNS:
+            codes = state.codes[column]
+            postings = self.postings[column]
+            for row, code in enumerate(codes):
+                postings.setdefault(code, array("I")).append(row)
+            for (flag, code), count in Counter(zip(flags, codes)).items():
+                self.by_flag[flag][(column, code)] = count
+                self.by_value.setdefault((column, code, flag), Counter())[("availability", flag)] = count
+            for other in CODED_COLUMNS:
+                for (code, flag, other_code), count in Counter(zip(codes, flags, state.codes[other])).items():
+                    self.by_value[(column, code, flag)][(other, other_code)] = count
+
+    def _count(self, features, flag, sign):
+        for column, code in features:
+            counts = self.by_value.setdefault((column, code, flag), Counter())
+            for other, other_code in features:
+                counts[(other, other_code)] += sign
+            counts[("availability", flag)] += sign
+            self.by_flag[flag][(column, code)] += sign
+
+    def update(self, row, old, new):
+        """
+        Move a row from its old (features, flag) to the new ones; `old` is
+        None for a new row.
+        """
+        features, flag = new
+        if old is None:
+            # Rows are only ever appended, so appending keeps the postings sorted
+            for column, code in features + [("availability", flag)]:
+                self.postings[column].setdefault(code, array("I")).append(row)
+        else:
+            old_features, old_flag = old
+            self._count(old_features, old_flag, -1)
+            for (column, old_code), (_, code) in zip(old_features + [("availability", old_flag)],
+                                                     features + [("availability", flag)]):
+                if old_code != code:
+                    self.postings[column][old_code].remove(row)
+                    bisect.insort(self.postings[column].setdefault(code, array("I")), row)
+        self._count(features, flag, 1)
+
+    def rows(self, features):
+        # Rows matching every (column, code), intersecting from the shortest posting list
+        postings = sorted((self.postings[column].get(code, ()) for column, code in features), key=len)
+        if not postings[0]:
+            return set()
+        return set(postings[0]).intersection(*postings[1:])
+
+
+class CatalogState:
+    def __init__(self, version=0):
+        self.version = version
+        self.ids = []
+        self.titles = []
+        self.codes = {column: array("I") for column in CODED_COLUMNS}
+        self.dictionaries = {column: [""] for column in CODED_COLUMNS}  # code 0 is "missing"
+        self.numbers = {column: array("f") for column in NUMERIC_COLUMNS}
+        self.out_of_stock = bytearray()
+        self._rows = {}
+        self._lookups = {column: {"": 0} for column in CODED_COLUMNS}
+        self._facet_index = None  # Built on first use, then maintained by add()
+        # Rows add() replaced in place, in order, for subscribers that index rows incrementally
+        self.replaced_rows = array("I")
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _code(self, column, value):
+        lookup = self._lookups[column]
+        code = lookup.get(value)
+        if code is None:
+            code = lookup[value] = len(self.dictionaries[column])
+            self.dictionaries[column].append(value)
+        return code
+
+    def add(self, product):
+        """
+        Insert or replace one product. Near-duplicate variants are skipped,
+        like search skips them; returns the row, or None for a variant.
+        """
+        if is_variant(product):
+            return None
+        values = {
+            "brand": product.get("brand") or "",
+            "category": product.get("category") or "",
+            "sub_category": product.get("sub_category") or "",
+            "color": _color(product),
+            "price": price_bucket(product.get("selling_price")) or "",
+        }
+        numbers = {
+            "selling_price": _number(product.get("selling_price")),
+            "actual_price": _number(product.get("actual_price")),
+            "discount": _number(product.get("discount")),
+            "rating": _number(product.get("average_rating")),
+        }
+        product_id = str(product["_id"])
+        with self._lock:
+            row = self._rows.get(product_id)
+            old = None if row is None or self._facet_index is None else self._features(row)
+            if row is None:
+                row = self._rows[product_id] = len(self.ids)
+                self.ids.append(product_id)
+                self.titles.append(product.get("title") or "")
+                for column in CODED_COLUMNS:
+                    self.codes[column].append(self._code(column, values[column]))
+                for column in NUMERIC_COLUMNS:
+                    self.numbers[column].append(numbers[column])
+                self.out_of_stock.append(1 if product.get("out_of_stock") else 0)
+            else:
+                self.replaced_rows.append(row)
+                self.titles[row] = product.get("title") or ""
+                for column in CODED_COLUMNS:
+                    self.codes[column][row] = self._code(column, values[column])
+                for column in NUMERIC_COLUMNS:
+                    self.numbers[column][row] = numbers[column]
+                self.out_of_stock[row] = 1 if product.get("out_of_stock") else 0
+            if self._facet_index is not None:
+                self._facet_index.update(row, old, self._features(row))
+            return row
+
+    def _features(self, row):
+        return [(column, self.codes[column][row]) for column in CODED_COLUMNS], self.out_of_stock[row]
+
+    # -- persistence -------------------------------------------------------
+
+    def save(self, path=CATALOG_SNAPSHOT_PATH):
+        with self._lock:
+            sections = [
+                ("ids", b"s", "\0".join(self.ids).encode("utf-8")),
+                ("titles", b"s", "\0".join(self.titles).encode("utf-8")),
+                ("out_of_stock", b"B", bytes(self.out_of_stock)),
+            ]
+            for column in CODED_COLUMNS:
+                sections.append((f"{column}.dict", b"s", "\0".join(self.dictionaries[column]).encode("utf-8")))
+                sections.append((f"{column}.codes", b"I", self.codes[column].tobytes()))
+            for column in NUMERIC_COLUMNS:
+                sections.append((column, b"f", self.numbers[column].tobytes()))
+            rows, version = len(self.ids), self.version
+
+        offset = HEADER.size + SECTION.size * len(sections)
+        table, payload = [], []
+        for name, typecode, data in sections:
+            table.append(SECTION.pack(name.encode("ascii"), typecode, offset, len(data)))
+            payload.append(data)
+            offset += len(data)
+        body = b"".join(payload)
+        header = HEADER.pack(MAGIC, FORMAT_VERSION, version, rows, len(sections), zlib.crc32(body))
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(header)
+            file.write(b"".join(table))
+            file.write(body)
+        os.replace(tmp_path, path)
+        return offset
+
+    @classmethod
+    def load(cls, path=CATALOG_SNAPSHOT_PATH):
+        """
+        Map a snapshot file and rebuild the state from it. Numeric columns
+        are copied straight out of the mapping; strings are decoded once.
+        """
+        with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            magic, format_version, version, rows, count, crc = HEADER.unpack_from(mapped, 0)
+            if magic != MAGIC or format_version != FORMAT_VERSION:
+                raise ValueError(f"{path} is not a version {FORMAT_VERSION} catalog snapshot")
+            body_start = HEADER.size + SECTION.size * count
+            view = memoryview(mapped)
+            try:
+                if zlib.crc32(view[body_start:]) != crc:
+                    raise ValueError(f"{path} is corrupt (checksum mismatch)")
+                sections = {}
+                for index in range(count):
+                    name, typecode, offset, length = SECTION.unpack_from(mapped, HEADER.size + SECTION.size * index)
+                    data = view[offset:offset + length]
+                    name = name.rstrip(b"\0").decode("ascii")
+                    if typecode == b"s":
+                        text = str(data, "utf-8")
+                        sections[name] = text.split("\0") if text else []
+                    elif typecode == b"B":
+                        sections[name] = bytearray(data)
+                    else:
+                        values = array(typecode.decode("ascii"))
+                        values.frombytes(data)
+                        sections[name] = values
+                    data.release()
+            finally:
+                view.release()
+
+        state = cls(version)
+        state.ids = sections["ids"][:rows] if rows else []
+        state.titles = sections["titles"][:rows] if rows else []
+        if len(state.titles) < rows:
+            state.titles += [""] * (rows - len(state.titles))
+        state.out_of_stock = sections["out_of_stock"]
+        for column in CODED_COLUMNS:
+            state.dictionaries[column] = sections[f"{column}.dict"] or [""]
+            state._lookups[column] = {value: code for code, value in enumerate(state.dictionaries[column])}
+            state.codes[column] = sections[f"{column}.codes"]
+        for column in NUMERIC_COLUMNS:
+            state.numbers[column] = sections[column]
+        state._rows = {product_id: row for row, product_id in enumerate(state.ids)}
+        return state
+
+    # -- catching up -------------------------------------------------------
+
+    @classmethod
+    def build(cls, collection, meta_collection):
+        """
+        Build the state from a full scan of the product collection.
+        """
+        # Read the committed version first; anything newer is replayed later
+        state = cls(committed_catalog_version(meta_collection))
+        for product in _primary(collection).find({}, STATE_PROJECTION):
+            state.add(product)
+        return state
+
+    def refresh(self, collection, meta_collection):
+        """
+        Replay products ingested after the state's version. Returns the
+        number of products applied.
+        """
+        committed = committed_catalog_version(meta_collection)
+        if committed <= self.version:
+            return 0
+        applied = 0
+        query = {"_catalog_version": {"$gt": self.version, "$lte": committed}}
+        for product in _primary(collection).find(query, STATE_PROJECTION):
+            self.add(product)
+            applied += 1
+        self.version = committed
+        SNAPSHOT_REPLAYED.inc(amount=applied)
+        SNAPSHOT_ROWS.set(len(self))
+        SNAPSHOT_VERSION.set(self.version)
+        return applied
+
+    @classmethod
+    def load_or_build(cls, collection, meta_collection, path=CATALOG_SNAPSHOT_PATH):
+        """
+        Load the snapshot if there is a usable one, otherwise scan Mongo,
+        then replay whatever was ingested since.
+        """
+        start = time.perf_counter()
+        try:
+            state = cls.load(path)
+            source = "snapshot"
+        except (OSError, ValueError, KeyError) as e:
+            if os.path.exists(path):
+                logger.error("Ignoring catalog snapshot %s: %s", path, e)
+            state = cls.build(collection, meta_collection)
+            source = "scan"
+        replayed = state.refresh(collection, meta_collection)
+        SNAPSHOT_ROWS.set(len(state))
+        SNAPSHOT_VERSION.set(state.version)
+        logger.info(
+            "Catalog state from %s: %d products at version %d (%d replayed) in %.2fs",
+            source, len(state), state.version, replayed, time.perf_counter() - start,
+        )
+        return state
+
+    # -- queries -----------------------------------------------------------
+
+    def facet_index(self):
+        with self._lock:
+            if self._facet_index is None:
+                self._facet_index = _FacetIndex(self)
+            return self._facet_index
+
+    def facet_counts(self, filters, in_stock=None):
+        """
+        Exact facet counts for products matching equality `filters` on the
+        coded columns, as a Counter of (facet, value).
+        """
+        with self._lock:
+            index = self.facet_index()
+            features = []
+            for column, value in filters.items():
+                code = self._lookups[column].get(value)
+                if code is None:
+                    return Counter()
+                features.append((column, code))
+            flags = (0, 1) if in_stock is None else (0 if in_stock else 1,)
+
+            coded = Counter()
+            if not features:
+                for flag in flags:
+                    coded.update(index.by_flag[flag])
+                    coded[("availability", flag)] += len(index.postings["availability"].get(flag, ()))
+            elif len(features) == 1:
+                column, code = features[0]
+                for flag in flags:
+                    coded.update(index.by_value.get((column, code, flag), {}))
+            else:
+                rows = index.rows(features)
+                column, code = min(features, key=lambda feature: len(index.postings[feature[0]].get(feature[1], ())))
+                if len(rows) == len(index.postings[column].get(code, ())):
+                    # Every row of the narrowest value matches the rest too (a sub_category within its category)
+                    for flag in flags:
+                        coded.update(index.by_value.get((column, code, flag), {}))
+                else:
+                    if in_stock is not None:
+                        rows = rows.intersection(index.postings["availability"].get(flags[0], ()))
+                    for column in CODED_COLUMNS:
+                        for code, count in Counter(map(self.codes[column].__getitem__, rows)).items():
+                            coded[(column, code)] = count
+                    for flag, count in Counter(map(self.out_of_stock.__getitem__, rows)).items():
+                        coded[("availability", flag)] = count
+
+            counts = Counter()
+            for (column, code), count in coded.items():
+                if count <= 0:
+                    continue
+                if column == "availability":
+                    counts[(column, "out_of_stock" if code else "in_stock")] += count
+                elif code:
+                    counts[(column, self.dictionaries[column][code])] += count
+            return counts
+
+
+class LiveCatalog:
+    """
+    Catalog state for a search process: loaded in the background at
+    startup and kept current by replaying new versions every `refresh_s`.
+    `state` is None until the first load finishes. Subscribers are called
+    with the state after the load and after every refresh that applied
+    products.
+    """
+
+    def __init__(self, collection, meta_collection, path=CATALOG_SNAPSHOT_PATH, refresh_s=CATALOG_REFRESH_S):
+        self.collection = collection
+        self.meta_collection = meta_collection
+        self.path = path
+        self.refresh_s = refresh_s
+        self.state = None
+        self._thread = None
+        self._subscribers = []
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    def _notify(self):
+        for callback in self._subscribers:
+            try:
+                callback(self.state)
+            except Exception as e:
+                logger.error("Catalog state subscriber failed: %s", e)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="catalog-state", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while self.state is None:
+            try:
+                self.state = CatalogState.load_or_build(self.collection, self.meta_collection, self.path)
+            except Exception as e:
+                logger.error("Loading catalog state failed: %s", e)
+                time.sleep(self.refresh_s)
+        self.state.facet_index()  # Build the facet index before the first request needs it
+        self._notify()
+        while True:
+            time.sleep(self.refresh_s)
+            try:
+                if self.state.refresh(self.collection, self.meta_collection):
+                    self._notify()
+            except Exception as e:
+                logger.error("Catalog state refresh failed: %s", e)
+
+
+def update_snapshot(collection, meta_collection, path=CATALOG_SNAPSHOT_PATH):
+    """
+    Bring the snapshot file up to the committed catalog version. Called by
+    ingest after each load.
+    """
+    state = CatalogState.load_or_build(collection, meta_collection, path)
+    size = state.save(path)
+    logger.info("Wrote catalog snapshot %s: %d products, version %d, %d bytes", path, len(state), state.version, size)
+    return state
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the binary catalog snapshot.")
+    parser.add_argument("--update", action="store_true", help="Write the snapshot, replaying new versions")
+    parser.add_argument("--collection", default="flipKart_products", help="Product collection")
+    parser.add_argument("--path", default=CATALOG_SNAPSHOT_PATH, help="Snapshot file")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from mongo_store import write_collection
+
+    load_dotenv()
+    if args.update:
+        state = update_snapshot(write_collection(args.collection), write_collection(CATALOG_META_COLLECTION), args.path)
+        print(f"Snapshot {args.path}: {len(state)} products at catalog version {state.version}")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,83 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
+from typing import Optional
 import re
-import json
+import copy
+import sys
+import time
 from dotenv import load_dotenv
 import os
-from langchain.prompts import PromptTemplate
-from langchain.schema.runnable import RunnablePassthrough
-from pymongo import MongoClient
-from langchain_groq import ChatGroq
+from pymongo.errors import ExecutionTimeout
+
+# Shared modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from admission import ADMISSION_SEARCH_IN_FLIGHT, AdmissionController, Overloaded, backend_controller
+from autocomplete import AutocompleteIndex
+from extractors import create_extractor, is_fallback
+import llm_router  # Registers the "routed" backend
+from catalog_snapshot import CATALOG_META_COLLECTION, LiveCatalog
+from dedup import collapse_groups, group_projection
+from facets import FACET_COLLECTION, FacetSummary
+from filter_prompt import filter_prompt
+from filter_guard import FIND_MAX_TIME_MS, FilterRejected, guard_filter
+from instrumentation import get_logger, instrument, stage
+from mongo_store import search_collection
+from sessions import REFINE_PROJECTION, SESSION_SEARCHES, SessionStore, parse_refinement, replace_color
+from template_cache import QueryTemplateCache
+from top_views import TOPN_COLLECTION, TopNViews, parse_top_n
+from traffic_capture import TrafficRecorder  # Also registers the "replay" backend
 
 load_dotenv()
 app = FastAPI()
-MONGO_URI = os.getenv("MONGO_URI")
-DATABASE_NAME = os.getenv("DATABASE_NAME")
-COLLECTION_NAME = os.getenv("COLLECTION_NAME")
+instrument(app, "complex-groq-app")
+logger = get_logger("complex-groq-app")
+# MongoDB collection from the shared data-access layer (connects on first query)
+collection = search_collection()
+
+# Facet counts, served from the summary collection dataInsertion.py maintains
+facet_summary = FacetSummary(search_collection(FACET_COLLECTION))
+
+# Columnar catalog state, mmap-loaded from the ingest snapshot in the background at startup;
+# its version and replay reads go to the primary whatever these handles' read preference
+live_catalog = LiveCatalog(collection, search_collection(CATALOG_META_COLLECTION))
+
+# Typeahead suggestions, indexed from the catalog state as it loads and refreshes
+autocomplete_index = AutocompleteIndex()
+live_catalog.subscribe(autocomplete_index.sync)
+
+@app.on_event("startup")
+def load_catalog_state():
+    live_catalog.start()
+
+# Materialized top-N lists, kept up to date by dataInsertion.py
+top_views = TopNViews(search_collection(TOPN_COLLECTION))
+
+# Filter-generating backend (Groq unless EXTRACTOR_BACKEND says otherwise), imported on first use
+extractor = create_extractor(os.getenv("EXTRACTOR_BACKEND", "groq"), "complex-groq-app")
 
-# MongoDB client
-client = MongoClient(MONGO_URI)
-db = client[DATABASE_NAME]
-collection = db[COLLECTION_NAME]
+# Filter templates learned from previous LLM generations, pre-warmed from disk
+template_cache = QueryTemplateCache.load()
 
+@app.on_event("shutdown")
+def save_template_cache():
+    # Templates learned from rule-based, stub or replayed extractions stay out of the saved cache
+    if extractor.model_backed:
+        template_cache.save()
 
-groq_chat = ChatGroq(temperature=0.5, model_name="mixtral-8x7b-32768")
+# In-flight budget for /search; LLM calls also take a slot of their backend's controller
+search_admission = AdmissionController("search", ADMISSION_SEARCH_IN_FLIGHT)
+
+# Last filter and candidate ids per chat session, for follow-up refinements
+sessions = SessionStore()
+
+# Sampled /search requests, written to a JSONL file for traffic_replay.py (off unless TRAFFIC_CAPTURE_RATE is set)
+traffic_recorder = TrafficRecorder()
 
 # Define the request model
 class SearchRequest(BaseModel):
     query: str
+    session_id: Optional[str] = None
 
 # Define the product model
 class Product(BaseModel):
@@ -71,37 +123,53 @@ def format_price_in_filter(filter_query):
 
 
 
-
-@app.post("/search")
-async def search_product(search_request: SearchRequest):
-    query = search_request.query  # Extract the query from the request body
-
-    # Extract the MongoDB query from the user query using Groq
+# Facet counts for the whole catalog, or for the products matching the given filters
+@app.get("/facets")
+async def get_facets(brand: Optional[str] = None, category: Optional[str] = None,
+                     sub_category: Optional[str] = None, color: Optional[str] = None,
+                     in_stock: Optional[bool] = None, size: int = Query(20, ge=1, le=100)):
+    filter_query = {}
+    if brand:
+        filter_query["brand"] = brand
+    if category:
+        filter_query["category"] = category
+    if sub_category:
+        filter_query["sub_category"] = sub_category
+    if color:
+        filter_query["product_details.Color"] = color
+    if in_stock is not None:
+        filter_query["out_of_stock"] = not in_stock
     try:
-        filter_query, projection = query_groq(query)
-        filter_query = format_price_in_filter(filter_query)  # Format the filter_query
-        print("Generated MongoDB filter:", filter_query)  # Log the generated filter
-        print("Generated MongoDB projection:", projection)  # Log the generated projection
+        with stage("complex-groq-app", "facets"):
+            return facet_summary.facets(collection, filter_query, size, live_catalog.state)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing query with Groq: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error computing facets: {str(e)}")
 
-    # Query the database using the generated filter and projection
-    try:
-        # Apply filter and projection
-        products = collection.find(filter_query, projection)
 
-        # Apply sorting (if specified in the query)
-        if "sort" in query.lower():
-            products = products.sort("average_rating", -1)  # Sort by average_rating in descending order
+# Typeahead suggestions over titles, brands, categories and sub-categories
+@app.get("/autocomplete")
+async def autocomplete_suggestions(q: str = Query(..., min_length=1, max_length=100), size: int = Query(8, ge=1, le=20)):
+    if not autocomplete_index.ready:
+        raise HTTPException(status_code=503, detail="Autocomplete index is still loading", headers={"Retry-After": "5"})
+    with stage("complex-groq-app", "autocomplete"):
+        return {"query": q, "suggestions": autocomplete_index.suggest(q, size)}
+
 
-        # Apply limit (if specified in the query)
-        if "top" in query.lower() or "limit" in query.lower():
-            limit_match = re.search(r"top\s+(\d+)", query, re.IGNORECASE)
-            if limit_match:
-                limit = int(limit_match.group(1))
-                products = products.limit(limit)
+def response_projection(projection):
+    # Sessions remember results by _id, and an inclusion projection still needs the fields the response and refinements read
+    projection = {field: value for field, value in projection.items() if field != "_id"}
+    if any(projection.values()):
+        projection = {**projection, "color": 1, **REFINE_PROJECTION}
+    # Plus what collapsing near-duplicates reads, without the grouping internals
+    return group_projection(projection)
 
-        # Convert the cursor to a list of products
+
+def search_response(products):
+    """
+    Build the chat response for the products a search found.
+    """
+    with stage("complex-groq-app", "serialization"):
+        # Convert the documents to a list of products
         product_list = [
             Product(
                 id=str(product.get("_id", "")),
@@ -110,7 +178,7 @@ async def search_product(search_request: SearchRequest):
                 category=product.get("category", "N/A"),
                 sub_category=product.get("sub_category", "N/A"),
                 description=product.get("description", "N/A"),
-                color=next((detail.get("Color", "N/A") for detail in product.get("product_details", []) if "Color" in detail), "N/A"),
+                color=product.get("color") or "N/A",
                 selling_price=product.get("selling_price", "N/A"),
                 actual_price=product.get("actual_price", "N/A"),
                 discount=product.get("discount", "N/A"),
@@ -124,7 +192,7 @@ async def search_product(search_request: SearchRequest):
 
         if not product_list:
             raise HTTPException(status_code=404, detail="No products found")
-        
+
         top_products = product_list[:5]
 
         # Format the response in a human-like way
@@ -137,97 +205,198 @@ async def search_product(search_request: SearchRequest):
                 f"Availability: {'Available' if not product.out_of_stock else 'Out of stock'})\n"
             )
 
-        return {"message": response_message, "products": top_products}
+    return {"message": response_message, "products": top_products}
+
+
+def refine_search(session_id, session, refinement, trace=None):
+    """
+    Answer a follow-up from the session's previous search: narrow the cached
+    candidates in memory, or re-run the stored filter with a new colour.
+    Neither calls the LLM. Returns None when the colour cannot be swapped,
+    for the caller to search afresh.
+    """
+    filter_query = session.filter
+    try:
+        with stage("complex-groq-app", "session_refinement"):
+            if refinement.color:
+                filter_query = replace_color(session.filter, refinement.color)
+                if filter_query is None:
+                    return None
+                guarded, projection, _, hard_limit = guard_filter(copy.deepcopy(filter_query), session.projection)
+                products = collapse_groups(collection.find(
+                    guarded, response_projection(projection), limit=hard_limit, max_time_ms=FIND_MAX_TIME_MS
+                ))
+            else:
+                # Re-read the previous results by _id, keeping their order
+                order = {product_id: index for index, product_id in enumerate(session.candidate_ids)}
+                products = list(collection.find(
+                    session.candidate_filter(), response_projection(session.projection), max_time_ms=FIND_MAX_TIME_MS
+                ))
+                products.sort(key=lambda product: order.get(str(product["_id"]), len(order)))
+            products = refinement.apply(products)
+        SESSION_SEARCHES.inc(refinement.kind)
+        if trace is not None:
+            trace["source"] = "refinement"
+            trace["extraction"] = {"filter": copy.deepcopy(filter_query), "projection": session.projection}
+    except FilterRejected as e:
+        raise HTTPException(status_code=422, detail=f"Refined filter rejected: {str(e)}")
+    except ExecutionTimeout:
+        raise HTTPException(status_code=504, detail="The database query exceeded its time limit")
+
+    response = search_response(products)
+    sessions.put(session_id, filter_query, session.projection, [p["_id"] for p in products])
+    return response
+
+
+@app.post("/search")
+async def search_product(search_request: SearchRequest, request: Request):
+    if not traffic_recorder.sample(search_request.session_id):
+        return await admitted_search(search_request, request)
+
+    # Record arrival, extraction, outcome and results for replay (see traffic_capture.py)
+    trace = {"ts": time.time(), "query": search_request.query, "session_id": search_request.session_id}
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await admitted_search(search_request, request, trace)
+        status = 200
+        trace["result_ids"] = [product.id for product in response["products"]]
+        return response
+    except HTTPException as e:
+        status = e.status_code
+        raise
+    finally:
+        trace["status"] = status
+        trace["latency_ms"] = round((time.perf_counter() - started) * 1000.0, 3)
+        traffic_recorder.record(trace)
+
+
+async def admitted_search(search_request, request, trace=None):
+    query = search_request.query  # Extract the query from the request body
+    # Fair queueing is per chat session, or per address for clients without one
+    client = search_request.session_id or (request.client.host if request.client else "unknown")
+
+    # Follow-ups ("only the cheaper ones", "in blue instead") refine the session's previous results
+    session = sessions.get(search_request.session_id) if search_request.session_id else None
+    refinement = parse_refinement(query) if session else None
+    # Learned templates answer without the LLM
+    cached = None if refinement else template_cache.lookup(query)
+
+    try:
+        # Requests that skip the LLM are admitted ahead of those that need it
+        async with search_admission.admit(client, priority=refinement is not None or cached is not None):
+            if refinement is not None:
+                response = refine_search(search_request.session_id, session, refinement, trace)
+                if response is not None:
+                    return response
+                cached = template_cache.lookup(query)
+            SESSION_SEARCHES.inc("new")
+            return await run_search(query, cached, search_request.session_id, client, trace)
+    except Overloaded as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+async def run_search(query, cached, session_id, client, trace=None):
+    """
+    Generate (or reuse) the filter for a query, run it and build the response.
+    """
+    # Extract the MongoDB query from the user query, reusing a learned template when one matches
+    generated = None
+    try:
+        if cached:
+            filter_query, projection = cached
+        else:
+            # Bounded in-flight LLM calls per backend, run off the event loop
+            async with backend_controller(extractor.name).admit(client):
+                llm_started = time.perf_counter()
+                extraction = await run_in_threadpool(query_llm, query)
+                llm_ms = (time.perf_counter() - llm_started) * 1000.0
+            filter_query, projection = extraction
+            # Rule-based answers given in place of the model are not worth learning
+            if not is_fallback(extraction):
+                generated = copy.deepcopy((filter_query, projection))
+        if trace is not None:
+            # The extraction as the model (or template) returned it, before price formatting and guarding
+            trace["source"] = "template" if cached else "llm"
+            trace["extraction"] = {"filter": copy.deepcopy(filter_query), "projection": copy.deepcopy(projection)}
+            trace["llm_ms"] = None if cached else round(llm_ms, 3)
+        with stage("complex-groq-app", "filter_rewriting"):
+            filter_query = format_price_in_filter(filter_query)  # Format the filter_query
+            session_filter = copy.deepcopy(filter_query)
+            # Whitelist fields/operators and cap the cost of the generated query
+            filter_query, projection, plan, hard_limit = guard_filter(filter_query, projection)
+        logger.debug("Generated MongoDB filter: %s (plan: %s)", filter_query, plan)  # Log the generated filter
+        logger.debug("Generated MongoDB projection: %s", projection)  # Log the generated projection
+    except (Overloaded, HTTPException):
+        # Already carries its status (query_llm wraps extractor failures itself)
+        raise
+    except FilterRejected as e:
+        raise HTTPException(status_code=422, detail=f"Generated filter rejected: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing query with {extractor.name}: {str(e)}")
+
+    # Query the database using the generated filter and projection
+    try:
+        # "Top N by rating/discount/price" within a category is a point read of a materialized view
+        products = None
+        top_n = parse_top_n(query)
+        if top_n:
+            with stage("complex-groq-app", "topn_view"):
+                products = top_views.lookup(filter_query, *top_n)
+
+        if products is None:
+            # Result colour is a flattened field written at ingest (see attributes.py)
+            projection = response_projection(projection)
+            with stage("complex-groq-app", "mongo_query"):
+                # Apply filter and projection, bounded in both time and result count
+                products = collection.find(filter_query, projection, limit=hard_limit, max_time_ms=FIND_MAX_TIME_MS)
+
+                # Apply sorting (if specified in the query)
+                if "sort" in query.lower():
+                    products = products.sort("average_rating", -1)  # Sort by average_rating in descending order
+
+                # Apply limit (if specified in the query)
+                if "top" in query.lower() or "limit" in query.lower():
+                    limit_match = re.search(r"top\s+(\d+)", query, re.IGNORECASE)
+                    if limit_match:
+                        limit = int(limit_match.group(1))
+                        products = products.limit(min(limit, hard_limit))
+
+                # One product per near-duplicate group among the matches
+                products = collapse_groups(products)
+
+        response = search_response(products)
+        if session_id:
+            sessions.put(session_id, session_filter, projection, [p["_id"] for p in products])
+
+        # Only filters that found products are worth reusing
+        if generated:
+            template_cache.learn(query, *generated)
+
+        return response
+    except HTTPException:
+        # "No products found" stays a 404
+        raise
+    except ExecutionTimeout:
+        raise HTTPException(status_code=504, detail="The database query exceeded its time limit")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error querying the database: {str(e)}")
  
-def query_groq(user_query: str):
+def query_llm(user_query: str):
     """
-    Use ChatGroq to interpret the user query and generate a MongoDB query.
+    Use the configured extractor backend to interpret the user query and
+    generate a MongoDB query.
     """
     try:
-        # Prepare the prompt for the Groq model
-        prompt = PromptTemplate(
-            input_variables=["user_query"],
-            template=(
-                "You are tasked with generating a MongoDB query based on a user query.\n"
-                "The query should be based on a product schema with the following fields:\n"
-                "  - _id (UUID)\n"
-                "  - actual_price (String, formatted with commas, e.g., '2,999')\n"
-                "  - average_rating (String)\n"
-                "  - brand (String)\n"
-                "  - category (String)\n"
-                "  - crawled_at (String)\n"
-                "  - description (String)\n"
-                "  - discount (String)\n"
-                "  - images (Array of Strings, optional)\n"
-                "  - out_of_stock (Boolean, optional)\n"
-                "  - pid (String)\n"
-                "  - product_details (Array of objects with specific keys, optional)\n"
-                "  - seller (String)\n"
-                "  - selling_price (String)\n"
-                "  - sub_category (String)\n"
-                "  - title (String)\n"
-                "  - url (String)\n"
-                "  - out_of_stock (boolean)\n"
-                
-                "Generate a MongoDB query that:\n"
-                "- Applies filters on the fields based on the user query.\n"
-                "- Specifies the fields to return in the result (projection).\n"
-                "- The projection must only include field inclusion/exclusion (e.g., 1 or 0).\n"
-                "- Do not include aggregation expressions (e.g., $substr, $cond) in the projection.\n"
-                "- Sorts the results if specified by the user.\n"
-                "- Limits the number of results if specified by the user.\n"
-                "- The `actual_price` field must be treated as a string in both the filter and projection.\n"
-                "- The `out_of_stock` field must be a boolean (true or false).\n"
-                "Format the response as a valid JSON object with two keys: 'filter' and 'projection'.\n"
-                "Do not include explanations or additional text.\n"
-                "Here is the user query: {user_query}"
-            )
-        )
-
-        # Create a RunnableSequence with the prompt and LLM
-        chain = (
-            {"user_query": RunnablePassthrough()}  # Pass the user query directly
-            | prompt  # Apply the prompt template
-            | groq_chat  # Use the LLM to generate the response
-        )
-
-        # Run the chain with the user query
-        response = chain.invoke(user_query)
-        print(f"Groq Response: {response}")  # Log the response
-
-        # Extract the content from the AIMessage object
-        response_text = response.content
-
-        # Replace escaped underscores with regular underscores
-        response_text = response_text.replace("\\_", "_")
-
-        # Use regex to extract the JSON object from the response
-        json_match = re.search(r"\{.*\}", response_text, re.DOTALL)
-        if not json_match:
-            raise ValueError("No JSON object found in the response.")
-
-        json_str = json_match.group(0)
-
-        # Parse the MongoDB query from the response
-        try:
-            query_dict = json.loads(json_str)
-            filter_query = query_dict.get("filter", {})
-            projection = query_dict.get("projection", {})
-
-            # Remove invalid keys like $limit and $sort from the filter
-            if "$limit" in filter_query:
-                del filter_query["$limit"]
-            if "$sort" in filter_query:
-                del filter_query["$sort"]
-
-            return filter_query, projection
-        except json.JSONDecodeError as e:
-            raise ValueError(f"Failed to parse MongoDB query from response: {json_str}")
+        # Compact prompt with only the fields the query's intents need
+        prompt, intents = filter_prompt(user_query)
+        logger.debug("Filter prompt intents: %s", intents)
+        return extractor.generate_filter(user_query, prompt)
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Groq Error: {e}")
-        raise HTTPException(status_code=500, detail=f"Error processing query with Groq: {str(e)}")
+        logger.error("%s Error: %s", extractor.name, e)
+        raise HTTPException(status_code=500, detail=f"Error processing query with {extractor.name}: {str(e)}")
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,9 +1,14 @@
 from fastapi import FastAPI, HTTPException
-from pymongo import MongoClient
-from pydantic import BaseModel
-from typing import List
-import json
-import os
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field, field_validator
+from typing import List, Optional
+
+from bulk_ingest import ensure_indexes, expand_sources
+from catalog_snapshot import CATALOG_META_COLLECTION, update_snapshot
+from facets import FACET_COLLECTION
+from ingest_jobs import INGEST_JOB_MAX_PROCESSES, INGEST_JOB_MAX_WRITERS, IngestJobQueue, QueueFull
+from mongo_store import write_collection
+from top_views import TOPN_COLLECTION
 
 # Initialize FastAPI app
 app = FastAPI()
@@ -12,14 +17,22 @@ app = FastAPI()
 from dotenv import load_dotenv
 load_dotenv()
 
-# Get MongoDB connection URI and database name from environment variables
-MONGO_URI = os.getenv("MONGO_URI")
-DATABASE_NAME = os.getenv("DATABASE_NAME")
+# MongoDB collection for ingest writes (always on the primary, connects on first use)
+collection = write_collection("flipKart_products")
+# Facet summary kept in step with every insert
+facet_collection = write_collection(FACET_COLLECTION)
+# Materialized top-N lists per category / sub_category
+view_collection = write_collection(TOPN_COLLECTION)
+# Catalog version counter for snapshot replay
+meta_collection = write_collection(CATALOG_META_COLLECTION)
+
+# After every completed load: (re)check indexes and bring the catalog snapshot up to date
+def after_ingest(job):
+    ensure_indexes(collection)
+    update_snapshot(collection, meta_collection)
 
-# Initialize MongoDB client and collection
-client = MongoClient(MONGO_URI)
-db = client[DATABASE_NAME]
-collection = db["flipKart_products"]
+# Background ingest jobs
+jobs = IngestJobQueue(collection, facet_collection, view_collection, meta_collection, on_complete=after_ingest)
 
 # Pydantic model for the ProductDetails
 class ProductDetail(BaseModel):
@@ -54,37 +67,61 @@ class Product(BaseModel):
 class FilePathRequest(BaseModel):
     file_path: str
 
-# Function to load data from JSON file
-def load_data_from_json(file_path: str):
-    if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="File not found")
-    
-    with open(file_path, 'r') as file:
-        try:
-            data = json.load(file)
-            if not isinstance(data, list):
-                raise HTTPException(status_code=400, detail="JSON data should be a list of products")
-            return data
-        except json.JSONDecodeError as e:
-            raise HTTPException(status_code=400, detail="Invalid JSON format")
-
-# FastAPI Endpoint to insert data from JSON file into MongoDB
-@app.post("/insert_products/")
-async def insert_products(request: FilePathRequest):
+# Pydantic model for a multi-file ingest: files, directories or glob patterns
+class IngestRequest(BaseModel):
+    paths: List[str]
+    processes: Optional[int] = Field(None, ge=1)
+    writers: Optional[int] = Field(None, ge=1)
+
+    # Requests may lower the parallelism, but not raise it past the server's limits
+    @field_validator("processes")
+    @classmethod
+    def _clamp_processes(cls, value):
+        return None if value is None else min(value, INGEST_JOB_MAX_PROCESSES)
+
+    @field_validator("writers")
+    @classmethod
+    def _clamp_writers(cls, value):
+        return None if value is None else min(value, INGEST_JOB_MAX_WRITERS)
+
+# Submit a background ingest job, refusing it with 429 when the job queue is full
+def submit_job(paths, processes=None, writers=None):
     try:
-        # Load the JSON data from the provided file path
-        data = load_data_from_json(request.file_path)
-        
-        if not data:
-            raise HTTPException(status_code=400, detail="No data found in the JSON file")
-        
-        # Insert the data into MongoDB
-        result = collection.insert_many(data)
-        
-        return {"message": "Data inserted successfully", "count": len(result.inserted_ids)}
-    
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        expand_sources(paths)  # Fail fast on missing files
+        job = jobs.submit(paths, processes=processes, writers=writers)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(jobs.retry_after())})
+    return JSONResponse(
+        status_code=202,
+        content={"message": "Ingest job queued", "job_id": job.id, "status_url": f"/jobs/{job.id}"},
+    )
+
+# FastAPI Endpoint to insert data from a JSON or JSONL file into MongoDB (runs as a background job)
+# The submit handlers are plain functions: FastAPI runs them on its threadpool, so resolving
+# globs and walking directories does not block the event loop
+@app.post("/insert_products/", status_code=202)
+def insert_products(request: FilePathRequest):
+    return submit_job([request.file_path], processes=1)
+
+# FastAPI Endpoint to load many (optionally gzip-compressed) JSON / JSONL files in parallel (background job)
+@app.post("/insert_files/", status_code=202)
+def insert_files(request: IngestRequest):
+    return submit_job(request.paths, processes=request.processes, writers=request.writers)
+
+# FastAPI Endpoint to poll an ingest job's status, progress, rate and errors
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+# FastAPI Endpoint to list recent ingest jobs
+@app.get("/jobs")
+async def list_jobs():
+    return {"jobs": [job.to_dict() for job in jobs.jobs()]}
 
 # Run the server with the command:
 # uvicorn filename:app --reload
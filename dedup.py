@@ -0,0 +1,251 @@
+import os
+import re
+import zlib
+from array import array
+from collections import defaultdict
+
+from instrumentation import counter, get_logger
+
+# Near-duplicate product grouping at ingest (MinHash + LSH).
+#
+# Crawls list the same product under several pids and sellers with almost
+# the same title and description. Each product gets a MinHash signature
+# over word shingles of its title and description, computed on the parser
+# processes, plus LSH band keys. Ingest looks up canonical products that
+# share a band key, earlier in the same load or already in the collection,
+# and joins the first one whose estimated Jaccard similarity reaches
+# DEDUP_THRESHOLD; otherwise the product becomes the canonical of a new
+# group. Products carry:
+#
+#   _group      _id of the group's canonical product
+#   _canonical  True for the canonical, False for variants
+#   _variants   on canonicals, _ids of the variants
+#   _minhash    packed signature, _lsh  band keys (multikey indexed)
+#
+# Search applies the user's filter first and then keeps one product per
+# group (`collapse_groups`), so a variant that alone matches still answers
+# for its group; each group fills one result slot. Whole-catalog views (the
+# top-N views, facet summary, catalog state and autocomplete) skip variants
+# and count each group once through its canonical. Each file costs one
+# indexed candidate query plus a few signature comparisons per product, so
+# the work grows linearly with the catalog as long as LSH buckets stay small.
+#
+# Environment variables:
+#   DEDUP_ENABLED        group near-duplicates at ingest (default 1)
+#   DEDUP_THRESHOLD      estimated Jaccard similarity for a match (default 0.8)
+#   DEDUP_NUM_PERM       MinHash signature length (default 64)
+#   DEDUP_BANDS          LSH bands, must divide DEDUP_NUM_PERM (default 16)
+#   DEDUP_MAX_CANDIDATES canonicals read per batch lookup (default 5000)
+#   DEDUP_SEARCH_CANONICAL  one search result per group (default 1)
+
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "1") == "1"
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.8"))
+DEDUP_NUM_PERM = int(os.getenv("DEDUP_NUM_PERM", "64"))
+DEDUP_BANDS = int(os.getenv("DEDUP_BANDS", "16"))
+DEDUP_MAX_CANDIDATES = int(os.getenv("DEDUP_MAX_CANDIDATES", "5000"))
+DEDUP_SEARCH_CANONICAL = os.getenv("DEDUP_SEARCH_CANONICAL", "1") == "1"
+
+SHINGLE_SIZE = 3
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+_EMPTY = 0xFFFFFFFF
+
+DEDUP_PRODUCTS = counter("dedup_products_total", "Ingested products by near-duplicate grouping result", ("result",))
+
+logger = get_logger("dedup")
+
+
+def shingles(product):
+    tokens = TOKEN_PATTERN.findall(f"{product.get('title') or ''} {product.get('description') or ''}".lower())
+    if len(tokens) < SHINGLE_SIZE:
+        return {" ".join(tokens)} if tokens else set()
+    return {" ".join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)}
+
+
+def signature(product):
+    """
+    MinHash signature of a product's title and description shingles, or
+    None when it has no text.
+    """
+    # One-permutation MinHash: each shingle is hashed once, the low bits pick
+    # a slot and the slot keeps the smallest remaining bits
+    slots = DEDUP_NUM_PERM
+    sig = array("I", [_EMPTY]) * slots
+    for shingle in shingles(product):
+        h = zlib.crc32(shingle.encode("utf-8"))
+        slot, value = h % slots, h // slots
+        if value < sig[slot]:
+            sig[slot] = value
+    filled = [slot for slot in range(slots) if sig[slot] != _EMPTY]
+    if not filled:
+        return None
+    # Empty slots borrow the next filled slot to the right (rotation densification)
+    nearest = filled[0] + slots
+    for slot in range(slots - 1, -1, -1):
+        if sig[slot] != _EMPTY:
+            nearest = slot
+        else:
+            sig[slot] = sig[nearest % slots]
+    return sig
+
+
+def band_keys(sig):
+    rows = len(sig) // DEDUP_BANDS
+    return [(band << 32) | zlib.crc32(sig[band * rows:(band + 1) * rows].tobytes()) for band in range(DEDUP_BANDS)]
+
+
+def similarity(left, right):
+    # Estimated Jaccard similarity: share of matching signature slots
+    return sum(1 for a, b in zip(left, right) if a == b) / len(left)
+
+
+def annotate(product):
+    """
+    Attach the signature and band keys to a parsed product. Runs on the
+    parser processes.
+    """
+    sig = signature(product)
+    if sig is not None:
+        product["_minhash"] = sig.tobytes()
+        product["_lsh"] = band_keys(sig)
+    return product
+
+
+def _unpack(data):
+    sig = array("I")
+    sig.frombytes(bytes(data))
+    return sig
+
+
+class DuplicateIndex:
+    """
+    LSH buckets of the canonical products seen during one load, backed by
+    the canonicals already in the collection. Variant references are
+    collected and written by link_variants() once the load's inserts are
+    done, so no document is changed after it was handed to a writer.
+    """
+
+    def __init__(self, collection, threshold=DEDUP_THRESHOLD):
+        self.collection = collection
+        self.threshold = threshold
+        self._buckets = defaultdict(list)  # band key -> [(canonical _id, signature)]
+        self._variants = defaultdict(list)  # canonical _id -> variant _ids
+        self._looked_up = set()
+
+    def _load_existing(self, keys):
+        # Canonicals from earlier loads that share a band key with this batch
+        keys = [key for key in keys if key not in self._looked_up]
+        if not keys:
+            return
+        self._looked_up.update(keys)
+        wanted = set(keys)
+        existing = self.collection.find(
+            {"_lsh": {"$in": keys}, "_canonical": True},
+            {"_lsh": 1, "_minhash": 1},
+            limit=DEDUP_MAX_CANDIDATES,
+        )
+        for doc in existing:
+            entry = (doc["_id"], _unpack(doc["_minhash"]))
+            for key in doc["_lsh"]:
+                if key in wanted:
+                    self._buckets[key].append(entry)
+
+    def _match(self, sig, keys):
+        for key in keys:
+            for canonical_id, candidate in self._buckets.get(key, ()):
+                if similarity(sig, candidate) >= self.threshold:
+                    return canonical_id
+        return None
+
+    def assign(self, products):
+        """
+        Set _group / _canonical on annotated products before they are
+        inserted.
+        """
+        self._load_existing({key for product in products for key in product.get("_lsh", ())})
+        for product in products:
+            product_id = product["_id"]
+            match = sig = None
+            if "_lsh" in product:
+                sig = _unpack(product["_minhash"])
+                match = self._match(sig, product["_lsh"])
+            if match is None:
+                product["_group"], product["_canonical"] = product_id, True
+                product.setdefault("_variants", [])
+                for key in product.get("_lsh", ()):
+                    self._buckets[key].append((product_id, sig))
+                DEDUP_PRODUCTS.inc("canonical")
+            else:
+                product["_group"], product["_canonical"] = match, False
+                self._variants[match].append(product_id)
+                DEDUP_PRODUCTS.inc("variant")
+
+    def link_variants(self):
+        """
+        Add the variant references gathered so far to their canonicals.
+        Returns the number of variants linked.
+        """
+        from pymongo import UpdateOne
+        from mongo_store import bulk_write_batched
+
+        variants, self._variants = self._variants, defaultdict(list)
+        if variants:
+            bulk_write_batched(self.collection, (
+                UpdateOne({"_id": canonical_id}, {"$addToSet": {"_variants": {"$each": variant_ids}}})
+                for canonical_id, variant_ids in variants.items()
+            ))
+        return sum(len(variant_ids) for variant_ids in variants.values())
+
+
+# Grouping bookkeeping that search responses never show
+INTERNAL_FIELDS = ("_minhash", "_lsh", "_variants")
+
+
+def canonical_filter(filter_query):
+    """
+    Restrict a filter to canonical products, for scans that cover the whole
+    catalog. Products loaded before grouping existed have no _canonical
+    field and still match. Filtered searches use collapse_groups instead.
+    """
+    if not DEDUP_SEARCH_CANONICAL:
+        return filter_query
+    return {**filter_query, "_canonical": {"$ne": False}}
+
+
+def group_projection(projection):
+    """
+    Adjust a search projection for collapse_groups: inclusion projections
+    also read the grouping fields, all others leave out the signatures and
+    variant lists.
+    """
+    if any(value for field, value in projection.items() if field != "_id"):
+        return {**projection, "_group": 1, "_canonical": 1}
+    return {**projection, **{field: 0 for field in INTERNAL_FIELDS}}
+
+
+def collapse_groups(products):
+    """
+    Keep one product per near-duplicate group from filtered search results,
+    in result order: the canonical when it matched, else the first matching
+    variant.
+    """
+    if not DEDUP_SEARCH_CANONICAL:
+        return list(products)
+    kept, positions = [], {}
+    for product in products:
+        group = product.get("_group", product.get("_id"))
+        position = positions.get(group)
+        if position is None:
+            positions[group] = len(kept)
+            kept.append(product)
+        elif product.get("_canonical") is True and kept[position].get("_canonical") is not True:
+            kept[position] = product
+    return kept
+
+
+def is_variant(product):
+    """
+    Whether a product is hidden behind its group's canonical, the in-memory
+    counterpart of canonical_filter.
+    """
+    return DEDUP_SEARCH_CANONICAL and product.get("_canonical") is False
@@ -0,0 +1,339 @@
+import math
+import os
+import re
+import subprocess  # For running the ollama CLI
+
+from instrumentation import counter, get_logger, histogram, stage
+from structured_output import (
+    STRUCTURED_FAILURES, STRUCTURED_OUTPUT, STRUCTURED_PARSES, STRUCTURED_RETRIES, STRUCTURED_RETRIES_TOTAL,
+    Extraction, FilterQuery, RetryBudget, StructuredOutputError, parse_structured, repair_prompt,
+)
+
+# Pluggable extractor backends for the search apps.
+#
+# A backend turns a user query into either the colour / item-type details
+# the simple search app filters on (`extract`) or a MongoDB filter and
+# projection for the Flipkart catalog (`generate_filter`). Backends are
+# registered by name and import their client libraries on first use, so a
+# worker only pays the import cost of the backend it actually runs.
+#
+#   openai   OpenAI chat completions (OPENAI_API_KEY, OPENAI_MODEL)
+#   groq     Groq through langchain_groq (GROQ_API_KEY, GROQ_MODEL)
+#   ollama   local model through the ollama CLI (OLLAMA_MODEL)
+#   rules    dependency-free keyword matching, no network calls
+#   routed   latency-budgeted hedging across the above (see llm_router.py)
+#
+# Model responses are requested as JSON and validated against typed
+# schemas, with a bounded number of retries (see structured_output.py).
+
+BACKENDS = {}
+
+logger = get_logger("extractors")
+
+# Token accounting for model calls. Counts come from the provider's usage
+# report when it has one and from `estimate_tokens` otherwise.
+TOKEN_BUCKETS = (25, 50, 100, 200, 400, 800, 1600, 3200, 6400)
+LLM_TOKENS = counter(
+    "llm_tokens_total", "Tokens sent to and received from LLM backends", ("app", "backend", "kind", "source")
+)
+LLM_REQUEST_TOKENS = histogram(
+    "llm_request_tokens", "Tokens per LLM request", ("app", "backend", "kind"), buckets=TOKEN_BUCKETS
+)
+
+EXTRACTION_PROMPT = (
+    "Extract the following details from the user query:\n"
+    "1. Colors (comma-separated list)\n"
+    "2. Item types (comma-separated list)\n"
+    "If multiple item types are mentioned, include all of them.\n"
+    "If no specific item type is mentioned, return 'all'.\n"
+    "User query: {user_query}"
+)
+
+# The same request, answered in the Extraction schema
+STRUCTURED_EXTRACTION_PROMPT = (
+    "Extract the colors and item types from the user query.\n"
+    "Reply with JSON only: {{\"colors\": [...], \"item_types\": [...]}}.\n"
+    "If multiple item types are mentioned, include all of them.\n"
+    "If no specific item type is mentioned, use [\"all\"].\n"
+    "User query: {user_query}"
+)
+
+COLORS = [
+    "black", "white", "blue", "red", "green", "yellow", "gray", "grey",
+    "purple", "pink", "orange", "brown", "navy", "maroon", "beige",
+]
+
+ITEM_TYPES = [
+    "t-shirt", "shirt", "jeans", "jacket", "hat", "shoes", "socks", "hoodie",
+    "scarf", "kurta", "trousers", "shorts", "dress", "track pants",
+]
+
+
+def register_backend(name):
+    def decorator(cls):
+        BACKENDS[name] = cls
+        cls.name = name
+        return cls
+    return decorator
+
+
+def create_extractor(name, app_name):
+    """
+    Instantiate a registered backend. No client library is imported until
+    the backend handles its first query.
+    """
+    try:
+        backend = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown extractor backend '{name}', expected one of {sorted(BACKENDS)}")
+    return backend(app_name)
+
+
+def estimate_tokens(text):
+    """
+    Rough BPE token count (about four characters per token for words, one
+    per punctuation mark), used when a provider does not report usage.
+    """
+    return sum(
+        max(1, math.ceil(len(piece) / 4)) if piece[0].isalnum() else 1
+        for piece in re.findall(r"\w+|[^\w\s]", text)
+    )
+
+
+def parse_extraction(response_text):
+    # Parse "Colors: ..." / "Item types: ..." lines from a model response
+    colors = []
+    item_types = []
+    for line in response_text.split("\n"):
+        line = line.strip().lower()
+        if "colors:" in line:
+            colors_part = line.split("colors:")[1].strip()
+            colors = [color.strip() for color in colors_part.split(",")]
+        if "item types:" in line:
+            item_types_part = line.split("item types:")[1].strip()
+            item_types = [item.strip() for item in item_types_part.split(",")]
+        elif "item type:" in line:
+            item_types = [line.split("item type:")[1].strip()]
+    return {"colors": colors, "item_types": item_types}
+
+
+class FallbackFilter(tuple):
+    """
+    A (filter, projection) pair the rule-based extractor produced in place
+    of a model. Unpacks like the plain pair.
+    """
+
+
+def is_fallback(result):
+    return isinstance(result, FallbackFilter)
+
+
+class Backend:
+    name = None
+    # Whether extractions come from a model, and so are worth keeping as learned templates
+    model_backed = False
+
+    def __init__(self, app_name):
+        self.app_name = app_name
+
+    def extract(self, user_query):
+        raise NotImplementedError
+
+    def generate_filter(self, user_query, prompt):
+        raise NotImplementedError
+
+
+class LLMBackend(Backend):
+    """
+    Base for model-backed extractors. Subclasses implement `complete`,
+    returning the response text and the provider's token usage (or None),
+    and constrain the response to a JSON object when `json_mode` is set;
+    prompting, timing, token accounting, validation and retries are shared.
+    A query left without a valid response is answered by the rule-based
+    extractor.
+    """
+
+    temperature = 0
+    model_backed = True
+
+    def __init__(self, app_name):
+        super().__init__(app_name)
+        self.retry_budget = RetryBudget()
+        self._fallback = None
+
+    def complete(self, prompt, temperature, json_mode=False):
+        raise NotImplementedError
+
+    def _account(self, prompt, response_text, usage):
+        if usage:
+            source = "reported"
+            counts = {"prompt": usage["prompt_tokens"], "completion": usage["completion_tokens"]}
+        else:
+            source = "estimated"
+            counts = {"prompt": estimate_tokens(prompt), "completion": estimate_tokens(response_text)}
+        for kind, tokens in counts.items():
+            LLM_TOKENS.inc(self.app_name, self.name, kind, source, amount=tokens)
+            LLM_REQUEST_TOKENS.observe(tokens, self.app_name, self.name, kind)
+        logger.debug("%s tokens: %s (%s)", self.name, counts, source)
+
+    def _complete(self, prompt, temperature, json_mode=False):
+        with stage(self.app_name, "llm_extraction"):
+            response_text, usage = self.complete(prompt, temperature, json_mode)
+        self._account(prompt, response_text, usage)
+        logger.debug("%s response: %s", self.name, response_text)
+        return response_text
+
+    def _structured(self, kind, model, prompt, temperature):
+        """
+        Complete a prompt in JSON mode and validate the response against
+        `model`, re-asking with the validation error while the per-request
+        and per-backend retry budgets allow. Returns None when no valid
+        response was had.
+        """
+        self.retry_budget.deposit()
+        attempt_prompt = prompt
+        for attempt in range(STRUCTURED_RETRIES + 1):
+            if attempt:
+                if not self.retry_budget.withdraw():
+                    STRUCTURED_FAILURES.inc(self.app_name, self.name, kind, "budget_exhausted")
+                    return None
+                STRUCTURED_RETRIES_TOTAL.inc(self.app_name, self.name, kind)
+            response_text = self._complete(attempt_prompt, temperature, json_mode=STRUCTURED_OUTPUT)
+            with stage(self.app_name, "response_parsing"):
+                try:
+                    result, outcome = parse_structured(model, response_text)
+                except StructuredOutputError as e:
+                    STRUCTURED_PARSES.inc(self.app_name, self.name, kind, "invalid")
+                    logger.warning("%s returned an invalid %s response: %s", self.name, kind, e)
+                    attempt_prompt = repair_prompt(prompt, e)
+                    continue
+            STRUCTURED_PARSES.inc(self.app_name, self.name, kind, outcome)
+            return result
+        STRUCTURED_FAILURES.inc(self.app_name, self.name, kind, "retries_exhausted")
+        return None
+
+    def _rule_fallback(self):
+        if self._fallback is None:
+            self._fallback = RuleBackend(self.app_name)
+        return self._fallback
+
+    def extract(self, user_query):
+        if STRUCTURED_OUTPUT:
+            prompt = STRUCTURED_EXTRACTION_PROMPT.format(user_query=user_query)
+            extraction = self._structured("extraction", Extraction, prompt, 0)
+            if extraction is None:
+                return self._rule_fallback().extract(user_query)
+            return extraction.model_dump()
+        response_text = self._complete(EXTRACTION_PROMPT.format(user_query=user_query), 0)
+        with stage(self.app_name, "response_parsing"):
+            return parse_extraction(response_text)
+
+    def generate_filter(self, user_query, prompt):
+        query = self._structured("filter", FilterQuery, prompt.format(user_query=user_query), self.temperature)
+        if query is None:
+            # Marked, so the rules' output is not learned as a model's
+            return FallbackFilter(self._rule_fallback().generate_filter(user_query, prompt))
+        return query.filter, query.projection
+
+
+@register_backend("openai")
+class OpenAIBackend(LLMBackend):
+    def __init__(self, app_name):
+        super().__init__(app_name)
+        self._client = None
+
+    def complete(self, prompt, temperature, json_mode=False):
+        if self._client is None:
+            from openai import OpenAI
+
+            self._client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        options = {"response_format": {"type": "json_object"}} if json_mode else {}
+        response = self._client.chat.completions.create(
+            model=os.getenv("OPENAI_MODEL", "gpt-3.5-turbo"),
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=1024,
+            temperature=temperature,
+            stream=False,
+            **options,
+        )
+        usage = response.usage
+        if usage is not None:
+            usage = {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens}
+        return response.choices[0].message.content, usage
+
+
+@register_backend("groq")
+class GroqBackend(LLMBackend):
+    temperature = 0.5
+
+    def __init__(self, app_name):
+        super().__init__(app_name)
+        self._chats = {}
+
+    def complete(self, prompt, temperature, json_mode=False):
+        chat = self._chats.get((temperature, json_mode))
+        if chat is None:
+            from langchain_groq import ChatGroq
+
+            model_kwargs = {"response_format": {"type": "json_object"}} if json_mode else {}
+            chat = self._chats[(temperature, json_mode)] = ChatGroq(
+                temperature=temperature, model_name=os.getenv("GROQ_MODEL", "mixtral-8x7b-32768"),
+                model_kwargs=model_kwargs,
+            )
+        message = chat.invoke(prompt)
+        return message.content, message.response_metadata.get("token_usage")
+
+
+@register_backend("ollama")
+class OllamaBackend(LLMBackend):
+    def complete(self, prompt, temperature, json_mode=False):
+        # Run the ollama CLI command to interact with the local model
+        options = ["--format", "json"] if json_mode else []
+        result = subprocess.run(
+            ["ollama", "run", *options, os.getenv("OLLAMA_MODEL", "llama2"), prompt],
+            capture_output=True,
+            text=True,
+            encoding="utf-8",  # Explicitly set encoding to utf-8
+            errors="replace"   # Replace invalid characters instead of raising an error
+        )
+        if result.returncode != 0:
+            raise Exception(f"Ollama CLI Error: {result.stderr}")
+        return result.stdout.strip(), None
+
+
+@register_backend("rules")
+class RuleBackend(Backend):
+    """
+    Keyword matcher with no model behind it. Deterministic and fast, used
+    as a fallback and as the stub in benchmarks.
+    """
+
+    def _match(self, user_query):
+        text = user_query.lower()
+        colors = [c for c in COLORS if re.search(rf"\b{c}\b", text)]
+        item_types = []
+        for item in ITEM_TYPES:
+            # The lookbehind keeps "shirt" from also matching inside "t-shirt"
+            if re.search(rf"(?<![\w-]){re.escape(item)}s?\b", text):
+                item_types.append(item)
+        return text, colors, item_types
+
+    def extract(self, user_query):
+        with stage(self.app_name, "llm_extraction"):
+            _, colors, item_types = self._match(user_query)
+        return {"colors": colors, "item_types": item_types or ["all"]}
+
+    def generate_filter(self, user_query, prompt=None):
+        with stage(self.app_name, "llm_extraction"):
+            text, colors, item_types = self._match(user_query)
+            filter_query = {}
+            if colors:
+                filter_query["product_details.Color"] = {"$in": [c.capitalize() for c in colors]}
+            if item_types:
+                filter_query["title"] = {"$regex": item_types[0], "$options": "i"}
+            price = re.search(r"(?:under|below|less than|within)\s+(?:rs\.?\s*)?(\d[\d,]*)", text)
+            if price:
+                filter_query["actual_price"] = {"$lt": price.group(1).replace(",", "")}
+            if "in stock" in text or "available" in text:
+                filter_query["out_of_stock"] = False
+        return filter_query, {}
@@ -0,0 +1,212 @@
+import argparse
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+from attributes import attribute_filter
+from dedup import canonical_filter, collapse_groups, is_variant
+from instrumentation import counter, get_logger
+
+# Facet counts (colour, brand, category, sub-category, price bucket,
+# availability) for the Flipkart catalog.
+#
+# Counting with $group over the whole collection on every request is far
+# too slow, so ingest keeps a small summary collection up to date instead:
+# one document per facet value holding its product count, incremented by
+# `update_facets` for each inserted batch. Search processes keep the
+# summary in memory and re-read it every FACET_CACHE_TTL_S seconds, which
+# makes unfiltered facets a dictionary lookup. Facets for a filtered result
+# set are counted exactly from the in-memory catalog state once it has
+# loaded, and until then in the request from a projected find(), capped at
+# FACET_FILTER_LIMIT products; larger sets are reported as truncated.
+# Each near-duplicate group (see dedup.py) counts once: through its
+# canonical in the summary, through the products that matched in a
+# filtered count.
+#
+# Environment variables:
+#   FACET_COLLECTION     summary collection name (default "flipKart_facets")
+#   FACET_CACHE_TTL_S    how long a process reuses the summary (default 30)
+#   FACET_FILTER_LIMIT   max products counted for a filtered request (default 500)
+#
+# Rebuild the summary from scratch (e.g. after deleting products):
+#   python facets.py --rebuild
+
+FACET_COLLECTION = os.getenv("FACET_COLLECTION", "flipKart_facets")
+FACET_CACHE_TTL_S = float(os.getenv("FACET_CACHE_TTL_S", "30"))
+FACET_FILTER_LIMIT = int(os.getenv("FACET_FILTER_LIMIT", "500"))
+
+FACETS = ("color", "brand", "category", "sub_category", "price", "availability")
+
+# Upper bounds of the selling-price buckets, in rupees
+PRICE_BUCKETS = (500, 1000, 2000, 5000)
+
+# Fields a filtered count has to read
+FACET_PROJECTION = {
+    "brand": 1, "category": 1, "sub_category": 1, "selling_price": 1,
+    "out_of_stock": 1, "product_details": 1, "_canonical": 1, "_group": 1,
+}
+
+# Equality filters the in-memory catalog state can answer, by state column
+STATE_FILTER_COLUMNS = {
+    "brand": "brand", "category": "category", "sub_category": "sub_category",
+    "product_details.Color": "color", "out_of_stock": "out_of_stock",
+}
+
+FACET_REQUESTS = counter("facet_requests_total", "Facet requests by how they were answered", ("source",))
+
+logger = get_logger("facets")
+
+
+def price_bucket(price):
+    digits = re.sub(r"[^\d.]", "", str(price or ""))
+    if not digits:
+        return None
+    value = float(digits)
+    lower = 0
+    for upper in PRICE_BUCKETS:
+        if value < upper:
+            return f"{lower}-{upper - 1}"
+        lower = upper
+    return f"{lower}+"
+
+
+def facet_values(product):
+    """
+    Yield (facet, value) for every facet a product counts towards.
+    """
+    for detail in product.get("product_details") or []:
+        if isinstance(detail, dict) and detail.get("Color"):
+            yield "color", detail["Color"]
+            break
+    for field in ("brand", "category", "sub_category"):
+        if product.get(field):
+            yield field, product[field]
+    bucket = price_bucket(product.get("selling_price"))
+    if bucket:
+        yield "price", bucket
+    yield "availability", "out_of_stock" if product.get("out_of_stock") else "in_stock"
+
+
+def count_facets(products):
+    return Counter(pair for product in products if not is_variant(product) for pair in facet_values(product))
+
+
+def _ranked(counts, size):
+    # {facet: [{"value", "count"}, ...]} with the largest counts first
+    facets = {facet: [] for facet in FACETS}
+    for (facet, value), count in counts.items():
+        if count > 0:
+            facets[facet].append({"value": value, "count": count})
+    for facet, values in facets.items():
+        values.sort(key=lambda item: (-item["count"], item["value"]))
+        facets[facet] = values[:size]
+    return facets
+
+
+def update_facets(facet_collection, products):
+    """
+    Add a batch of newly inserted products to the summary collection.
+    Returns the number of facet documents touched.
+    """
+    from pymongo import UpdateOne
+    from mongo_store import bulk_write_batched
+
+    counts = count_facets(products)
+    operations = (
+        UpdateOne(
+            {"_id": f"{facet}:{value}"},
+            {"$inc": {"count": count}, "$set": {"facet": facet, "value": value}},
+            upsert=True,
+        )
+        for (facet, value), count in counts.items()
+    )
+    bulk_write_batched(facet_collection, operations)
+    return len(counts)
+
+
+def rebuild_facets(collection, facet_collection):
+    """
+    Recount every facet from the product collection and replace the summary.
+    """
+    counts = count_facets(collection.find(canonical_filter({}), FACET_PROJECTION))
+    facet_collection.delete_many({})
+    if counts:
+        facet_collection.insert_many([
+            {"_id": f"{facet}:{value}", "facet": facet, "value": value, "count": count}
+            for (facet, value), count in counts.items()
+        ])
+    return len(counts)
+
+
+class FacetSummary:
+    """
+    Process-local copy of the facet summary collection, refreshed at most
+    every `ttl` seconds.
+    """
+
+    def __init__(self, facet_collection, ttl=FACET_CACHE_TTL_S):
+        self.facet_collection = facet_collection
+        self.ttl = ttl
+        self._counts = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def counts(self):
+        if self._counts is None or time.monotonic() - self._loaded_at > self.ttl:
+            with self._lock:
+                if self._counts is None or time.monotonic() - self._loaded_at > self.ttl:
+                    self._counts = Counter({
+                        (doc["facet"], doc["value"]): doc["count"]
+                        for doc in self.facet_collection.find({}, {"facet": 1, "value": 1, "count": 1})
+                    })
+                    self._loaded_at = time.monotonic()
+        return self._counts
+
+    def facets(self, collection, filter_query=None, size=20, catalog_state=None):
+        """
+        Return {"facets", "source", "truncated"}. Unfiltered requests are
+        served from the summary; filtered ones are counted from the catalog
+        state (see catalog_snapshot.py) when given, else in-request.
+        """
+        if not filter_query:
+            FACET_REQUESTS.inc("summary")
+            return {"facets": _ranked(self.counts(), size), "source": "summary", "truncated": False}
+
+        # Exact counts from the in-memory catalog state when it is loaded
+        if catalog_state is not None and set(filter_query) <= set(STATE_FILTER_COLUMNS):
+            columns = {STATE_FILTER_COLUMNS[field]: value for field, value in filter_query.items() if field != "out_of_stock"}
+            in_stock = None if "out_of_stock" not in filter_query else not filter_query["out_of_stock"]
+            FACET_REQUESTS.inc("catalog_state")
+            counts = catalog_state.facet_counts(columns, in_stock)
+            return {"facets": _ranked(counts, size), "source": "catalog_state", "truncated": False}
+
+        products = list(collection.find(attribute_filter(filter_query), FACET_PROJECTION, limit=FACET_FILTER_LIMIT + 1))
+        truncated = len(products) > FACET_FILTER_LIMIT
+        FACET_REQUESTS.inc("truncated" if truncated else "aggregation")
+        # Each group that matched counts once, through whichever of its products matched
+        counts = Counter(pair for product in collapse_groups(products[:FACET_FILTER_LIMIT]) for pair in facet_values(product))
+        return {"facets": _ranked(counts, size), "source": "aggregation", "truncated": truncated}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the facet summary collection.")
+    parser.add_argument("--rebuild", action="store_true", help="Recount all facets from the product collection")
+    parser.add_argument("--collection", default="flipKart_products", help="Product collection")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from mongo_store import write_collection
+
+    load_dotenv()
+    if args.rebuild:
+        start = time.perf_counter()
+        touched = rebuild_facets(write_collection(args.collection), write_collection(FACET_COLLECTION))
+        print(f"Rebuilt {touched} facet values in {time.perf_counter() - start:.1f}s")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
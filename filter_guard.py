@@ -0,0 +1,241 @@
+import os
+import re
+
+from attributes import ATTRIBUTE_FILTERS, attribute_filter, is_attribute_predicate
+from instrumentation import counter
+
+# Validation and cost guardrails for LLM-generated MongoDB filters.
+#
+# The complex app hands model output straight to `collection.find`. Before
+# it does, `guard_filter` checks every field and operator against a
+# whitelist, rewrites predicates that cannot use an index where it is safe
+# to, rejects the rest, and classifies the query as an index lookup or a
+# bounded collection scan so the caller can cap it. product_details
+# predicates are moved onto the flattened attribute index (attributes.py).
+
+# Hard limits applied to every guarded find()
+FIND_MAX_TIME_MS = int(os.getenv("FIND_MAX_TIME_MS", "2000"))
+FIND_HARD_LIMIT = int(os.getenv("FIND_HARD_LIMIT", "100"))
+# Tighter cap for queries without a selective predicate
+FIND_SCAN_LIMIT = int(os.getenv("FIND_SCAN_LIMIT", "20"))
+
+MAX_IN_VALUES = 50
+MAX_DEPTH = 6
+
+# Fields of the flipKart_products schema the model may filter on
+ALLOWED_FIELDS = {
+    "actual_price", "average_rating", "brand", "category", "crawled_at",
+    "description", "discount", "out_of_stock", "pid", "seller",
+    "selling_price", "sub_category", "title",
+}
+# product_details entries are single-key objects, e.g. {"Fabric": "Cotton"}
+ALLOWED_DETAIL_KEYS = {"Style_Code", "Closure", "Pockets", "Fabric", "Pattern", "Color"}
+
+# Fields ingest creates single-field indexes on; product_details keys share the attrs compound index
+INDEXED_FIELDS = ("brand", "category", "sub_category", "out_of_stock", "pid")
+
+# Long free-text fields that a regex can never use an index for
+FREE_TEXT_FIELDS = {"description"}
+
+LOGICAL_OPERATORS = {"$and", "$or", "$nor"}
+FIELD_OPERATORS = {
+    "$eq", "$ne", "$gt", "$gte", "$lt", "$lte", "$in", "$nin",
+    "$exists", "$regex", "$options", "$all", "$elemMatch", "$not",
+}
+# Operators that are equality-like and can be answered from an index
+SELECTIVE_OPERATORS = {"$eq", "$in", "$all"}
+RANGE_OPERATORS = {"$gt", "$gte", "$lt", "$lte"}
+
+REGEX_METACHARACTERS = re.compile(r"[.^$*+?()\[\]{}|\\]")
+
+FILTER_REJECTIONS = counter(
+    "filter_guard_rejections_total", "LLM-generated filters rejected by the guard", ("reason",)
+)
+FILTER_REWRITES = counter(
+    "filter_guard_rewrites_total", "Predicates rewritten or dropped by the guard", ("reason",)
+)
+FILTER_PLANS = counter(
+    "filter_guard_plans_total", "Guarded queries by estimated plan", ("plan",)
+)
+
+
+class FilterRejected(ValueError):
+    def __init__(self, reason, detail):
+        super().__init__(detail)
+        self.reason = reason
+
+
+def _reject(reason, detail):
+    FILTER_REJECTIONS.inc(reason)
+    raise FilterRejected(reason, detail)
+
+
+def _check_field(field):
+    if field in ALLOWED_FIELDS:
+        return
+    prefix, _, key = field.partition(".")
+    if prefix == "product_details" and (key in ALLOWED_DETAIL_KEYS or not key):
+        # The bare array only with $elemMatch (see _guard_condition)
+        return
+    _reject("field", f"Filtering on '{field}' is not allowed")
+
+
+def _is_indexed(field):
+    return field in INDEXED_FIELDS or (ATTRIBUTE_FILTERS and field.startswith("product_details."))
+
+
+def _rewrite_regex(field, condition):
+    """
+    Rewrite a regex predicate into an index-friendly form where the
+    meaning is preserved. Returns the new condition, or None to drop it.
+    """
+    pattern = condition.get("$regex")
+    if not isinstance(pattern, str):
+        _reject("regex", f"Invalid $regex on '{field}'")
+    options = condition.get("$options", "")
+    literal = pattern.strip("^$")
+
+    # ^value$ without metacharacters or flags is plain equality
+    if pattern.startswith("^") and pattern.endswith("$") and not options and not REGEX_METACHARACTERS.search(literal):
+        FILTER_REWRITES.inc("anchored_regex_to_equality")
+        return literal
+
+    if field in FREE_TEXT_FIELDS and not pattern.startswith("^"):
+        # An unanchored regex over long descriptions is always a full scan
+        FILTER_REWRITES.inc("dropped_free_text_regex")
+        return None
+    return condition
+
+
+def _guard_condition(field, condition, depth):
+    """
+    Validate the condition for one field. Returns (condition, selective),
+    where condition is None if the predicate was dropped.
+    """
+    if field == "product_details" and not (isinstance(condition, dict) and set(condition) == {"$elemMatch"}):
+        _reject("operator", "product_details can only be matched with $elemMatch")
+    if not isinstance(condition, dict):
+        if isinstance(condition, (list, dict)):
+            _reject("value", f"Unsupported value for '{field}'")
+        return condition, _is_indexed(field)
+
+    operators = set(condition)
+    unknown = {op for op in operators if op.startswith("$") and op not in FIELD_OPERATORS}
+    if unknown:
+        _reject("operator", f"Operator {sorted(unknown)[0]} is not allowed")
+    if not any(op.startswith("$") for op in operators):
+        # Exact sub-document match
+        return condition, _is_indexed(field)
+
+    if "$regex" in condition:
+        condition = _rewrite_regex(field, condition)
+        if condition is None or not isinstance(condition, dict):
+            return condition, condition is not None and _is_indexed(field)
+        # Only a case-sensitive prefix regex can use the index
+        prefix = condition["$regex"].startswith("^") and "i" not in condition.get("$options", "")
+        return condition, prefix and _is_indexed(field)
+
+    for op in ("$in", "$nin", "$all"):
+        values = condition.get(op)
+        if values is not None:
+            if not isinstance(values, list):
+                _reject("value", f"{op} on '{field}' must be a list")
+            if len(values) > MAX_IN_VALUES:
+                _reject("value", f"{op} on '{field}' has more than {MAX_IN_VALUES} values")
+
+    if "$elemMatch" in condition:
+        if field != "product_details":
+            _reject("operator", "$elemMatch is only allowed on product_details")
+        if not isinstance(condition["$elemMatch"], dict) or not condition["$elemMatch"]:
+            _reject("value", "$elemMatch on product_details must be a non-empty object")
+        for key, value in condition["$elemMatch"].items():
+            if key not in ALLOWED_DETAIL_KEYS:
+                _reject("field", f"Filtering on 'product_details.{key}' is not allowed")
+            _guard_condition(f"product_details.{key}", value, depth + 1)
+        # Only the $elemMatch forms attribute_filter rewrites reach the attrs index; the rest scan
+        return condition, is_attribute_predicate(field, condition)
+
+    if "$not" in condition:
+        inner, _ = _guard_condition(field, condition["$not"], depth + 1)
+        if inner is None:
+            _reject("regex", f"Unsupported $not on '{field}'")
+
+    selective = _is_indexed(field) and bool(operators & (SELECTIVE_OPERATORS | RANGE_OPERATORS))
+    return condition, selective
+
+
+def _guard_clause(filter_query, depth=0):
+    """
+    Validate one filter document. Returns (filter, selective) where
+    selective means at least one predicate can be answered from an index.
+    """
+    if depth > MAX_DEPTH:
+        _reject("depth", "Filter is nested too deeply")
+    if not isinstance(filter_query, dict):
+        _reject("shape", "Filter must be a JSON object")
+
+    guarded = {}
+    selective = False
+    for key, value in filter_query.items():
+        if key in LOGICAL_OPERATORS:
+            if not isinstance(value, list) or not value:
+                _reject("shape", f"{key} must be a non-empty list")
+            branches = [_guard_clause(branch, depth + 1) for branch in value]
+            if key == "$or" and any(not branch for branch, _ in branches):
+                # A branch emptied by rewriting matches everything, and so does the $or
+                FILTER_REWRITES.inc("dropped_empty_logical")
+                continue
+            if key == "$nor" and any(not branch for branch, _ in branches):
+                _reject("shape", "$nor branch matches every document")
+            branches = [(branch, branch_selective) for branch, branch_selective in branches if branch]
+            if not branches:
+                FILTER_REWRITES.inc("dropped_empty_logical")
+                continue
+            guarded[key] = [branch for branch, _ in branches]
+            if key == "$and":
+                selective = selective or any(s for _, s in branches)
+            elif key == "$or":
+                # An $or is only index-backed if every branch is
+                selective = selective or all(s for _, s in branches)
+        elif key.startswith("$"):
+            _reject("operator", f"Operator {key} is not allowed")
+        else:
+            _check_field(key)
+            condition, condition_selective = _guard_condition(key, value, depth + 1)
+            if condition is None:
+                continue
+            guarded[key] = condition
+            selective = selective or condition_selective
+    return attribute_filter(guarded), selective
+
+
+def _guard_projection(projection):
+    if not isinstance(projection, dict):
+        FILTER_REWRITES.inc("dropped_projection")
+        return {}
+    for field, value in projection.items():
+        if value not in (0, 1, True, False) or field.startswith("$"):
+            # Aggregation expressions or malformed values: fall back to all fields
+            FILTER_REWRITES.inc("dropped_projection")
+            return {}
+    # MongoDB refuses to mix inclusion and exclusion, except for excluding _id
+    included = {bool(value) for field, value in projection.items() if field != "_id"}
+    if len(included) > 1:
+        _reject("projection", "Projection mixes included and excluded fields")
+    return projection
+
+
+def guard_filter(filter_query, projection=None):
+    """
+    Validate and rewrite an LLM-generated filter and projection.
+
+    Returns (filter, projection, plan, limit) where plan is "index" when a
+    selective indexed predicate exists and "scan" otherwise, and limit is
+    the hard cap the caller must apply. Raises FilterRejected when the
+    filter uses a disallowed field, operator or shape.
+    """
+    guarded, selective = _guard_clause(filter_query or {})
+    plan = "index" if selective else "scan"
+    FILTER_PLANS.inc(plan)
+    limit = FIND_HARD_LIMIT if selective else min(FIND_HARD_LIMIT, FIND_SCAN_LIMIT)
+    return guarded, _guard_projection(projection or {}), plan, limit
@@ -0,0 +1,118 @@
+import os
+import re
+
+from extractors import COLORS
+from instrumentation import counter
+
+# Prompts for LLM filter generation.
+#
+# The original prompt described the whole product schema and every rule on
+# each call, although most queries touch two or three fields. The compact
+# prompt keeps one fixed instruction block (identical for every query, so
+# providers that cache prompt prefixes can reuse it), then adds only the
+# field descriptions for the intents detected in the query, always in the
+# same order, and puts the user query last. Sorting and "top N" limits are
+# applied by the app itself and are no longer described to the model.
+#
+# Environment variables:
+#   FILTER_PROMPT_MODE   compact | full (default compact)
+
+FILTER_PROMPT_MODE = os.getenv("FILTER_PROMPT_MODE", "compact")
+
+# The original schema prompt, kept for comparison and as a fallback
+FULL_FILTER_PROMPT = (
+    "You are tasked with generating a MongoDB query based on a user query.\n"
+    "The query should be based on a product schema with the following fields:\n"
+    "  - _id (UUID)\n"
+    "  - actual_price (String, formatted with commas, e.g., '2,999')\n"
+    "  - average_rating (String)\n"
+    "  - brand (String)\n"
+    "  - category (String)\n"
+    "  - crawled_at (String)\n"
+    "  - description (String)\n"
+    "  - discount (String)\n"
+    "  - images (Array of Strings, optional)\n"
+    "  - out_of_stock (Boolean, optional)\n"
+    "  - pid (String)\n"
+    "  - product_details (Array of objects with specific keys, optional)\n"
+    "  - seller (String)\n"
+    "  - selling_price (String)\n"
+    "  - sub_category (String)\n"
+    "  - title (String)\n"
+    "  - url (String)\n"
+    "  - out_of_stock (boolean)\n"
+
+    "Generate a MongoDB query that:\n"
+    "- Applies filters on the fields based on the user query.\n"
+    "- Specifies the fields to return in the result (projection).\n"
+    "- The projection must only include field inclusion/exclusion (e.g., 1 or 0).\n"
+    "- Do not include aggregation expressions (e.g., $substr, $cond) in the projection.\n"
+    "- Sorts the results if specified by the user.\n"
+    "- Limits the number of results if specified by the user.\n"
+    "- The `actual_price` field must be treated as a string in both the filter and projection.\n"
+    "- The `out_of_stock` field must be a boolean (true or false).\n"
+    "Format the response as a valid JSON object with two keys: 'filter' and 'projection'.\n"
+    "Do not include explanations or additional text.\n"
+    "Here is the user query: {user_query}"
+)
+
+# Fixed instruction block shared by every compact prompt
+PROMPT_PREFIX = (
+    "Write a MongoDB find() filter for a product search query.\n"
+    "Reply with JSON only: {{\"filter\": {{...}}, \"projection\": {{}}}}.\n"
+    "Use only the fields below and the operators $eq $ne $in $nin $lt $lte $gt $gte $regex $options $exists $and $or.\n"
+    "Match text with case-insensitive $regex. Leave out anything the query does not ask for.\n"
+    "Fields:\n"
+    "title: str, product name\n"
+    "brand: str\n"
+    "category: str, e.g. \"Clothing and Accessories\"\n"
+    "sub_category: str, e.g. \"Topwear\", \"Bottomwear\"\n"
+)
+
+# Field descriptions per intent, in the order they are appended
+INTENT_FIELDS = (
+    ("price", "actual_price, selling_price: str of digits, e.g. \"2999\"\n"),
+    ("discount", "discount: str, e.g. \"40% off\"\n"),
+    ("rating", "average_rating: str, e.g. \"4.1\"\n"),
+    ("stock", "out_of_stock: bool\n"),
+    ("color", "product_details.Color: str, capitalised, e.g. \"Navy Blue\"\n"),
+    ("details", "product_details.Fabric / .Pattern / .Closure / .Pockets / .Style_Code: str\n"),
+    ("seller", "seller: str\n"),
+)
+
+INTENT_PATTERNS = {
+    "price": re.compile(r"\b(?:under|below|above|over|between|less than|more than|cheap|cheaper|budget|price[sd]?|rs\.?|inr)\b|₹|\b\d{3,}\b"),
+    "discount": re.compile(r"\b(?:discount(?:ed|s)?|off|sale|deals?|offers?)\b|%"),
+    "rating": re.compile(r"\b(?:rating|rated|stars?|best|top|reviews?)\b"),
+    "stock": re.compile(r"\b(?:in stock|out of stock|available|availability|sold out)\b"),
+    "color": re.compile(r"\b(?:colou?rs?|" + "|".join(re.escape(c) for c in COLORS) + r")\b"),
+    "details": re.compile(r"\b(?:fabric|cotton|polyester|linen|denim|wool|silk|rayon|pattern|printed|solid|striped|checked|closure|zip|button|pockets?|style code)\b"),
+    "seller": re.compile(r"\b(?:seller|sold by|retailer)\b"),
+}
+
+QUERY_SUFFIX = "Query: {user_query}"
+
+PROMPT_INTENTS = counter("filter_prompt_intents_total", "Intents detected for compact filter prompts", ("intent",))
+
+
+def detect_intents(user_query):
+    text = user_query.lower()
+    return [intent for intent, _ in INTENT_FIELDS if INTENT_PATTERNS[intent].search(text)]
+
+
+def filter_prompt(user_query, mode=None):
+    """
+    Return (prompt template, intents) for a query. The template still
+    contains the {user_query} placeholder, as backends expect.
+    """
+    mode = mode or FILTER_PROMPT_MODE
+    if mode == "full":
+        return FULL_FILTER_PROMPT, []
+    if mode != "compact":
+        raise ValueError(f"Unknown FILTER_PROMPT_MODE: {mode}")
+    intents = detect_intents(user_query)
+    for intent in intents:
+        PROMPT_INTENTS.inc(intent)
+    fields = "".join(text for intent, text in INTENT_FIELDS if intent in intents)
+    return PROMPT_PREFIX + fields + QUERY_SUFFIX, intents
+
@@ -0,0 +1,265 @@
+import argparse
+import gzip
+import itertools
+import json
+import random
+import sys
+import time
+
+# Synthetic product catalog generator for scaling tests.
+#
+# Streams products in either the `flipkart` schema (the `flipKart_products`
+# documents the complex app queries, see `Product` in dataInsertion.py) or
+# the `simple` schema used by ecom.json. Output is a JSON array or JSONL,
+# both of which dataInsertion.py can ingest.
+#
+# Example:
+#   python generate_catalog.py --count 1000000 --format jsonl --output catalog_1m.jsonl
+#   python generate_catalog.py --count 10000 --schema simple --output simple_10k.json
+
+COLORS = [
+    "Black", "Blue", "White", "Grey", "Multicolor", "Navy Blue", "Red", "Green",
+    "Maroon", "Pink", "Yellow", "Brown", "Beige", "Olive", "Purple", "Orange",
+    "Dark Blue", "Light Blue", "Khaki", "Gold", "Silver", "Cream", "Teal", "Mustard",
+]
+
+BRANDS = [
+    "York", "Reebok", "Pu", "Roadster", "Keo", "Ecko Unltd", "Amo", "Ventra",
+    "Marks & Spencer", "Free Authority", "Pepe Jeans", "True Bl", "Raymond",
+    "U.S. Polo Assn", "Arrow", "Wrogn", "Campus Sutra", "Highlander", "Metronaut",
+    "Kalt", "Numero Uno", "Lee", "Levi's", "Mufti", "Spykar", "Jack & Jones",
+    "Allen Solly", "Peter England", "Van Heusen", "Louis Philippe",
+]
+
+# Category -> sub-category -> item nouns used in titles
+CATALOG_TREE = {
+    "Clothing and Accessories": {
+        "Bottomwear": ["Track Pants", "Jeans", "Trousers", "Shorts", "Cargos", "Joggers"],
+        "Topwear": ["T-Shirt", "Shirt", "Polo", "Sweatshirt", "Hoodie", "Jacket", "Kurta"],
+        "Winter Wear": ["Jacket", "Sweater", "Thermal Top", "Pullover"],
+        "Innerwear and Swimwear": ["Briefs", "Vest", "Boxer", "Swim Shorts"],
+        "Sleepwear": ["Pyjama", "Night Suit", "Lounge Pants"],
+        "Clothing Accessories": ["Cap", "Scarf", "Belt", "Gloves", "Socks"],
+    },
+    "Footwear": {
+        "Mens Footwear": ["Sneakers", "Running Shoes", "Loafers", "Sandals", "Slippers"],
+    },
+    "Bags, Wallets & Belts": {
+        "Bags": ["Backpack", "Duffel Bag", "Laptop Bag"],
+        "Wallets": ["Wallet", "Card Holder"],
+    },
+}
+
+FABRICS = ["Cotton Blend", "Pure Cotton", "Polyester", "Denim", "Viscose Rayon", "Linen", "Wool", "Nylon", "Lycra Blend"]
+PATTERNS = ["Solid", "Printed", "Striped", "Checkered", "Self Design", "Colorblock", "Washed"]
+CLOSURES = ["Elastic", "Drawstring", "Button", "Zip", "Hook", "Slip On", "Lace Up"]
+POCKETS = ["Side Pockets", "Patch Pockets", "No Pockets", "Flap Pockets", "Welt Pockets"]
+FITS = ["Regular", "Slim", "Relaxed", "Skinny", "Loose"]
+SELLERS = ["Shyam Enterprises", "RetailNet", "KAPSONS", "SandSMarketing", "Alpha Traders", "TrueComRetail", "AMAN TRADING", "BioWorld Merchandising"]
+ADJECTIVES = ["Solid", "Printed", "Striped", "Washed", "Casual", "Slim Fit", "Regular Fit", "Self Design", "Colorblock"]
+AUDIENCES = ["Men", "Women", "Boys", "Girls", "Unisex"]
+
+
+def zipf_weights(size, skew):
+    # Zipf-like weights; skew 0 is uniform, larger values concentrate mass on the first entries
+    return list(itertools.accumulate(1.0 / (rank ** skew) for rank in range(1, size + 1)))
+
+
+def format_price(value):
+    return "{:,}".format(value)
+
+
+class CatalogGenerator:
+    """
+    Deterministic, streaming product generator. Attribute draws are
+    batched with `random.choices` so millions of products can be produced
+    without holding them in memory.
+    """
+
+    def __init__(self, seed=42, color_skew=1.1, brand_skew=1.2, missing_rate=0.1, out_of_stock_rate=0.08, batch_size=1000):
+        self.rng = random.Random(seed)
+        self.color_weights = zipf_weights(len(COLORS), color_skew)
+        self.brand_weights = zipf_weights(len(BRANDS), brand_skew)
+        self.missing_rate = missing_rate
+        self.out_of_stock_rate = out_of_stock_rate
+        self.batch_size = batch_size
+        self.leaf_categories = [
+            (category, sub_category, items)
+            for category, sub_categories in CATALOG_TREE.items()
+            for sub_category, items in sub_categories.items()
+        ]
+        self.leaf_weights = zipf_weights(len(self.leaf_categories), 0.8)
+
+    def _pid(self, index):
+        # 16 character uppercase ids like the Flipkart crawl, unique per index
+        alphabet = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+        value = (index * 2654435761 + 0x5DEECE66D1B) % (36 ** 16)
+        chars = []
+        for _ in range(16):
+            value, remainder = divmod(value, 36)
+            chars.append(alphabet[remainder])
+        return "".join(chars)
+
+    def _uuid(self, index):
+        value = (index * 0x9E3779B97F4A7C15 + 0x632BE59BD9B4E019) & ((1 << 128) - 1)
+        text = "%032x" % value
+        return f"{text[:8]}-{text[8:12]}-4{text[13:16]}-a{text[17:20]}-{text[20:32]}"
+
+    def flipkart_batch(self, start, size):
+        rng = self.rng
+        colors = rng.choices(COLORS, cum_weights=self.color_weights, k=size)
+        brands = rng.choices(BRANDS, cum_weights=self.brand_weights, k=size)
+        leaves = rng.choices(self.leaf_categories, cum_weights=self.leaf_weights, k=size)
+        products = []
+        for offset in range(size):
+            index = start + offset
+            color, brand = colors[offset], brands[offset]
+            category, sub_category, items = leaves[offset]
+            item = rng.choice(items)
+            audience = rng.choice(AUDIENCES)
+            fabric = rng.choice(FABRICS)
+            pattern = rng.choice(PATTERNS)
+            adjective = pattern if rng.random() < 0.6 else rng.choice(ADJECTIVES)
+
+            # Long-tailed price distribution between roughly 150 and 15,000
+            actual_price = int(min(15000, max(149, rng.lognormvariate(7.2, 0.7)))) // 10 * 10 + 9
+            discount_pct = rng.choice([0, 0, 5, 10, 15, 20, 25, 30, 40, 45, 50, 55, 60, 65, 70, 75, 80])
+            selling_price = max(99, actual_price * (100 - discount_pct) // 100)
+            pid = self._pid(index)
+            title = f"{adjective} {audience} {color} {item}"
+
+            product = {
+                "_id": self._uuid(index),
+                "actual_price": format_price(actual_price),
+                "average_rating": f"{rng.triangular(1.0, 5.0, 4.1):.1f}",
+                "brand": brand,
+                "category": category,
+                "crawled_at": f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2021, {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}",
+                "description": (
+                    f"{brand} presents this {pattern.lower()} {color.lower()} {item.lower()} for {audience.lower()}, "
+                    f"made from {fabric.lower()} with a {rng.choice(FITS).lower()} fit for everyday comfort."
+                ),
+                "discount": f"{discount_pct}% off" if discount_pct else "",
+                "images": [
+                    f"https://rukminim1.flixcart.com/image/128/128/{pid.lower()}/{sub_category.lower().replace(' ', '-')}/{n}.jpeg"
+                    for n in range(rng.randint(1, 4))
+                ],
+                "out_of_stock": rng.random() < self.out_of_stock_rate,
+                "pid": pid,
+                "product_details": [
+                    {"Style_Code": f"{brand[:3].upper()}{index % 100000:05d}"},
+                    {"Closure": rng.choice(CLOSURES)},
+                    {"Pockets": rng.choice(POCKETS)},
+                    {"Fabric": fabric},
+                    {"Pattern": pattern},
+                    {"Color": color},
+                ],
+                "seller": rng.choice(SELLERS),
+                "selling_price": format_price(selling_price),
+                "sub_category": sub_category,
+                "title": title,
+                "url": f"https://www.flipkart.com/{title.lower().replace(' ', '-')}/p/itm{pid[:13].lower()}?pid={pid}",
+            }
+
+            # Drop optional fields (and individual product details) at the configured rate
+            if self.missing_rate:
+                for field in ("images", "out_of_stock", "discount", "seller", "average_rating"):
+                    if rng.random() < self.missing_rate:
+                        del product[field]
+                if rng.random() < self.missing_rate:
+                    del product["product_details"]
+                else:
+                    product["product_details"] = [
+                        detail for detail in product["product_details"]
+                        if "Color" in detail or rng.random() >= self.missing_rate
+                    ]
+            products.append(product)
+        return products
+
+    def simple_batch(self, start, size):
+        rng = self.rng
+        colors = rng.choices(COLORS, cum_weights=self.color_weights, k=size)
+        leaves = rng.choices(self.leaf_categories, cum_weights=self.leaf_weights, k=size)
+        products = []
+        for offset in range(size):
+            color = colors[offset].lower()
+            item = rng.choice(leaves[offset][2])
+            product = {
+                "name": f"{color.title()} {item}",
+                "color": color,
+                "availability": rng.random() >= self.out_of_stock_rate,
+            }
+            if rng.random() >= self.missing_rate:
+                product["image_url"] = f"https://example.com/{color}_{item.lower().replace(' ', '_')}_{start + offset}.jpg"
+            products.append(product)
+        return products
+
+    def generate(self, count, schema="flipkart"):
+        make_batch = self.flipkart_batch if schema == "flipkart" else self.simple_batch
+        for start in range(0, count, self.batch_size):
+            yield from make_batch(start, min(self.batch_size, count - start))
+
+
+def generate(count, schema="flipkart", **options):
+    # Convenience wrapper returning a list, for fixtures that fit in memory
+    return list(CatalogGenerator(**options).generate(count, schema))
+
+
+def write_catalog(products, file, output_format):
+    written = 0
+    if output_format == "jsonl":
+        for product in products:
+            file.write(json.dumps(product, separators=(",", ":")))
+            file.write("\n")
+            written += 1
+    else:
+        # Stream a JSON array without materializing it
+        file.write("[\n")
+        for product in products:
+            if written:
+                file.write(",\n")
+            file.write(json.dumps(product, separators=(",", ":")))
+            written += 1
+        file.write("\n]\n")
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic product catalog.")
+    parser.add_argument("--count", type=int, default=10000, help="Number of products to generate")
+    parser.add_argument("--schema", choices=["flipkart", "simple"], default="flipkart")
+    parser.add_argument("--format", choices=["json", "jsonl"], help="Output format (default: from extension, else json)")
+    parser.add_argument("--output", default="-", help="Output path, '-' for stdout; a .gz suffix compresses")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--color-skew", type=float, default=1.1, help="Zipf exponent for colours (0 = uniform)")
+    parser.add_argument("--brand-skew", type=float, default=1.2, help="Zipf exponent for brands (0 = uniform)")
+    parser.add_argument("--missing-rate", type=float, default=0.1, help="Probability an optional field is dropped")
+    parser.add_argument("--out-of-stock-rate", type=float, default=0.08)
+    args = parser.parse_args()
+
+    output_format = args.format
+    if output_format is None:
+        output_format = "jsonl" if ".jsonl" in args.output else "json"
+
+    generator = CatalogGenerator(
+        seed=args.seed,
+        color_skew=args.color_skew,
+        brand_skew=args.brand_skew,
+        missing_rate=args.missing_rate,
+        out_of_stock_rate=args.out_of_stock_rate,
+    )
+
+    start = time.perf_counter()
+    products = generator.generate(args.count, args.schema)
+    if args.output == "-":
+        written = write_catalog(products, sys.stdout, output_format)
+    else:
+        opener = gzip.open if args.output.endswith(".gz") else open
+        with opener(args.output, "wt", encoding="utf-8") as file:
+            written = write_catalog(products, file, output_format)
+    elapsed = time.perf_counter() - start
+    print(f"Generated {written} {args.schema} products in {elapsed:.1f}s ({written / elapsed:,.0f}/s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import itertools
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from bulk_ingest import INGEST_MAX_DOCS_PER_S, IngestProgress, ingest
+from instrumentation import counter, gauge, get_logger
+
+# Background ingest jobs for dataInsertion.py.
+#
+# A load is submitted as a job and runs on a small pool of job workers, so
+# the HTTP request returns immediately with a job id and progress is polled
+# from the status endpoint. Waiting jobs sit in a bounded queue; when it is
+# full, submissions are refused instead of piling up. Jobs write with fewer
+# writers than the CLI and are throttled to INGEST_MAX_DOCS_PER_S, which
+# leaves connection pool and primary capacity for search traffic.
+#
+# Environment variables:
+#   INGEST_JOB_WORKERS     jobs running at the same time (default 1)
+#   INGEST_QUEUE_SIZE      jobs allowed to wait (default 4)
+#   INGEST_JOB_WRITERS     concurrent insert_many calls per job (default 2)
+#   INGEST_JOB_PROCESSES   parser processes per job (default 2)
+#   INGEST_JOB_MAX_WRITERS    most writers a request may ask for (default 8)
+#   INGEST_JOB_MAX_PROCESSES  most parser processes a request may ask for (default: CPU count)
+#   INGEST_JOB_HISTORY     finished jobs kept for status queries (default 100)
+#   INGEST_MAX_DOCS_PER_S  write throttle per job (see bulk_ingest.py)
+
+INGEST_JOB_WORKERS = int(os.getenv("INGEST_JOB_WORKERS", "1"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "4"))
+INGEST_JOB_WRITERS = int(os.getenv("INGEST_JOB_WRITERS", "2"))
+INGEST_JOB_PROCESSES = int(os.getenv("INGEST_JOB_PROCESSES", "2"))
+INGEST_JOB_MAX_WRITERS = int(os.getenv("INGEST_JOB_MAX_WRITERS", "8"))
+INGEST_JOB_MAX_PROCESSES = int(os.getenv("INGEST_JOB_MAX_PROCESSES", "0")) or os.cpu_count() or 1
+INGEST_JOB_HISTORY = int(os.getenv("INGEST_JOB_HISTORY", "100"))
+
+INGEST_JOBS = counter("ingest_jobs_total", "Ingest jobs by final status", ("status",))
+INGEST_QUEUE_DEPTH = gauge("ingest_job_queue_depth", "Ingest jobs waiting to run")
+
+logger = get_logger("ingest_jobs")
+
+
+class QueueFull(Exception):
+    pass
+
+
+class IngestJob:
+    def __init__(self, sources, processes, writers, max_docs_per_s):
+        self.id = uuid.uuid4().hex
+        self.sources = sources
+        self.processes = processes
+        self.writers = writers
+        self.max_docs_per_s = max_docs_per_s
+        self.status = "queued"
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.progress = IngestProgress()
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "sources": self.sources,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+            "max_docs_per_s": self.max_docs_per_s or None,
+            "progress": self.progress.snapshot() if self.started_at else None,
+        }
+
+
+class IngestJobQueue:
+    def __init__(self, collection, facet_collection=None, view_collection=None, meta_collection=None,
+                 on_complete=None, workers=INGEST_JOB_WORKERS, max_queued=INGEST_QUEUE_SIZE):
+        self.collection = collection
+        self.meta_collection = meta_collection
+        self.facet_collection = facet_collection
+        self.view_collection = view_collection
+        self.on_complete = on_complete
+        self.workers = workers
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        # Job workers start lazily so importing the app spawns no threads
+        with self._lock:
+            if self._threads:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"ingest-job-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, sources, processes=None, writers=None, max_docs_per_s=None):
+        """
+        Queue a load and return its job. Raises QueueFull when the queue is
+        at capacity.
+        """
+        self.start()
+        job = IngestJob(
+            sources,
+            processes or INGEST_JOB_PROCESSES,
+            writers or INGEST_JOB_WRITERS,
+            INGEST_MAX_DOCS_PER_S if max_docs_per_s is None else max_docs_per_s,
+        )
+        with self._lock:
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                raise QueueFull(f"{self._queue.maxsize} ingest jobs already waiting")
+            self._jobs[job.id] = job
+            self._trim()
+        INGEST_QUEUE_DEPTH.set(self._queue.qsize())
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def retry_after(self):
+        """
+        Seconds a refused client should wait, estimated from the average
+        duration of recent jobs.
+        """
+        with self._lock:
+            durations = [
+                job.finished_at - job.started_at for job in self._jobs.values() if job.finished_at and job.started_at
+            ]
+        average = sum(durations[-10:]) / len(durations[-10:]) if durations else 30
+        return max(1, int(average))
+
+    def _trim(self):
+        # Forget the oldest finished jobs beyond the history limit
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished_at]
+        for job_id in itertools.islice(finished, max(0, len(finished) - INGEST_JOB_HISTORY)):
+            del self._jobs[job_id]
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            INGEST_QUEUE_DEPTH.set(self._queue.qsize())
+            job.status = "running"
+            job.started_at = time.time()
+            job.progress.started = time.monotonic()
+            try:
+                ingest(
+                    job.sources, self.collection, self.facet_collection, self.view_collection,
+                    processes=job.processes, writers=job.writers, progress=job.progress,
+                    max_docs_per_s=job.max_docs_per_s, meta_collection=self.meta_collection,
+                )
+                if self.on_complete:
+                    self.on_complete(job)
+                job.status = "completed_with_errors" if job.progress.failed else "completed"
+            except Exception as e:
+                logger.error("Ingest job %s failed: %s", job.id, e)
+                job.status = "failed"
+                job.error = str(e)
+            finally:
+                job.progress.finished = job.progress.finished or time.monotonic()
+                job.finished_at = time.time()
+                INGEST_JOBS.inc(job.status)
+                self._queue.task_done()
@@ -0,0 +1,281 @@
+import atexit
+import bisect
+import contextvars
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+from fastapi import Request
+from fastapi.responses import PlainTextResponse
+
+# Per-stage timing, Prometheus metrics and non-blocking logging shared by the
+# search apps.
+#
+# Environment variables:
+#   METRICS_ENABLED    "0" disables stage timing, /metrics and Server-Timing (default "1")
+#   SEARCH_LOG_LEVEL   log level for the app loggers, or "off" (default "INFO")
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+SEARCH_LOG_LEVEL = os.getenv("SEARCH_LOG_LEVEL", "INFO").upper()
+
+# Histogram buckets in seconds, from sub-millisecond Mongo reads up to slow LLM calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Stage timings collected for the request currently being handled
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def _escape(value):
+    # Label values as the text exposition format expects them
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues):
+        return self._values.get(labelvalues, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labelvalues, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    def set(self, value, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = value
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labelvalues -> [per-bucket counts..., +Inf count, sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ("le",)
+        with self._lock:
+            for labelvalues, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels(names, labelvalues + (bound,))} {cumulative}")
+                labels = _format_labels(self.labelnames, labelvalues)
+                lines.append(f"{self.name}_sum{labels} {series[-1]}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        # Re-registering a name returns the existing metric so modules can be reloaded
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=()):
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+STAGE_SECONDS = histogram(
+    "search_stage_duration_seconds", "Time spent in each /search stage", ("app", "stage")
+)
+REQUEST_SECONDS = histogram(
+    "http_request_duration_seconds", "End-to-end HTTP request latency", ("app", "path", "status")
+)
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ("app_name", "name", "start")
+
+    def __init__(self, app_name, name):
+        self.app_name = app_name
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        STAGE_SECONDS.observe(elapsed, self.app_name, self.name)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((self.name, elapsed))
+        return False
+
+
+def stage(app_name, name):
+    """
+    Time a block as one /search stage. Records into the stage histogram and
+    the current request's Server-Timing header. A no-op when metrics are
+    disabled.
+    """
+    if not METRICS_ENABLED:
+        return _NULL_STAGE
+    return _Stage(app_name, name)
+
+
+def server_timing_header(timings, total):
+    entries = [f"{name};dur={elapsed * 1000.0:.3f}" for name, elapsed in timings]
+    entries.append(f"total;dur={total * 1000.0:.3f}")
+    return ", ".join(entries)
+
+
+def parse_server_timing(header):
+    # "llm_extraction;dur=12.3, total;dur=15.0" -> {"llm_extraction": 12.3, "total": 15.0}
+    timings = {}
+    for entry in (header or "").split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur" and name:
+                timings[name] = timings.get(name, 0.0) + float(value)
+    return timings
+
+
+def _route_label(request):
+    # The matched route template ("/items/{id}"), so unmatched and parameterized
+    # paths do not add a series each
+    route = request.scope.get("route")
+    return getattr(route, "path", None) or "other"
+
+
+def instrument(app, app_name):
+    """
+    Add a /metrics endpoint and a middleware that records request latency
+    and attaches a Server-Timing header to every response.
+    """
+    if not METRICS_ENABLED:
+        return
+
+    @app.middleware("http")
+    async def server_timing_middleware(request: Request, call_next):
+        timings = []
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+        try:
+            response = await call_next(request)
+        finally:
+            _request_timings.reset(token)
+        total = time.perf_counter() - start
+        REQUEST_SECONDS.observe(total, app_name, _route_label(request), response.status_code)
+        response.headers["Server-Timing"] = server_timing_header(timings, total)
+        return response
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+# ---------------------------------------------------------------------------
+# Non-blocking logging
+# ---------------------------------------------------------------------------
+
+_log_queue = None
+_log_listener = None
+_log_lock = threading.Lock()
+
+
+def _start_log_listener():
+    global _log_queue, _log_listener
+    with _log_lock:
+        if _log_listener is None:
+            _log_queue = queue.SimpleQueue()
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+            _log_listener = logging.handlers.QueueListener(_log_queue, handler)
+            _log_listener.start()
+            atexit.register(_log_listener.stop)
+    return _log_queue
+
+
+def get_logger(name):
+    """
+    Logger whose records are handed to a background thread for formatting
+    and writing, so request handlers never block on stdout.
+    """
+    logger = logging.getLogger(name)
+    if logger.handlers or logger.disabled:
+        return logger
+    if SEARCH_LOG_LEVEL == "OFF":
+        logger.disabled = True
+        return logger
+    logger.setLevel(SEARCH_LOG_LEVEL)
+    logger.addHandler(logging.handlers.QueueHandler(_start_log_listener()))
+    logger.propagate = False
+    return logger
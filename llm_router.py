@@ -0,0 +1,225 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from extractors import Backend, FallbackFilter, create_extractor, register_backend
+from instrumentation import counter, gauge, get_logger, stage
+
+# Latency-budgeted routing across extractor backends.
+#
+# The "routed" backend sends each query to the first healthy backend in
+# LLM_ROUTE. If it has not answered by its own recent p95 latency, the
+# same query is hedged to the next backend and whichever answers first
+# wins. When the budget runs out (or every backend has failed) the local
+# rule-based extractor answers instead, so a slow provider bounds /search
+# latency at the budget rather than at the provider's timeout. Each
+# backend has a circuit breaker that skips it while its failure rate is
+# high. Calls still running after their query gave up on them (lost hedges,
+# budget overruns) keep their executor slot, and when every slot is busy
+# queries go straight to the fallback instead of queueing behind them.
+#
+# Environment variables:
+#   LLM_ROUTE                 comma-separated backends in priority order (default "groq,openai")
+#   LLM_FALLBACK              backend used when the budget is exhausted (default "rules", "" disables)
+#   LLM_LATENCY_BUDGET_MS     total time allowed per query (default 3000)
+#   LLM_HEDGE_PERCENTILE      latency percentile that triggers a hedge (default 95)
+#   LLM_HEDGE_DEFAULT_MS      hedge delay before enough samples exist (default 1500)
+#   LLM_BREAKER_FAILURE_RATE  failure rate that opens a breaker (default 0.5)
+#   LLM_BREAKER_MIN_CALLS     calls in the window before a breaker can open (default 10)
+#   LLM_BREAKER_WINDOW_S      window the failure rate is computed over (default 60)
+#   LLM_BREAKER_COOLDOWN_S    time an open breaker waits before a probe (default 30)
+
+LLM_ROUTE = os.getenv("LLM_ROUTE", "groq,openai")
+LLM_FALLBACK = os.getenv("LLM_FALLBACK", "rules")
+LLM_LATENCY_BUDGET_MS = float(os.getenv("LLM_LATENCY_BUDGET_MS", "3000"))
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_DEFAULT_MS = float(os.getenv("LLM_HEDGE_DEFAULT_MS", "1500"))
+LLM_BREAKER_FAILURE_RATE = float(os.getenv("LLM_BREAKER_FAILURE_RATE", "0.5"))
+LLM_BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "10"))
+LLM_BREAKER_WINDOW_S = float(os.getenv("LLM_BREAKER_WINDOW_S", "60"))
+LLM_BREAKER_COOLDOWN_S = float(os.getenv("LLM_BREAKER_COOLDOWN_S", "30"))
+
+ROUTER_CALLS = counter("llm_router_calls_total", "Backend calls made by the router", ("backend", "outcome"))
+ROUTER_HEDGES = counter("llm_router_hedges_total", "Hedged requests sent to a secondary backend", ("backend",))
+ROUTER_WINS = counter("llm_router_wins_total", "Queries answered, by the backend that answered", ("backend",))
+ROUTER_FALLBACKS = counter("llm_router_fallbacks_total", "Queries answered by the fallback", ("reason",))
+BREAKER_OPEN = gauge("llm_router_breaker_open", "1 while a backend's circuit breaker is open", ("backend",))
+
+logger = get_logger("llm_router")
+
+
+class CircuitBreaker:
+    """
+    Failure-rate breaker over a sliding time window. Open breakers reject
+    calls until the cooldown passes, then let a single probe through;
+    its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, name, failure_rate=LLM_BREAKER_FAILURE_RATE, min_calls=LLM_BREAKER_MIN_CALLS,
+                 window_s=LLM_BREAKER_WINDOW_S, cooldown_s=LLM_BREAKER_COOLDOWN_S):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window_s = window_s
+        self.cooldown_s = cooldown_s
+        self._outcomes = deque()
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _trim(self, now):
+        while self._outcomes and now - self._outcomes[0][0] > self.window_s:
+            self._outcomes.popleft()
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing or time.monotonic() - self._opened_at < self.cooldown_s:
+                return False
+            self._probing = True
+            return True
+
+    def record(self, ok):
+        now = time.monotonic()
+        with self._lock:
+            if self._opened_at is not None and self._probing:
+                self._probing = False
+                if ok:
+                    self._opened_at = None
+                    self._outcomes.clear()
+                    BREAKER_OPEN.set(0, self.name)
+                else:
+                    self._opened_at = now
+                return
+            self._outcomes.append((now, ok))
+            self._trim(now)
+            failures = sum(1 for _, outcome in self._outcomes if not outcome)
+            if (self._opened_at is None and len(self._outcomes) >= self.min_calls
+                    and failures / len(self._outcomes) >= self.failure_rate):
+                self._opened_at = now
+                BREAKER_OPEN.set(1, self.name)
+                logger.warning("Circuit breaker opened for %s (%d/%d failures)", self.name, failures, len(self._outcomes))
+
+
+class LatencyTracker:
+    # Recent successful call latencies, for estimating the hedge point
+    def __init__(self, size=200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct, default):
+        with self._lock:
+            if len(self._samples) < 20:
+                return default
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100.0))]
+
+
+@register_backend("routed")
+class RoutedBackend(Backend):
+    model_backed = True
+
+    def __init__(self, app_name, route=None, fallback=None, budget_ms=None):
+        super().__init__(app_name)
+        names = [name.strip() for name in (route or LLM_ROUTE).split(",") if name.strip()]
+        self.backends = [create_extractor(name, app_name) for name in names]
+        fallback = LLM_FALLBACK if fallback is None else fallback
+        self.fallback = create_extractor(fallback, app_name) if fallback else None
+        self.budget = (budget_ms or LLM_LATENCY_BUDGET_MS) / 1000.0
+        self.breakers = {backend.name: CircuitBreaker(backend.name) for backend in self.backends}
+        self.latencies = {backend.name: LatencyTracker() for backend in self.backends}
+        workers = max(4, 4 * len(self.backends))
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm-router")
+        # Calls submitted but not finished, abandoned hedges included; never more than the executor runs at once
+        self._slots = threading.BoundedSemaphore(workers)
+
+    def extract(self, user_query):
+        return self._route("extract", user_query)
+
+    def generate_filter(self, user_query, prompt):
+        return self._route("generate_filter", user_query, prompt)
+
+    def _call(self, backend, method, args):
+        # Runs on the executor; outcomes feed the breaker and latency tracker even for losing hedges
+        start = time.perf_counter()
+        try:
+            result = getattr(backend, method)(*args)
+        except Exception:
+            self.breakers[backend.name].record(False)
+            ROUTER_CALLS.inc(backend.name, "error")
+            raise
+        self.breakers[backend.name].record(True)
+        self.latencies[backend.name].record(time.perf_counter() - start)
+        ROUTER_CALLS.inc(backend.name, "ok")
+        return result
+
+    def _route(self, method, *args):
+        with stage(self.app_name, "llm_routed"):
+            deadline = time.monotonic() + self.budget
+            candidates = list(self.backends)
+            pending = {}
+            last_error = None
+            saturated = False
+
+            def launch(hedge):
+                # Submit to the next backend whose breaker admits a call; asking the breaker
+                # only here keeps a half-open probe from being claimed by a call never sent
+                nonlocal saturated
+                while candidates:
+                    if not self._slots.acquire(blocking=False):
+                        saturated = True
+                        candidates.clear()
+                        break
+                    backend = candidates.pop(0)
+                    if not self.breakers[backend.name].allow():
+                        self._slots.release()
+                        continue
+                    if hedge:
+                        ROUTER_HEDGES.inc(backend.name)
+                    future = self._executor.submit(self._call, backend, method, args)
+                    future.add_done_callback(lambda _: self._slots.release())
+                    pending[future] = backend
+                    default = LLM_HEDGE_DEFAULT_MS / 1000.0
+                    return time.monotonic() + self.latencies[backend.name].percentile(LLM_HEDGE_PERCENTILE, default)
+                return deadline
+
+            hedge_at = launch(False) if candidates else deadline
+            while pending:
+                now = time.monotonic()
+                if now >= deadline:
+                    break
+                timeout = min(deadline, hedge_at if candidates else deadline) - now
+                done, _ = wait(pending, timeout=max(0.0, timeout), return_when=FIRST_COMPLETED)
+                for future in done:
+                    backend = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        last_error = e
+                        logger.warning("%s failed: %s", backend.name, e)
+                        continue
+                    ROUTER_WINS.inc(backend.name)
+                    return result
+                # Hedge when the in-flight call passes its p95, or fail over right away on errors
+                if candidates and (not pending or time.monotonic() >= hedge_at):
+                    hedge_at = launch(bool(pending))
+
+            if self.fallback is None:
+                if last_error is not None:
+                    raise last_error
+                raise TimeoutError(f"No backend answered within {self.budget * 1000:.0f} ms")
+            reason = ("budget" if pending else "errors" if last_error is not None
+                      else "saturated" if saturated else "no_backend")
+            ROUTER_FALLBACKS.inc(reason)
+            ROUTER_WINS.inc(self.fallback.name)
+            result = getattr(self.fallback, method)(*args)
+            if method == "generate_filter" and not self.fallback.model_backed:
+                result = FallbackFilter(result)
+            return result
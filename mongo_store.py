@@ -0,0 +1,182 @@
+import os
+import threading
+
+# Shared MongoDB data-access layer.
+#
+# Every app gets its collections from here instead of building its own
+# MongoClient at import time. The client is created on first use, so
+# importing an app never touches the network, and all collections share
+# one tuned connection pool per process. Search reads can be routed to
+# secondaries while ingest writes always go to the primary.
+#
+# Environment variables:
+#   MONGO_URI, DATABASE_NAME, COLLECTION_NAME   connection target
+#   MONGO_MAX_POOL_SIZE            max connections per server (default 100)
+#   MONGO_MIN_POOL_SIZE            connections kept open when idle (default 0)
+#   MONGO_MAX_IDLE_TIME_MS         close idle pooled connections after this (default 60000)
+#   MONGO_WAIT_QUEUE_TIMEOUT_MS    max wait for a pooled connection (default 2000)
+#   MONGO_CONNECT_TIMEOUT_MS       TCP connect timeout (default 5000)
+#   MONGO_SERVER_SELECTION_TIMEOUT_MS  time to find a suitable server (default 5000)
+#   MONGO_SOCKET_TIMEOUT_MS        per-operation socket timeout (default 30000)
+#   MONGO_SEARCH_READ_PREFERENCE   primary | primaryPreferred | secondary |
+#                                  secondaryPreferred | nearest (default secondaryPreferred)
+#   MONGO_MAX_STALENESS_SECONDS    max replication lag for secondary reads (default unset)
+#   MONGO_BULK_BATCH_SIZE          documents per bulk write batch (default 1000)
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _int_env(name, default):
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def get_client():
+    """
+    Return the process-wide MongoClient, creating it on first use.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from pymongo import MongoClient
+
+                _client = MongoClient(
+                    os.getenv("MONGO_URI"),
+                    maxPoolSize=_int_env("MONGO_MAX_POOL_SIZE", 100),
+                    minPoolSize=_int_env("MONGO_MIN_POOL_SIZE", 0),
+                    maxIdleTimeMS=_int_env("MONGO_MAX_IDLE_TIME_MS", 60000),
+                    waitQueueTimeoutMS=_int_env("MONGO_WAIT_QUEUE_TIMEOUT_MS", 2000),
+                    connectTimeoutMS=_int_env("MONGO_CONNECT_TIMEOUT_MS", 5000),
+                    serverSelectionTimeoutMS=_int_env("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000),
+                    socketTimeoutMS=_int_env("MONGO_SOCKET_TIMEOUT_MS", 30000),
+                    retryReads=True,
+                    retryWrites=True,
+                    connect=False,  # Defer the first connection to the first operation
+                )
+    return _client
+
+
+def close_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+def get_database():
+    return get_client()[os.getenv("DATABASE_NAME")]
+
+
+def _search_read_preference():
+    from pymongo import read_preferences
+
+    modes = {
+        "primary": read_preferences.Primary,
+        "primarypreferred": read_preferences.PrimaryPreferred,
+        "secondary": read_preferences.Secondary,
+        "secondarypreferred": read_preferences.SecondaryPreferred,
+        "nearest": read_preferences.Nearest,
+    }
+    name = os.getenv("MONGO_SEARCH_READ_PREFERENCE", "secondaryPreferred").lower()
+    mode = modes.get(name)
+    if mode is None:
+        raise ValueError(f"Unknown MONGO_SEARCH_READ_PREFERENCE: {name}")
+    if mode is read_preferences.Primary:
+        return mode()
+    return mode(max_staleness=_int_env("MONGO_MAX_STALENESS_SECONDS", -1))
+
+
+class LazyCollection:
+    """
+    Stand-in for a pymongo Collection that resolves the real collection
+    (and creates the client) on first attribute access.
+    """
+
+    def __init__(self, name, read_only):
+        self._name = name
+        self._read_only = read_only
+        self._collection = None
+
+    def _resolve(self):
+        if self._collection is None:
+            name = self._name or os.getenv("COLLECTION_NAME")
+            if self._read_only:
+                self._collection = get_database().get_collection(
+                    name, read_preference=_search_read_preference()
+                )
+            else:
+                from pymongo import WriteConcern
+                from pymongo.read_preferences import Primary
+
+                self._collection = get_database().get_collection(
+                    name, read_preference=Primary(), write_concern=WriteConcern(w="majority")
+                )
+        return self._collection
+
+    def __getattr__(self, attr):
+        return getattr(self._resolve(), attr)
+
+    def __repr__(self):
+        target = self._name or os.getenv("COLLECTION_NAME")
+        return f"LazyCollection({target!r}, read_only={self._read_only})"
+
+
+def search_collection(name=None):
+    """
+    Collection handle for search traffic. Reads follow
+    MONGO_SEARCH_READ_PREFERENCE so they can be served by secondaries.
+    Defaults to COLLECTION_NAME.
+    """
+    return LazyCollection(name, read_only=True)
+
+
+def write_collection(name=None):
+    """
+    Collection handle for ingest. Reads and writes go to the primary with
+    majority write concern. Defaults to COLLECTION_NAME.
+    """
+    return LazyCollection(name, read_only=False)
+
+
+def _batches(items, batch_size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def insert_many_batched(collection, documents, batch_size=None):
+    """
+    Insert an iterable of documents in unordered batches so large loads
+    stream instead of building one huge request. Returns the inserted count.
+    """
+    batch_size = batch_size or _int_env("MONGO_BULK_BATCH_SIZE", 1000)
+    inserted = 0
+    for batch in _batches(documents, batch_size):
+        result = collection.insert_many(batch, ordered=False)
+        inserted += len(result.inserted_ids)
+    return inserted
+
+
+def bulk_write_batched(collection, operations, batch_size=None):
+    """
+    Apply an iterable of pymongo write operations (UpdateOne, ReplaceOne,
+    ...) in unordered batches. Returns a dict of summed result counts.
+    """
+    batch_size = batch_size or _int_env("MONGO_BULK_BATCH_SIZE", 1000)
+    totals = {"inserted": 0, "matched": 0, "modified": 0, "upserted": 0, "deleted": 0}
+    for batch in _batches(operations, batch_size):
+        result = collection.bulk_write(batch, ordered=False)
+        totals["inserted"] += result.inserted_count
+        totals["matched"] += result.matched_count
+        totals["modified"] += result.modified_count
+        totals["upserted"] += result.upserted_count
+        totals["deleted"] += result.deleted_count
+    return totals
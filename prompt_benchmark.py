@@ -0,0 +1,167 @@
+import argparse
+import json
+import time
+from datetime import datetime, timezone
+
+from benchmark import git_commit, percentile
+from extractors import LLM_TOKENS, LLMBackend, create_extractor, estimate_tokens
+from filter_guard import FilterRejected, guard_filter
+from filter_prompt import PROMPT_PREFIX, filter_prompt
+import llm_router  # Registers the "routed" backend
+
+# Token and accuracy benchmark for the filter-generation prompts.
+#
+# Runs a fixed, labelled query set through one extractor backend once per
+# prompt mode and reports prompt/completion tokens per request and how
+# often the generated filter constrains exactly the expected fields. Token
+# counts are the provider's own usage where it reports one and estimates
+# otherwise. The default "rules" backend ignores the prompt, so it only
+# measures prompt size; pass --backend openai / groq for accuracy numbers.
+#
+# Example:
+#   python prompt_benchmark.py --backend groq --output prompt_bench.json
+
+# (query, fields the filter should constrain), fields as in FIELD_GROUPS
+LABELLED_QUERIES = [
+    ("red shirts", {"item", "color"}),
+    ("blue jeans under 2000", {"item", "color", "price"}),
+    ("black jackets in stock", {"item", "color", "stock"}),
+    ("cotton kurtas", {"item", "details"}),
+    ("t-shirts with at least 50% discount", {"item", "discount"}),
+    ("shirts rated above 4", {"item", "rating"}),
+    ("navy blue track pants under 1500", {"item", "color", "price"}),
+    ("printed hoodies", {"item", "details"}),
+    ("available white socks", {"item", "color", "stock"}),
+    ("shoes below 999", {"item", "price"}),
+    ("green dresses", {"item", "color"}),
+    ("black trousers with 4 star rating", {"item", "color", "rating"}),
+    ("yellow shorts in stock under 800", {"item", "color", "stock", "price"}),
+    ("grey scarf", {"item", "color"}),
+    ("blue striped shirts", {"item", "color", "details"}),
+    ("discounted jackets", {"item", "discount"}),
+    ("Roadster shirts", {"brand", "item"}),
+]
+
+# Fields that answer the same part of a query count as one
+FIELD_GROUPS = {
+    "title": "item",
+    "category": "item",
+    "sub_category": "item",
+    "actual_price": "price",
+    "selling_price": "price",
+    "discount": "discount",
+    "average_rating": "rating",
+    "out_of_stock": "stock",
+    "product_details.Color": "color",
+    "brand": "brand",
+    "seller": "seller",
+}
+
+
+def filter_fields(node):
+    # Normalised set of fields a filter constrains
+    fields = set()
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if not key.startswith("$"):
+                group = FIELD_GROUPS.get(key)
+                if group is None:
+                    group = "details" if key.startswith("product_details.") else key
+                fields.add(group)
+            fields |= filter_fields(value)
+    elif isinstance(node, list):
+        for item in node:
+            fields |= filter_fields(item)
+    return fields
+
+
+def reported_tokens(backend, kind):
+    return LLM_TOKENS.value("prompt-benchmark", backend.name, kind, "reported")
+
+
+def run_mode(backend, mode):
+    prompt_tokens, completion_tokens, latencies = [], [], []
+    exact = valid = errors = 0
+    true_positive = predicted = expected_total = 0
+    variants = set()
+    for query, expected in LABELLED_QUERIES:
+        template, _ = filter_prompt(query, mode)
+        variants.add(template)
+        prompt = template.format(user_query=query)
+        before = (reported_tokens(backend, "prompt"), reported_tokens(backend, "completion"))
+        start = time.perf_counter()
+        try:
+            filter_query, projection = backend.generate_filter(query, template)
+        except Exception as e:
+            print(f"  {query!r}: {e}")
+            errors += 1
+            continue
+        latencies.append((time.perf_counter() - start) * 1000)
+        after = (reported_tokens(backend, "prompt"), reported_tokens(backend, "completion"))
+        if after[0] > before[0]:
+            prompt_tokens.append(after[0] - before[0])
+            completion_tokens.append(after[1] - before[1])
+        else:
+            prompt_tokens.append(estimate_tokens(prompt))
+
+        fields = filter_fields(filter_query)
+        exact += fields == expected
+        true_positive += len(fields & expected)
+        predicted += len(fields)
+        expected_total += len(expected)
+        try:
+            guard_filter(filter_query, projection)
+            valid += 1
+        except FilterRejected:
+            pass
+
+    total = len(LABELLED_QUERIES)
+    return {
+        "queries": total,
+        "errors": errors,
+        "prompt_variants": len(variants),
+        "prompt_tokens_mean": round(sum(prompt_tokens) / len(prompt_tokens), 1) if prompt_tokens else None,
+        "prompt_tokens_p95": percentile(prompt_tokens, 95),
+        "completion_tokens_mean": round(sum(completion_tokens) / len(completion_tokens), 1) if completion_tokens else None,
+        "exact_field_accuracy": round(exact / total, 3),
+        "field_precision": round(true_positive / predicted, 3) if predicted else None,
+        "field_recall": round(true_positive / expected_total, 3),
+        "guard_valid_rate": round(valid / total, 3),
+        "latency_mean_ms": round(sum(latencies) / len(latencies), 1) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare filter prompt size and accuracy per prompt mode.")
+    parser.add_argument("--backend", default="rules", help="Extractor backend to generate filters with")
+    parser.add_argument("--mode", action="append", choices=["full", "compact"], help="Prompt mode (repeatable, default: both)")
+    parser.add_argument("--output", help="Where to write machine-readable results")
+    args = parser.parse_args()
+
+    backend = create_extractor(args.backend, "prompt-benchmark")
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "backend": args.backend,
+            "prompt_sensitive": isinstance(backend, LLMBackend) or args.backend == "routed",
+            "shared_prefix_tokens": estimate_tokens(PROMPT_PREFIX),
+        },
+        "results": {},
+    }
+    for mode in args.mode or ["full", "compact"]:
+        result = report["results"][mode] = run_mode(backend, mode)
+        print(
+            f"{mode}: {result['prompt_tokens_mean']} prompt tokens/request (p95 {result['prompt_tokens_p95']}), "
+            f"exact {result['exact_field_accuracy']}, recall {result['field_recall']}, "
+            f"guard-valid {result['guard_valid_rate']}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from dotenv import load_dotenv
+import os
+from admission import ADMISSION_SEARCH_IN_FLIGHT, AdmissionController, Overloaded, backend_controller
+from extractors import create_extractor
+import llm_router  # Registers the "routed" backend
+from instrumentation import get_logger, instrument, stage
+from mongo_store import search_collection
+
+# Load environment variables
+load_dotenv()
+
+# Pydantic model for product response
+class Product(BaseModel):
+    id: str
+    name: str
+    color: str
+    availability: bool
+    image_url: str
+
+# Pydantic model for search request
+class SearchRequest(BaseModel):
+    query: str
+
+
+# Function to build a search app around one extractor backend
+def create_app(app_name, backend=None, only_available=False):
+    """
+    Build the colour / item-type search app. `backend` names a registered
+    extractor (openai, groq, ollama, rules, routed) and defaults to the
+    EXTRACTOR_BACKEND environment variable. With `only_available`, out of
+    stock products are filtered out. Requests go through admission control
+    (see admission.py), for /search and around the extractor call.
+    """
+    backend = backend or os.getenv("EXTRACTOR_BACKEND", "groq")
+    extractor = create_extractor(backend, app_name)
+    logger = get_logger(app_name)
+
+    # Initialize FastAPI
+    app = FastAPI()
+    instrument(app, app_name)
+
+    # MongoDB collection from the shared data-access layer (connects on first query)
+    app.state.collection = search_collection()
+    app.state.extractor = extractor
+    search_admission = AdmissionController(f"search:{app_name}", ADMISSION_SEARCH_IN_FLIGHT)
+
+    # FastAPI endpoint to search for products
+    @app.post("/search")
+    @app.post("/search/", include_in_schema=False)
+    async def search_product(search_request: SearchRequest, request: Request):
+        client = request.client.host if request.client else "unknown"
+        try:
+            async with search_admission.admit(client):
+                return await admitted_search(search_request, client)
+        except Overloaded as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+    async def admitted_search(search_request, client):
+        query = search_request.query  # Extract the query from the request body
+
+        # Extract details from the query using the configured backend, off the event loop
+        try:
+            async with backend_controller(app.state.extractor.name).admit(client):
+                details = await run_in_threadpool(app.state.extractor.extract, query)
+            colors = details.get("colors", ["red"])  # Default to 'red' if no colors are detected
+            item_types = details.get("item_types") or ["all"]  # Default to 'all' if not detected
+            logger.debug("item type : %s", item_types)
+        except Overloaded:
+            raise
+        except Exception as e:
+            logger.error("%s Error: %s", backend, e)
+            raise HTTPException(status_code=500, detail=f"Error processing query with {backend}: {str(e)}")
+
+        # Query the database
+        if "all" in item_types:
+            # Search for all item types if no specific type is mentioned
+            query = {
+                "color": {"$in": colors}
+            }
+        else:
+            # Search for specific item types using $or with multiple regex conditions
+            query = {
+                "color": {"$in": colors},
+                "$or": [{"name": {"$regex": item_type, "$options": "i"}} for item_type in item_types]
+            }
+        if only_available:
+            query["availability"] = True
+
+        with stage(app_name, "mongo_query"):
+            products = list(app.state.collection.find(query))
+
+        with stage(app_name, "serialization"):
+            product_list = [
+                Product(
+                    id=str(product["_id"]),
+                    name=product["name"],
+                    color=product["color"],
+                    availability=product["availability"],
+                    image_url=product.get("image_url", "")  # Handle missing image_url
+                )
+                for product in products
+            ]
+
+            if not product_list:
+                raise HTTPException(status_code=404, detail="No products found")
+
+            # Format the response in a human-like way
+            response_message = f"I found the following products in {', '.join(colors)}:\n\n"
+            for product in product_list:
+                response_message += f"- **{product.name}** (Color: {product.color}, Availability: {'Available' if product.availability else 'Out of stock'})\n"
+
+        return {"message": response_message, "products": product_list}
+
+    return app
+
+
+# Default app, backend chosen by EXTRACTOR_BACKEND:
+# uvicorn search_app:app
+app = create_app("search-app")
+
+# Run the application
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,262 @@
+import os
+import re
+import statistics
+import threading
+import time
+from collections import OrderedDict
+
+from extractors import COLORS, ITEM_TYPES
+from instrumentation import counter, gauge, get_logger
+
+# Conversational refinement for the complex app's /search.
+#
+# For every session id the app keeps the last filter it searched with and
+# the ids of the products it found, in a bounded store whose entries expire
+# after SESSION_TTL_S of inactivity (least recently used sessions are
+# evicted first). A follow-up such as "only the cheaper ones" or "in blue
+# instead" is parsed with rules instead of the LLM:
+#
+#   narrowing  (cheaper, under/over <price>, in stock, better rated,
+#               discounted) re-reads the cached candidates by _id and
+#               filters them in memory
+#   delta      (in <colour> [instead]) swaps the colour in the stored filter
+#               and re-runs the database query, still without the LLM; when
+#               a colour predicate cannot be removed on its own (inside an
+#               $or), the follow-up is searched afresh instead
+#
+# Anything else is a new search and replaces the session's state.
+#
+# Environment variables:
+#   SESSION_TTL_S       idle seconds before a session is forgotten (default 900)
+#   SESSION_MAX         sessions kept at most (default 10000)
+#   SESSION_CANDIDATES  product ids kept per session (default 100)
+
+SESSION_TTL_S = float(os.getenv("SESSION_TTL_S", "900"))
+SESSION_MAX = int(os.getenv("SESSION_MAX", "10000"))
+SESSION_CANDIDATES = int(os.getenv("SESSION_CANDIDATES", "100"))
+
+# Fields the in-memory refinements read from the candidates
+REFINE_PROJECTION = {"selling_price": 1, "out_of_stock": 1, "average_rating": 1, "discount": 1}
+
+PRICE_UNDER = re.compile(r"\b(?:under|below|less than|within|cheaper than)\s+(?:rs\.?\s*|₹\s*)?(\d[\d,]*)")
+PRICE_OVER = re.compile(r"\b(?:over|above|more than)\s+(?:rs\.?\s*|₹\s*)?(\d[\d,]*)")
+RATING_OVER = re.compile(r"\brat(?:ed|ing)\s+(?:above|over|at least)\s+(\d(?:\.\d)?)")
+CHEAPER = re.compile(r"\b(?:cheaper|cheapest|less expensive|lower price|budget)\b")
+IN_STOCK = re.compile(r"\b(?:in stock|available)\b")
+BETTER_RATED = re.compile(r"\b(?:better|higher|best|top|well)[ -]rated\b")
+DISCOUNTED = re.compile(r"\b(?:discount(?:ed)?|on sale|with offers?)\b")
+COLOR = re.compile(rf"\bin\s+({'|'.join(COLORS)})\b")
+FOLLOW_UP = re.compile(r"\b(?:only|just|instead|those|these|them|ones|that|same)\b")
+ITEM = re.compile(rf"(?<![\w-])(?:{'|'.join(re.escape(item) for item in ITEM_TYPES)})s?\b")
+
+# Filter fields that select a colour, as the LLM writes them and as flattened at ingest (attributes.py)
+COLOR_FIELDS = {"product_details.Color", "color"}
+
+SESSION_SEARCHES = counter("session_searches_total", "Session searches by how they were answered", ("kind",))
+SESSIONS_ACTIVE = gauge("sessions_active", "Search sessions in the refinement store")
+
+logger = get_logger("sessions")
+
+
+def _number(value):
+    digits = re.sub(r"[^\d.]", "", str(value or ""))
+    try:
+        return float(digits)
+    except ValueError:
+        return None
+
+
+class Refinement:
+    """
+    A parsed follow-up: in-memory predicates over candidates, and/or a new
+    colour for the stored filter.
+    """
+
+    def __init__(self, predicates, color=None):
+        self.predicates = predicates
+        self.color = color
+
+    @property
+    def kind(self):
+        return "delta" if self.color else "narrowed"
+
+    def apply(self, products):
+        # Predicates receive the whole candidate list, for relative terms like "cheaper"
+        for predicate in self.predicates:
+            products = predicate(products)
+        return products
+
+
+def _below(limit):
+    return lambda products: [p for p in products if (_number(p.get("selling_price")) or float("inf")) < limit]
+
+
+def _above(limit):
+    return lambda products: [p for p in products if (_number(p.get("selling_price")) or 0) > limit]
+
+
+def _cheaper(products):
+    # Cheaper than the typical candidate
+    prices = [price for price in (_number(p.get("selling_price")) for p in products) if price is not None]
+    return _below(statistics.median(prices))(products) if prices else products
+
+
+def _rated_at_least(minimum):
+    return lambda products: [p for p in products if (_number(p.get("average_rating")) or 0) >= minimum]
+
+
+def _better_rated(products):
+    ratings = [rating for rating in (_number(p.get("average_rating")) for p in products) if rating is not None]
+    return _rated_at_least(statistics.median(ratings))(products) if ratings else products
+
+
+def _in_stock(products):
+    return [p for p in products if not p.get("out_of_stock")]
+
+
+def _discounted(products):
+    return [p for p in products if _number(p.get("discount"))]
+
+
+def parse_refinement(query):
+    """
+    Return a Refinement when the query refines the previous results, or
+    None when it reads as a new search.
+    """
+    text = query.lower()
+    color = COLOR.search(text)
+    if ITEM.search(text) and "instead" not in text:
+        # Names a product type: a new search ("red shirts under 500")
+        return None
+
+    predicates = []
+    match = PRICE_UNDER.search(text)
+    if match:
+        predicates.append(_below(float(match.group(1).replace(",", ""))))
+    elif CHEAPER.search(text):
+        predicates.append(_cheaper)
+    match = PRICE_OVER.search(text)
+    if match:
+        predicates.append(_above(float(match.group(1).replace(",", ""))))
+    match = RATING_OVER.search(text)
+    if match:
+        predicates.append(_rated_at_least(float(match.group(1))))
+    elif BETTER_RATED.search(text):
+        predicates.append(_better_rated)
+    if IN_STOCK.search(text):
+        predicates.append(_in_stock)
+    if DISCOUNTED.search(text):
+        predicates.append(_discounted)
+
+    if not predicates and not color:
+        return None
+    if not predicates and not FOLLOW_UP.search(text) and len(text.split()) > 4:
+        # A longer query that only mentions a colour is more likely a new search
+        return None
+    return Refinement(predicates, color.group(1).capitalize() if color else None)
+
+
+def _mentions_color(value):
+    if isinstance(value, list):
+        return any(_mentions_color(item) for item in value)
+    if not isinstance(value, dict):
+        return False
+    if value.get("k") == "Color":
+        return True
+    return any(field in COLOR_FIELDS or field == "Color" or _mentions_color(item) for field, item in value.items())
+
+
+def _strip_color(filter_query):
+    stripped = {}
+    for field, value in filter_query.items():
+        match = value.get("$elemMatch") if isinstance(value, dict) and set(value) == {"$elemMatch"} else None
+        if field in COLOR_FIELDS:
+            continue
+        if field == "product_details" and isinstance(match, dict):
+            # {"$elemMatch": {"Color": ...}}, possibly next to other keys
+            match = {key: item for key, item in match.items() if key != "Color"}
+            if match:
+                stripped[field] = {"$elemMatch": match}
+        elif field == "attrs" and isinstance(match, dict) and match.get("k") == "Color":
+            continue
+        elif field == "$and" and isinstance(value, list):
+            branches = [_strip_color(branch) if isinstance(branch, dict) else branch for branch in value]
+            branches = [branch for branch in branches if branch != {}]
+            if branches:
+                stripped[field] = branches
+        else:
+            stripped[field] = value
+    return stripped
+
+
+def replace_color(filter_query, color):
+    """
+    Return a copy of a stored filter selecting `color` instead of its own
+    colour predicates, or None when one of them cannot be removed without
+    changing the rest of the filter (inside $or / $nor or a negation).
+    """
+    stripped = _strip_color(filter_query)
+    if _mentions_color(stripped):
+        return None
+    stripped["product_details.Color"] = color
+    return stripped
+
+
+class SearchSession:
+    def __init__(self, filter_query, projection, candidate_ids):
+        self.filter = filter_query
+        self.projection = projection
+        # Views store ids as strings while older products have ObjectIds; keep one form
+        self.candidate_ids = [str(product_id) for product_id in candidate_ids[:SESSION_CANDIDATES]]
+        self.touched = time.monotonic()
+
+    def candidate_filter(self):
+        """
+        Filter re-reading the candidates, matching string and ObjectId _ids.
+        """
+        from bson import ObjectId
+
+        ids = list(self.candidate_ids)
+        ids += [ObjectId(product_id) for product_id in self.candidate_ids if ObjectId.is_valid(product_id)]
+        return {"_id": {"$in": ids}}
+
+
+class SessionStore:
+    """
+    Bounded LRU of search sessions with idle expiry.
+    """
+
+    def __init__(self, max_sessions=SESSION_MAX, ttl=SESSION_TTL_S):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if time.monotonic() - session.touched > self.ttl:
+                del self._sessions[session_id]
+                SESSIONS_ACTIVE.set(len(self._sessions))
+                return None
+            session.touched = time.monotonic()
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def put(self, session_id, filter_query, projection, candidate_ids):
+        with self._lock:
+            self._sessions[session_id] = SearchSession(filter_query, projection, candidate_ids)
+            self._sessions.move_to_end(session_id)
+            self._expire()
+            SESSIONS_ACTIVE.set(len(self._sessions))
+
+    def _expire(self):
+        # Oldest first: drop idle sessions, then whatever exceeds the bound
+        now = time.monotonic()
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.touched <= self.ttl and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[session_id]
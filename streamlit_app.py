@@ -1,3 +1,5 @@
+import uuid
+
 import streamlit as st
 import requests
 
@@ -102,6 +104,9 @@ st.markdown("<div class='sticky-title'><h1>Product Search Chat</h1></div>", unsa
 # Initialize session state for chat history
 if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
+# Session id that lets the backend refine the previous results ("only the cheaper ones")
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
 
 # Chat history container
 with st.container():
@@ -141,7 +146,25 @@ with st.container():
 
 # Sticky input container
 st.markdown("<div class='sticky-input'>", unsafe_allow_html=True)
-user_query = st.text_input("Enter your query (e.g., 'Show me red and black shirts'):", key="user_input", value="")
+user_query = st.text_input("Enter your query (e.g., 'Show me red and black shirts'):", key="user_input")
+
+# Suggestions for what has been typed so far; picking one replaces the query
+def use_suggestion(text):
+    st.session_state.user_input = text
+
+if user_query.strip():
+    try:
+        suggestions = requests.get(
+            f"{FASTAPI_URL}/autocomplete", params={"q": user_query, "size": 5}, timeout=0.5
+        ).json().get("suggestions", [])
+    except (requests.RequestException, ValueError):
+        suggestions = []  # Suggestions are optional; search still works without them
+    suggestions = [s for s in suggestions if s["text"].lower() != user_query.strip().lower()]
+    if suggestions:
+        columns = st.columns(len(suggestions))
+        for column, suggestion in zip(columns, suggestions):
+            column.button(suggestion["text"], key=f"suggestion-{suggestion['kind']}-{suggestion['text']}",
+                          on_click=use_suggestion, args=(suggestion["text"],))
 if st.button("Send"):
     if user_query.strip():
         # Add user query to chat history
@@ -153,7 +176,7 @@ if st.button("Send"):
                 # Send the query to the FastAPI backend
                 response = requests.post(
                     f"{FASTAPI_URL}/search",
-                    json={"query": user_query}
+                    json={"query": user_query, "session_id": st.session_state.session_id}
                 )
                 if response.status_code == 200:
                     results = response.json()
@@ -0,0 +1,173 @@
+import json
+import os
+import threading
+from typing import Any, Dict, List
+
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, field_validator
+
+from instrumentation import counter
+
+# Typed, schema-constrained LLM responses.
+#
+# Model-backed extractors ask the provider for JSON output (JSON mode for
+# OpenAI and Groq, --format json for ollama) and validate the reply against
+# a pydantic model in one pass: model_validate_json parses and checks types
+# together, with no regex search for the object and no second json.loads.
+# Replies that only fail because of text around the object (markdown
+# fences, a leading sentence) are repaired locally by decoding the first
+# JSON object in them.
+#
+# A reply that still does not validate is retried with the validation
+# error appended to the prompt, at most STRUCTURED_RETRIES times per
+# request; a request still without a valid reply is answered by the
+# rule-based extractor. Retries also draw from a per-backend budget that refills by
+# STRUCTURED_RETRY_RATIO per first attempt, so a provider that starts
+# returning garbage for everyone costs that much extra load at most,
+# rather than every request being sent twice.
+#
+# Environment variables:
+#   STRUCTURED_OUTPUT       request provider JSON output (default 1; 0 also
+#                           keeps the line-based colour / item-type format)
+#   STRUCTURED_RETRIES      re-asks per request after an invalid reply (default 1)
+#   STRUCTURED_RETRY_RATIO  retries allowed per first attempt, across requests (default 0.1)
+
+STRUCTURED_OUTPUT = os.getenv("STRUCTURED_OUTPUT", "1") == "1"
+STRUCTURED_RETRIES = int(os.getenv("STRUCTURED_RETRIES", "1"))
+STRUCTURED_RETRY_RATIO = float(os.getenv("STRUCTURED_RETRY_RATIO", "0.1"))
+
+# Retries the budget holds when full, so a quiet backend can still retry a burst of failures
+RETRY_BUDGET_RESERVE = 10
+# Characters of the validation error quoted back to the model
+REPAIR_ERROR_CHARS = 300
+
+STRUCTURED_PARSES = counter(
+    "llm_structured_parses_total", "LLM responses by validation result", ("app", "backend", "kind", "result")
+)
+STRUCTURED_RETRIES_TOTAL = counter(
+    "llm_structured_retries_total", "LLM calls repeated after an invalid response", ("app", "backend", "kind")
+)
+STRUCTURED_FAILURES = counter(
+    "llm_structured_failures_total", "Requests left without a valid LLM response", ("app", "backend", "kind", "reason")
+)
+
+
+class StructuredOutputError(ValueError):
+    pass
+
+
+class Extraction(BaseModel):
+    """
+    Colour / item-type details for the simple search app.
+    """
+
+    model_config = ConfigDict(extra="ignore")
+
+    colors: List[str] = Field(default_factory=list)
+    item_types: List[str] = Field(default_factory=list)
+
+    @field_validator("colors", "item_types", mode="before")
+    @classmethod
+    def _normalize(cls, value):
+        # Models sometimes answer with one comma-separated string
+        if isinstance(value, str):
+            value = value.split(",")
+        if isinstance(value, list):
+            return [item.strip().lower() for item in value if isinstance(item, str) and item.strip()]
+        return value
+
+
+class FilterQuery(BaseModel):
+    """
+    MongoDB filter and projection for the Flipkart catalog. Field and
+    operator whitelisting, and dropping projection values other than
+    inclusions, are left to filter_guard.
+    """
+
+    model_config = ConfigDict(extra="ignore")
+
+    filter: Dict[str, Any] = Field(default_factory=dict)
+    projection: Dict[str, Any] = Field(default_factory=dict)
+
+    @field_validator("filter")
+    @classmethod
+    def _drop_cursor_options(cls, value):
+        # Sorting and limits are applied by the app, not the filter
+        value.pop("$limit", None)
+        value.pop("$sort", None)
+        return value
+
+
+def _first_object(text):
+    # Decode the first JSON object in text that has prose or code fences around it
+    decoder = json.JSONDecoder()
+    start = text.find("{")
+    while start != -1:
+        try:
+            value, _ = decoder.raw_decode(text, start)
+        except json.JSONDecodeError:
+            start = text.find("{", start + 1)
+            continue
+        if isinstance(value, dict):
+            return value
+        start = text.find("{", start + 1)
+    raise StructuredOutputError("No JSON object found in the response")
+
+
+def _describe(error):
+    # One line per problem, without pydantic's documentation links
+    return "; ".join(
+        f"{'.'.join(str(part) for part in problem['loc']) or 'response'}: {problem['msg']}"
+        for problem in error.errors(include_url=False)
+    )
+
+
+def parse_structured(model, response_text):
+    """
+    Validate a response against a pydantic model. Returns (instance,
+    result) with result "valid" or "repaired"; raises StructuredOutputError.
+    """
+    try:
+        return model.model_validate_json(response_text), "valid"
+    except ValidationError as e:
+        error = e
+    try:
+        return model.model_validate(_first_object(response_text.replace("\\_", "_"))), "repaired"
+    except ValidationError as e:
+        error = e
+    except StructuredOutputError:
+        pass
+    raise StructuredOutputError(f"Invalid {model.__name__} response: {_describe(error)}")
+
+
+def repair_prompt(prompt, error):
+    """
+    The prompt for a retry: the original one, plus why the last reply was
+    rejected.
+    """
+    return (
+        f"{prompt}\n\nYour previous reply was rejected: {str(error)[:REPAIR_ERROR_CHARS]}\n"
+        "Reply again with the JSON object only."
+    )
+
+
+class RetryBudget:
+    """
+    Token bucket limiting retries to a share of first attempts.
+    """
+
+    def __init__(self, ratio=STRUCTURED_RETRY_RATIO, reserve=RETRY_BUDGET_RESERVE):
+        self.ratio = ratio
+        self.reserve = reserve
+        self.tokens = float(reserve)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.reserve, self.tokens + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
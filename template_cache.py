@@ -0,0 +1,277 @@
+import copy
+import json
+import os
+import re
+import threading
+
+from instrumentation import counter, get_logger
+
+# Parameterized query-template cache for LLM filter generation.
+#
+# Most generated filters share a handful of shapes that differ only in
+# literals ("<brand> shirts under <number>"). After a successful search the
+# query is reduced to a shape key by replacing recognised entities (numbers
+# and values previously seen in generated filters) with slot tokens, and the
+# filter is stored with those literals replaced by slots. A later query
+# with the same shape reuses the template with its own values and skips the
+# LLM call. The most-used templates are persisted and loaded at startup.
+#
+# Recognised values are found with one compiled alternation over the whole
+# vocabulary (longest terms first), rebuilt only when the vocabulary grows,
+# and the vocabulary itself is capped.
+#
+# Environment variables:
+#   TEMPLATE_CACHE_PATH       file templates are saved to and loaded from (default "query_templates.json")
+#   TEMPLATE_CACHE_SIZE       templates kept at most (default 5000)
+#   TEMPLATE_CACHE_WARM       templates pre-warmed at startup (default 500)
+#   TEMPLATE_VOCABULARY_SIZE  recognised values kept at most (default 5000)
+
+TEMPLATE_CACHE_PATH = os.getenv("TEMPLATE_CACHE_PATH", "query_templates.json")
+TEMPLATE_CACHE_SIZE = int(os.getenv("TEMPLATE_CACHE_SIZE", "5000"))
+TEMPLATE_CACHE_WARM = int(os.getenv("TEMPLATE_CACHE_WARM", "500"))
+TEMPLATE_VOCABULARY_SIZE = int(os.getenv("TEMPLATE_VOCABULARY_SIZE", "5000"))
+
+# Words that carry no meaning for the filter shape
+STOPWORDS = {
+    "a", "an", "the", "me", "show", "find", "get", "give", "i", "want", "need",
+    "looking", "look", "for", "some", "any", "please", "can", "you", "to", "see",
+    "all", "list", "search", "display", "with", "of",
+}
+
+NUMBER_PATTERN = re.compile(r"\d[\d,]*(?:\.\d+)?")
+TOKEN_PATTERN = re.compile(r"<[^>]+>|[a-z0-9]+(?:[-'][a-z0-9]+)*")
+
+TEMPLATE_LOOKUPS = counter("template_cache_lookups_total", "Template cache lookups", ("result",))
+TEMPLATE_LEARNED = counter("template_cache_learned_total", "Templates learned from LLM filters")
+TEMPLATE_TERMS_DROPPED = counter("template_cache_terms_dropped_total", "Values not learned because the vocabulary is full")
+
+logger = get_logger("template_cache")
+
+
+def _digits(value):
+    return str(value).replace(",", "")
+
+
+def _is_number(value):
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, (int, float)):
+        return True
+    return isinstance(value, str) and bool(re.fullmatch(r"\d[\d,]*(?:\.\d+)?", value.strip()))
+
+
+def _term_pattern(term):
+    # Whole-word match that also accepts simple plurals ("shirt" -> "shirts")
+    return re.compile(rf"(?<![a-z0-9]){re.escape(term)}(?:s|es)?(?![a-z0-9])")
+
+
+def _walk_literals(node, path=""):
+    # Yield (field, literal) for every leaf value in a filter document
+    if isinstance(node, dict):
+        for key, value in node.items():
+            field = path if key.startswith("$") else key
+            yield from _walk_literals(value, field)
+    elif isinstance(node, list):
+        for item in node:
+            yield from _walk_literals(item, path)
+    elif path and not isinstance(node, bool):
+        yield path, node
+
+
+class QueryTemplateCache:
+    def __init__(self, max_templates=TEMPLATE_CACHE_SIZE, max_terms=TEMPLATE_VOCABULARY_SIZE):
+        self.max_templates = max_templates
+        self.max_terms = max_terms
+        # shape key -> {"filter", "projection", "hits"}
+        self.templates = {}
+        # field -> {lowercase term: canonical value as the LLM wrote it}
+        self.vocabulary = {}
+        self._terms = None  # term -> field, with the alternation matching any term; None when stale
+        self._terms_pattern = None
+        self._lock = threading.Lock()
+
+    def _term_matcher(self):
+        # A term learned for several fields is slotted as the first field by name, as before
+        if self._terms is None:
+            terms = {}
+            for field in sorted(self.vocabulary):
+                for term in self.vocabulary[field]:
+                    terms.setdefault(term, field)
+            self._terms = terms
+            # Longest terms first so "navy blue" wins over "blue"
+            alternation = "|".join(re.escape(term) for term in sorted(terms, key=lambda term: (-len(term), term)))
+            self._terms_pattern = (
+                re.compile(rf"(?<![a-z0-9])({alternation})(?:s|es)?(?![a-z0-9])") if terms else None
+            )
+        return self._terms, self._terms_pattern
+
+    # -- entity extraction -------------------------------------------------
+
+    def _extract(self, query):
+        """
+        Return (shape key, entities) for a query. Entities map slot names
+        such as "brand:0" or "number:1" to the literal they stand for.
+        """
+        text = query.lower()
+        entities = {}
+        spans = []
+
+        for index, match in enumerate(NUMBER_PATTERN.finditer(text)):
+            entities[f"number:{index}"] = match.group(0)
+            spans.append((match.start(), match.end(), f"<number:{index}>"))
+
+        terms, pattern = self._term_matcher()
+        counts = {}
+        for match in pattern.finditer(text) if pattern else ():
+            if any(start < match.end() and match.start() < end for start, end, _ in spans):
+                continue
+            term = match.group(1)
+            field = terms[term]
+            index = counts.get(field, 0)
+            counts[field] = index + 1
+            slot = f"{field}:{index}"
+            entities[slot] = self.vocabulary[field][term]
+            spans.append((match.start(), match.end(), f"<{slot}>"))
+
+        # Rebuild the query with entities replaced by slot tokens
+        pieces, position = [], 0
+        for start, end, token in sorted(spans):
+            pieces.append(text[position:start])
+            pieces.append(f" {token} ")
+            position = end
+        pieces.append(text[position:])
+        tokens = [t for t in TOKEN_PATTERN.findall("".join(pieces)) if t not in STOPWORDS]
+        return " ".join(tokens), entities
+
+    # -- templating --------------------------------------------------------
+
+    def _slot_literals(self, node, field, entities):
+        # Replace literals that came from the query with {"$slot": name} markers
+        if isinstance(node, dict):
+            return {
+                key: self._slot_literals(value, field if key.startswith("$") else key, entities)
+                for key, value in node.items()
+            }
+        if isinstance(node, list):
+            return [self._slot_literals(item, field, entities) for item in node]
+        if isinstance(node, bool) or node is None:
+            return node
+        if _is_number(node):
+            for slot, value in entities.items():
+                if slot.startswith("number:") and _digits(value) == _digits(node):
+                    kind = "int" if isinstance(node, int) else "float" if isinstance(node, float) else "str"
+                    return {"$slot": slot, "as": kind}
+            return node
+        if isinstance(node, str):
+            for slot, value in entities.items():
+                if slot.startswith(f"{field}:") and value.lower() == node.lower():
+                    return {"$slot": slot}
+        return node
+
+    def _fill_slots(self, node, entities):
+        if isinstance(node, dict):
+            if "$slot" in node:
+                value = entities[node["$slot"]]
+                kind = node.get("as")
+                if kind == "int":
+                    return int(float(_digits(value)))
+                if kind == "float":
+                    return float(_digits(value))
+                if kind == "str":
+                    return _digits(value)
+                return value
+            return {key: self._fill_slots(value, entities) for key, value in node.items()}
+        if isinstance(node, list):
+            return [self._fill_slots(item, entities) for item in node]
+        return node
+
+    def _slots_in(self, node):
+        if isinstance(node, dict):
+            if "$slot" in node:
+                return {node["$slot"]}
+            return set().union(*(self._slots_in(v) for v in node.values())) if node else set()
+        if isinstance(node, list):
+            return set().union(*(self._slots_in(v) for v in node)) if node else set()
+        return set()
+
+    def lookup(self, query):
+        """
+        Return (filter, projection) for a query matching a known template,
+        or None.
+        """
+        with self._lock:
+            key, entities = self._extract(query)
+            template = self.templates.get(key)
+            if template is None or not self._slots_in(template["filter"]) <= set(entities):
+                TEMPLATE_LOOKUPS.inc("miss")
+                return None
+            template["hits"] += 1
+            TEMPLATE_LOOKUPS.inc("hit")
+            return self._fill_slots(template["filter"], entities), copy.deepcopy(template["projection"])
+
+    def learn(self, query, filter_query, projection):
+        """
+        Record the filter the LLM generated for a query as a template for
+        every query of the same shape.
+        """
+        with self._lock:
+            # Remember string literals the query mentions so future queries can be slotted
+            text = query.lower()
+            for field, literal in _walk_literals(filter_query):
+                if isinstance(literal, str) and not _is_number(literal) and len(literal) > 1:
+                    term = literal.lower()
+                    if term in self.vocabulary.get(field, ()) or not _term_pattern(term).search(text):
+                        continue
+                    if sum(len(words) for words in self.vocabulary.values()) >= self.max_terms:
+                        TEMPLATE_TERMS_DROPPED.inc()
+                        continue
+                    self.vocabulary.setdefault(field, {})[term] = literal
+                    self._terms = None
+
+            key, entities = self._extract(query)
+            if key in self.templates:
+                return
+            if len(self.templates) >= self.max_templates:
+                # Evict the least used template
+                coldest = min(self.templates, key=lambda k: self.templates[k]["hits"])
+                del self.templates[coldest]
+            self.templates[key] = {
+                "filter": self._slot_literals(copy.deepcopy(filter_query), "", entities),
+                "projection": copy.deepcopy(projection),
+                "hits": 0,
+            }
+            TEMPLATE_LEARNED.inc()
+            logger.debug("Learned query template: %s", key)
+
+    # -- persistence -------------------------------------------------------
+
+    def save(self, path=TEMPLATE_CACHE_PATH):
+        with self._lock:
+            state = {"templates": self.templates, "vocabulary": self.vocabulary}
+            data = json.dumps(state)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=TEMPLATE_CACHE_PATH, warm=TEMPLATE_CACHE_WARM):
+        """
+        Create a cache pre-warmed with the `warm` most used templates from a
+        previous run, or an empty cache if there is no saved state.
+        """
+        cache = cls()
+        if not os.path.exists(path):
+            return cache
+        try:
+            with open(path, "r") as file:
+                state = json.load(file)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error("Ignoring unreadable template cache %s: %s", path, e)
+            return cache
+        ranked = sorted(state.get("templates", {}).items(), key=lambda item: -item[1].get("hits", 0))
+        cache.templates = dict(ranked[:warm])
+        cache.vocabulary = state.get("vocabulary", {})
+        cache._terms = None
+        logger.info("Pre-warmed %d query templates from %s", len(cache.templates), path)
+        return cache
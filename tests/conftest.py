@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The modules live at the repository root, next to this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep the apps' background log writer quiet during tests
+os.environ.setdefault("SEARCH_LOG_LEVEL", "off")
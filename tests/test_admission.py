@@ -0,0 +1,146 @@
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, Overloaded
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def settle():
+    # Let queued acquire() calls reach their wait
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_admits_up_to_the_in_flight_budget():
+    async def scenario():
+        controller = AdmissionController("test", 2, slo_ms=1000)
+        await controller.acquire("a")
+        await controller.acquire("b")
+        assert controller.in_flight == 2
+        waiter = asyncio.create_task(controller.acquire("c"))
+        await settle()
+        assert not waiter.done()
+        controller.release()
+        await waiter
+        assert controller.in_flight == 2
+
+    run(scenario())
+
+
+def test_waiting_clients_are_served_round_robin():
+    async def scenario():
+        controller = AdmissionController("test", 1, client_queue=4, slo_ms=10000)
+        await controller.acquire("holder")
+        order = []
+
+        async def request(client):
+            await controller.acquire(client)
+            order.append(client)
+
+        tasks = [asyncio.create_task(request(client)) for client in ("a", "a", "a", "b")]
+        await settle()
+        for _ in tasks:
+            controller.release()
+            await settle()
+        await asyncio.gather(*tasks)
+        assert order == ["a", "b", "a", "a"]
+
+    run(scenario())
+
+
+def test_priority_requests_go_first():
+    async def scenario():
+        controller = AdmissionController("test", 1, slo_ms=10000)
+        await controller.acquire("holder")
+        order = []
+
+        async def request(client, priority):
+            await controller.acquire(client, priority)
+            order.append(client)
+
+        tasks = [asyncio.create_task(request("normal", False)), asyncio.create_task(request("cached", True))]
+        await settle()
+        for _ in tasks:
+            controller.release()
+            await settle()
+        await asyncio.gather(*tasks)
+        assert order == ["cached", "normal"]
+
+    run(scenario())
+
+
+def test_client_queue_limit_answers_429():
+    async def scenario():
+        controller = AdmissionController("test", 1, client_queue=1, slo_ms=10000)
+        await controller.acquire("holder")
+        waiting = asyncio.create_task(controller.acquire("a"))
+        await settle()
+        with pytest.raises(Overloaded) as excinfo:
+            await controller.acquire("a")
+        assert excinfo.value.status_code == 429
+        assert excinfo.value.retry_after >= 1
+        # Other clients still get a place in the queue
+        other = asyncio.create_task(controller.acquire("b"))
+        await settle()
+        assert not other.done()
+        waiting.cancel()
+        other.cancel()
+        await asyncio.gather(waiting, other, return_exceptions=True)
+
+    run(scenario())
+
+
+def test_expected_wait_past_the_slo_answers_503():
+    async def scenario():
+        controller = AdmissionController("test", 1, slo_ms=100)
+        controller.hold_s = 1.0
+        await controller.acquire("holder")
+        with pytest.raises(Overloaded) as excinfo:
+            await controller.acquire("a")
+        assert excinfo.value.status_code == 503
+
+    run(scenario())
+
+
+def test_wait_that_overruns_the_slo_is_dropped():
+    async def scenario():
+        controller = AdmissionController("test", 1, slo_ms=50)
+        await controller.acquire("holder")
+        with pytest.raises(Overloaded) as excinfo:
+            await controller.acquire("a")
+        assert excinfo.value.status_code == 503
+        assert controller._waiting == 0
+        assert not controller._clients
+
+    run(scenario())
+
+
+def test_admit_releases_the_slot_and_learns_hold_time():
+    async def scenario():
+        controller = AdmissionController("test", 1, slo_ms=1000)
+        async with controller.admit("a"):
+            assert controller.in_flight == 1
+            await asyncio.sleep(0.01)
+        assert controller.in_flight == 0
+        assert controller.hold_s >= 0.01
+
+    run(scenario())
+
+
+def test_cancelled_waiter_gives_its_place_back():
+    async def scenario():
+        controller = AdmissionController("test", 1, slo_ms=10000)
+        await controller.acquire("holder")
+        waiter = asyncio.create_task(controller.acquire("a"))
+        await settle()
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert controller._waiting == 0
+        controller.release()
+        assert controller.in_flight == 0
+
+    run(scenario())
@@ -0,0 +1,64 @@
+import pytest
+
+from attributes import attribute_filter, flatten_attributes, is_attribute_predicate
+from benchmark import InMemoryCollection
+from filter_guard import FIND_HARD_LIMIT, guard_filter
+
+RED = {"$elemMatch": {"k": "Color", "v": "Red"}}
+
+
+def test_flatten_attributes():
+    product = flatten_attributes({"product_details": [
+        {"Fabric": " Cotton "}, {"Color": "Red"}, {"Style Code": "AB1"}, {"Pockets": ""}, {"Sizes": ["S"]}, "junk",
+    ]})
+    assert product["attrs"] == [{"k": "Fabric", "v": "Cotton"}, {"k": "Color", "v": "Red"}, {"k": "Style_Code", "v": "AB1"}]
+    assert product["color"] == "Red"
+    assert flatten_attributes({})["attrs"] == []
+
+
+@pytest.mark.parametrize("field, condition", [
+    ("product_details.Color", "Red"),
+    ("product_details.Color", {"$in": ["Red", "Blue"]}),
+    ("product_details", {"$elemMatch": {"Color": "Red"}}),
+])
+def test_positive_predicates_move_onto_attrs(field, condition):
+    assert is_attribute_predicate(field, condition)
+
+
+@pytest.mark.parametrize("field, condition", [
+    ("product_details.Color", {"$ne": "Red"}),
+    ("product_details.Color", {"$nin": ["Red"]}),
+    ("product_details", {"$elemMatch": {"Color": "Red", "Fabric": "Cotton"}}),
+    ("product_details", {"$elemMatch": {"Color": {"$ne": "Red"}}}),
+    ("brand", "Nike"),
+])
+def test_other_predicates_stay(field, condition):
+    assert not is_attribute_predicate(field, condition)
+    assert attribute_filter({field: condition}) == {field: condition}
+
+
+def test_rewrite_keeps_unflattened_products_matching():
+    rewritten = attribute_filter({"brand": "Nike", "product_details": {"$elemMatch": {"Color": "Red"}}})
+    assert rewritten == {"brand": "Nike", "$or": [{"attrs": RED}, {"attrs.k": None, "product_details.Color": "Red"}]}
+
+    collection = InMemoryCollection()
+    collection.insert_many([
+        flatten_attributes({"_id": 1, "brand": "Nike", "product_details": [{"Color": "Red"}]}),
+        {"_id": 2, "brand": "Nike", "product_details": [{"Color": "Red"}]},  # Not backfilled yet
+        flatten_attributes({"_id": 3, "brand": "Nike", "product_details": [{"Color": "Blue"}]}),
+    ])
+    assert [doc["_id"] for doc in collection.find(rewritten)] == [1, 2]
+
+
+def test_several_attributes_become_one_clause_each():
+    rewritten = attribute_filter({"product_details.Color": "Red", "product_details.Fabric": "Cotton"})
+    assert [clause["$or"][0] for clause in rewritten["$and"]] == [
+        {"attrs": RED}, {"attrs": {"$elemMatch": {"k": "Fabric", "v": "Cotton"}}},
+    ]
+
+
+def test_guard_plans_elem_match_by_whether_it_is_rewritten():
+    guarded, _, plan, limit = guard_filter({"product_details": {"$elemMatch": {"Color": "Red"}}})
+    assert "$or" in guarded and (plan, limit) == ("index", FIND_HARD_LIMIT)
+    guarded, _, plan, _ = guard_filter({"product_details": {"$elemMatch": {"Color": "Red", "Fabric": "Cotton"}}})
+    assert "product_details" in guarded and plan == "scan"
@@ -0,0 +1,71 @@
+from autocomplete import AutocompleteIndex
+from catalog_snapshot import CatalogState
+from generate_catalog import generate
+
+
+def state_with(products):
+    state = CatalogState()
+    for product in products:
+        state.add(product)
+    return state
+
+
+def texts(suggestions):
+    return [(s["kind"], s["text"]) for s in suggestions]
+
+
+def test_not_ready_until_synced():
+    index = AutocompleteIndex()
+    assert not index.ready and index.suggest("shirt") == []
+    index.sync(state_with([]))
+    assert index.ready
+
+
+def test_suggestions_rank_by_popularity_and_rating():
+    index = AutocompleteIndex()
+    index.sync(state_with([
+        {"_id": "1", "title": "Nike Shirt", "brand": "Nike", "average_rating": "4.0"},
+        {"_id": "2", "title": "Nike Shirt", "brand": "Nike", "average_rating": "5.0"},
+        {"_id": "3", "title": "Nimble Socks", "brand": "Nimble", "average_rating": "5.0"},
+    ]))
+    suggestions = index.suggest("  NI ", size=10)
+    assert texts(suggestions)[:2] == [("brand", "Nike"), ("title", "Nike Shirt")]
+    assert suggestions[0]["score"] == round(2 * (0.5 + 4.5 / 10), 2)
+    assert {text for _, text in texts(suggestions)} == {"Nike", "Nike Shirt", "Nimble", "Nimble Socks"}
+    assert index.suggest("ni", size=1) == suggestions[:1]
+    assert index.suggest("zz") == []
+
+
+def test_top_k_matches_a_brute_force_ranking():
+    index = AutocompleteIndex()
+    index.sync(state_with(generate(2000, seed=5)))
+    for prefix in ("s", "solid", "n", "cl", "p"):
+        suggestions = index.suggest(prefix, size=8)
+        every = {s["text"]: s["score"] for s in index.suggest(prefix, size=100000)}
+        assert sorted((s["score"] for s in suggestions), reverse=True) == [s["score"] for s in suggestions]
+        assert [s["score"] for s in suggestions] == sorted(every.values(), reverse=True)[:8]
+
+
+def test_new_rows_go_to_the_delta_until_it_is_rebuilt():
+    state = state_with([{"_id": "1", "title": "Red Shirt", "brand": "Nike"}])
+    index = AutocompleteIndex(delta_max=2)
+    index.sync(state)
+    state.add({"_id": "2", "title": "Red Scarf"})
+    assert index.sync(state) == 1
+    assert index._delta and sorted(texts(index.suggest("red"))) == [("title", "Red Scarf"), ("title", "Red Shirt")]
+
+    state.add({"_id": "3", "title": "Red Socks", "brand": "Puma"})
+    index.sync(state)
+    assert index._delta == []
+    assert len(index.suggest("red")) == 3
+
+
+def test_replaced_rows_take_their_old_values_out():
+    state = state_with([{"_id": "1", "title": "Red Shirt", "brand": "Nike"}])
+    index = AutocompleteIndex()
+    index.sync(state)
+    state.add({"_id": "1", "title": "Blue Shirt", "brand": "Nike"})
+    index.sync(state)
+    assert index.suggest("red") == []
+    assert texts(index.suggest("blue")) == [("title", "Blue Shirt")]
+    assert [s["score"] for s in index.suggest("nike")] == [round(0.5 + 3.0 / 10, 2)]
@@ -0,0 +1,56 @@
+import pytest
+
+from benchmark import InMemoryCollection, percentile, summarize
+
+DOCS = [
+    {"_id": 1, "brand": "Nike", "price": 500, "attrs": [{"k": "Color", "v": "Red"}], "tags": ["a", "b"]},
+    {"_id": 2, "brand": "Puma", "price": 900, "out_of_stock": True},
+    {"_id": 3, "brand": "nike", "price": 1200},
+]
+
+
+@pytest.fixture
+def collection():
+    collection = InMemoryCollection()
+    collection.insert_many(DOCS)
+    return collection
+
+
+def ids(cursor):
+    return [doc["_id"] for doc in cursor]
+
+
+@pytest.mark.parametrize("filter_query, expected", [
+    ({}, [1, 2, 3]),
+    ({"brand": "Nike"}, [1]),
+    ({"brand": {"$regex": "^nike$", "$options": "i"}}, [1, 3]),
+    ({"price": {"$gte": 500, "$lt": 1200}}, [1, 2]),
+    ({"out_of_stock": {"$ne": True}}, [1, 3]),
+    ({"out_of_stock": None}, [1, 3]),
+    ({"attrs": {"$elemMatch": {"k": "Color", "v": "Red"}}}, [1]),
+    ({"tags": "b"}, [1]),
+    ({"$or": [{"brand": "Puma"}, {"price": {"$gt": 1000}}]}, [2, 3]),
+    ({"brand": {"$nin": ["Nike", "Puma"]}}, [3]),
+])
+def test_filters_match_like_mongodb(collection, filter_query, expected):
+    assert ids(collection.find(filter_query)) == expected
+
+
+def test_projection_limit_and_sort(collection):
+    docs = list(collection.find({}, {"brand": 1}).sort("price", -1).limit(2))
+    assert docs == [{"_id": 3, "brand": "nike"}, {"_id": 2, "brand": "Puma"}]
+    assert collection.find_one({"brand": "Puma"}, {"_id": 0, "price": 1}) == {"price": 900}
+    assert collection.find_one({"brand": "Adidas"}) is None
+
+
+def test_unsupported_operators_fail_loudly(collection):
+    with pytest.raises(ValueError):
+        list(collection.find({"brand": {"$where": "1"}}))
+
+
+def test_percentiles_are_nearest_rank():
+    values = list(range(1, 101))
+    assert (percentile(values, 50), percentile(values, 99)) == (50, 100)
+    assert percentile([], 50) is None
+    summary = summarize([1.0, 2.0, 3.0])
+    assert (summary["count"], summary["mean_ms"], summary["max_ms"]) == (3, 2.0, 3.0)
@@ -0,0 +1,73 @@
+import gzip
+import json
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+from bulk_ingest import IngestProgress, _insert_batch, expand_sources, parse_file, prepare_product
+
+
+@pytest.fixture
+def catalog_dir(tmp_path):
+    (tmp_path / "shard").mkdir()
+    (tmp_path / "a.json").write_text(json.dumps([{"title": "Red Shirt"}, "oops"]))
+    (tmp_path / "shard" / "b.jsonl").write_text('{"title": "Blue Jeans"}\n\n{broken\n[1]\n')
+    with gzip.open(tmp_path / "shard" / "c.jsonl.gz", "wt", encoding="utf-8") as file:
+        file.write('{"_id": "c1", "title": "Black Hat"}\n')
+    (tmp_path / "notes.txt").write_text("not a catalog")
+    return tmp_path
+
+
+def test_expand_sources(catalog_dir):
+    files = expand_sources([str(catalog_dir)])
+    assert [path[len(str(catalog_dir)) + 1:] for path in files] == ["a.json", "shard/b.jsonl", "shard/c.jsonl.gz"]
+    assert expand_sources([str(catalog_dir / "**" / "*.jsonl*"), str(catalog_dir / "a.json")])[0].endswith("a.json")
+    with pytest.raises(FileNotFoundError):
+        expand_sources([str(catalog_dir / "missing.json")])
+    with pytest.raises(FileNotFoundError):
+        expand_sources([str(catalog_dir / "*.csv")])
+
+
+def test_parse_file_collects_products_and_errors(catalog_dir):
+    _, products, errors, size = parse_file(str(catalog_dir / "a.json"))
+    assert [p["title"] for p in products] == ["Red Shirt"]
+    assert errors == [f"{catalog_dir / 'a.json'}[1]: not a JSON object"]
+    assert size > 0
+
+    _, products, errors, _ = parse_file(str(catalog_dir / "shard" / "b.jsonl"))
+    assert [p["title"] for p in products] == ["Blue Jeans"]
+    assert len(errors) == 2 and ":3:" in errors[0] and errors[1].endswith(":4: not a JSON object")
+
+    _, products, errors, _ = parse_file(str(catalog_dir / "shard" / "c.jsonl.gz"))
+    assert [p["_id"] for p in products] == ["c1"] and not errors
+
+
+def test_prepare_product_assigns_ids_and_attributes():
+    product = prepare_product({"title": "Red Shirt", "product_details": [{"Color": "Red"}]})
+    assert isinstance(product["_id"], str) and len(product["_id"]) == 24
+    assert product["attrs"] == [{"k": "Color", "v": "Red"}]
+    assert product["color"] == "Red"
+    assert prepare_product({"_id": "keep"})["_id"] == "keep"
+
+
+class FailingCollection:
+    def __init__(self, error):
+        self.error = error
+
+    def insert_many(self, batch, ordered=True):
+        raise self.error
+
+
+def test_partial_batch_failures_keep_what_landed():
+    progress = IngestProgress()
+    error = BulkWriteError({"writeErrors": [{"index": 1, "errmsg": "E11000 duplicate key"}]})
+    inserted = _insert_batch(FailingCollection(error), [{"_id": 1}, {"_id": 2}, {"_id": 3}], progress)
+    assert [doc["_id"] for doc in inserted] == [1, 3]
+    summary = progress.snapshot()
+    assert (summary["inserted"], summary["failed"], summary["errors"]) == (2, 1, ["E11000 duplicate key"])
+
+
+def test_failed_batches_are_counted():
+    progress = IngestProgress()
+    assert _insert_batch(FailingCollection(RuntimeError("connection reset")), [{"_id": 1}], progress) == []
+    assert progress.snapshot()["failed"] == 1
@@ -0,0 +1,129 @@
+import itertools
+
+import pytest
+from pymongo import ReadPreference
+
+from benchmark import InMemoryCollection
+from catalog_snapshot import CatalogState, LiveCatalog, commit_catalog_version
+from facets import count_facets, facet_values
+from generate_catalog import generate
+
+
+class RecordingCollection(InMemoryCollection):
+    # Remembers the read preferences reads were made with
+    def __init__(self, name="products"):
+        super().__init__(name)
+        self.read_preferences = []
+
+    def with_options(self, read_preference=None, **kwargs):
+        self.read_preferences.append(read_preference)
+        return self
+
+    def update_one(self, filter_query, update, upsert=False):
+        doc = self.find_one(filter_query)
+        if doc is None:
+            self.insert_many([{**filter_query, "committed": update["$max"]["committed"]}])
+        else:
+            self._docs[[d["_id"] for d in self._docs].index(doc["_id"])]["committed"] = max(
+                doc.get("committed", 0), update["$max"]["committed"]
+            )
+
+
+@pytest.fixture
+def catalog():
+    products = generate(300, seed=3)
+    for index, product in enumerate(products):
+        product["_catalog_version"] = 1 if index < 200 else 2
+    collection, meta = RecordingCollection(), RecordingCollection("catalog_meta")
+    collection.insert_many(products)
+    return products, collection, meta
+
+
+def test_add_replaces_products_by_id():
+    state = CatalogState()
+    assert state.add({"_id": "a", "title": "Red Shirt", "brand": "Nike", "selling_price": "499"}) == 0
+    assert state.add({"_id": "b", "title": "Jeans"}) == 1
+    assert state.add({"_id": "a", "title": "Blue Shirt", "brand": "Puma"}) == 0
+    assert state.add({"_id": "c", "_canonical": False}) is None
+    assert len(state) == 2 and state.titles == ["Blue Shirt", "Jeans"]
+    assert list(state.replaced_rows) == [0]
+
+
+def test_snapshot_round_trip(tmp_path, catalog):
+    products, _, _ = catalog
+    state = CatalogState(version=7)
+    for product in products:
+        state.add(product)
+    path = str(tmp_path / "catalog.snapshot")
+    state.save(path)
+    loaded = CatalogState.load(path)
+    assert loaded.version == 7
+    assert loaded.ids == state.ids and loaded.titles == state.titles
+    assert all(loaded.codes[c] == state.codes[c] for c in state.codes)
+    assert loaded.facet_counts({}) == state.facet_counts({})
+
+
+def test_corrupt_snapshot_is_refused(tmp_path):
+    path = tmp_path / "catalog.snapshot"
+    state = CatalogState()
+    state.add({"_id": "a", "title": "Red Shirt", "average_rating": "4.2"})
+    state.save(str(path))
+    data = bytearray(path.read_bytes())
+    data[-1] ^= 0xFF
+    path.write_bytes(bytes(data))
+    with pytest.raises(ValueError):
+        CatalogState.load(str(path))
+
+
+def test_facet_counts_match_a_brute_force_count(catalog):
+    products, _, _ = catalog
+    state = CatalogState()
+    state.add(products[0])
+    state.facet_index()  # Maintained incrementally from here on
+    for product in products[1:]:
+        state.add(product)
+    state.add({**products[5], "brand": "Replaced", "out_of_stock": True})
+    current = {p["_id"]: p for p in products}
+    current[products[5]["_id"]] = {**products[5], "brand": "Replaced", "out_of_stock": True}
+
+    brand, category = products[0]["brand"], products[0]["category"]
+    for filters, in_stock in itertools.product(
+        [{}, {"brand": brand}, {"brand": brand, "category": category}], [None, True, False]
+    ):
+        expected = count_facets(
+            p for p in current.values()
+            if all(dict(facet_values(p)).get(column) == value for column, value in filters.items())
+            and (in_stock is None or in_stock != bool(p.get("out_of_stock")))
+        )
+        assert state.facet_counts(filters, in_stock) == +expected
+
+
+def test_build_and_refresh_read_from_the_primary(catalog):
+    _, collection, meta = catalog
+    commit_catalog_version(meta, 1)
+    state = CatalogState.build(collection, meta)
+    assert (state.version, len(state)) == (1, 300)
+    assert state.refresh(collection, meta) == 0
+
+    # Version 2 is replayed once committed, the new product is added and the others replaced in place
+    collection.insert_many([{"_id": "new", "title": "Red Shirt", "_catalog_version": 2}])
+    commit_catalog_version(meta, 2)
+    assert state.refresh(collection, meta) == 101
+    assert (state.version, len(state)) == (2, 301)
+    assert len(state.replaced_rows) == 100
+    assert all(preference == ReadPreference.PRIMARY for preference in collection.read_preferences + meta.read_preferences)
+    assert collection.read_preferences and meta.read_preferences
+
+
+def test_live_catalog_loads_in_the_background(tmp_path, catalog):
+    _, collection, meta = catalog
+    commit_catalog_version(meta, 2)
+    seen = []
+    live = LiveCatalog(collection, meta, path=str(tmp_path / "missing.snapshot"), refresh_s=0.01)
+    live.subscribe(seen.append)
+    live.start()
+    for _ in range(500):
+        if seen:
+            break
+        live._thread.join(0.01)
+    assert seen and seen[0] is live.state and len(live.state) == 300
@@ -0,0 +1,67 @@
+import pytest
+
+from benchmark import InMemoryCollection
+from dedup import (
+    INTERNAL_FIELDS, DuplicateIndex, annotate, collapse_groups, group_projection, signature, similarity,
+)
+
+DESCRIPTION = "Puma presents this solid black t-shirt for men, made from cotton with a regular fit for everyday comfort."
+
+
+def product(_id, title, description=DESCRIPTION):
+    return annotate({"_id": _id, "title": title, "description": description})
+
+
+def test_signatures_estimate_text_similarity():
+    shirt = signature({"title": "Solid Men Black T-shirt", "description": DESCRIPTION})
+    resold = signature({"title": "Solid Men Black T-shirt", "description": DESCRIPTION + " Ships fast."})
+    jeans = signature({"title": "Slim Women Blue Jeans", "description": "Levi's slim fit denim jeans in stone wash."})
+    assert similarity(shirt, shirt) == 1.0
+    assert similarity(shirt, resold) >= 0.8
+    assert similarity(shirt, jeans) < 0.3
+    assert signature({"title": "", "description": None}) is None
+
+
+def test_assign_groups_near_duplicates_within_and_across_loads():
+    collection = InMemoryCollection()
+    first = [product("a", "Solid Men Black T-shirt"), product("b", "Solid Men Black T-shirt"),
+             product("c", "Slim Women Blue Jeans", "Levi's slim fit denim jeans in stone wash.")]
+    index = DuplicateIndex(collection)
+    index.assign(first)
+    assert [(p["_group"], p["_canonical"]) for p in first] == [("a", True), ("a", False), ("c", True)]
+    collection.insert_many(first)
+
+    # A later load finds the canonical already in the collection
+    later = [product("d", "Solid Men Black T-shirt")]
+    DuplicateIndex(collection).assign(later)
+    assert (later[0]["_group"], later[0]["_canonical"]) == ("a", False)
+
+
+def test_collapse_keeps_one_product_per_group_in_result_order():
+    results = [
+        {"_id": "v1", "_group": "a", "_canonical": False},
+        {"_id": "x"},  # Loaded before grouping existed
+        {"_id": "a", "_group": "a", "_canonical": True},
+        {"_id": "v2", "_group": "b", "_canonical": False},
+    ]
+    assert [p["_id"] for p in collapse_groups(results)] == ["a", "x", "v2"]
+
+
+def test_a_variant_that_alone_matches_answers_for_its_group():
+    collection = InMemoryCollection()
+    collection.insert_many([
+        {"_id": "a", "_group": "a", "_canonical": True, "seller": "RetailNet", "_minhash": b"..", "_lsh": [1]},
+        {"_id": "v", "_group": "a", "_canonical": False, "seller": "SuperComNet", "_minhash": b"..", "_lsh": [1]},
+    ])
+    found = collapse_groups(collection.find({"seller": "SuperComNet"}, group_projection({})))
+    assert [p["_id"] for p in found] == ["v"]
+    assert not set(INTERNAL_FIELDS) & set(found[0])
+
+
+@pytest.mark.parametrize("projection, expected", [
+    ({}, {"_minhash": 0, "_lsh": 0, "_variants": 0}),
+    ({"description": 0}, {"description": 0, "_minhash": 0, "_lsh": 0, "_variants": 0}),
+    ({"title": 1, "_id": 0}, {"title": 1, "_id": 0, "_group": 1, "_canonical": 1}),
+])
+def test_group_projection(projection, expected):
+    assert group_projection(projection) == expected
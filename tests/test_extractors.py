@@ -0,0 +1,45 @@
+import pytest
+
+from extractors import BACKENDS, RuleBackend, create_extractor, estimate_tokens, parse_extraction
+
+
+def test_registry_creates_backends_without_importing_clients():
+    assert {"openai", "groq", "ollama", "rules"} <= set(BACKENDS)
+    backend = create_extractor("groq", "test-app")
+    assert backend.name == "groq" and backend.model_backed
+    assert not create_extractor("rules", "test-app").model_backed
+
+
+def test_unknown_backend_is_a_value_error():
+    with pytest.raises(ValueError):
+        create_extractor("gpt-99", "test-app")
+
+
+def test_parse_extraction_lines():
+    response = "Colors: Red, Blue\nItem types: t-shirt, jeans"
+    assert parse_extraction(response) == {"colors": ["red", "blue"], "item_types": ["t-shirt", "jeans"]}
+    assert parse_extraction("Item type: Hat")["item_types"] == ["hat"]
+
+
+def test_rule_backend_extracts_colours_and_items():
+    backend = RuleBackend("test-app")
+    assert backend.extract("red t-shirts and black jeans") == {
+        "colors": ["black", "red"], "item_types": ["t-shirt", "jeans"],
+    }
+    assert backend.extract("something nice") == {"colors": [], "item_types": ["all"]}
+
+
+def test_rule_backend_filter():
+    filter_query, projection = RuleBackend("test-app").generate_filter("blue shirts under 1,500 in stock")
+    assert filter_query == {
+        "product_details.Color": {"$in": ["Blue"]},
+        "title": {"$regex": "shirt", "$options": "i"},
+        "actual_price": {"$lt": "1500"},
+        "out_of_stock": False,
+    }
+    assert projection == {}
+
+
+def test_token_estimate():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("red shirt, please!") == 7
@@ -0,0 +1,81 @@
+from collections import Counter
+
+import pytest
+
+from benchmark import InMemoryCollection
+from facets import FacetSummary, count_facets, facet_values, price_bucket
+
+
+def product(_id, color, brand, price, out_of_stock=False, **fields):
+    return {
+        "_id": _id, "brand": brand, "category": "Clothing", "sub_category": "Topwear",
+        "selling_price": price, "out_of_stock": out_of_stock, "product_details": [{"Color": color}], **fields,
+    }
+
+
+PRODUCTS = [
+    product(1, "Red", "Nike", "499"),
+    product(2, "Red", "Puma", "1,299", out_of_stock=True),
+    product(3, "Blue", "Nike", "6,000"),
+    product(4, "Red", "Nike", "499", _group=1, _canonical=False),
+]
+
+
+@pytest.mark.parametrize("price, bucket", [
+    ("499", "0-499"), ("1,299", "1000-1999"), ("₹5,000", "5000+"), (None, None), ("", None),
+])
+def test_price_bucket(price, bucket):
+    assert price_bucket(price) == bucket
+
+
+def test_facet_values_of_one_product():
+    assert dict(facet_values(PRODUCTS[1])) == {
+        "color": "Red", "brand": "Puma", "category": "Clothing", "sub_category": "Topwear",
+        "price": "1000-1999", "availability": "out_of_stock",
+    }
+
+
+def test_count_facets_skips_variants():
+    counts = count_facets(PRODUCTS)
+    assert counts[("color", "Red")] == 2
+    assert counts[("brand", "Nike")] == 2
+    assert counts[("availability", "in_stock")] == 2
+
+
+def summary_collection(products):
+    collection = InMemoryCollection("facets")
+    collection.insert_many([
+        {"_id": f"{facet}:{value}", "facet": facet, "value": value, "count": count}
+        for (facet, value), count in count_facets(products).items()
+    ])
+    return collection
+
+
+def test_unfiltered_facets_come_from_the_summary():
+    summary = FacetSummary(summary_collection(PRODUCTS))
+    result = summary.facets(InMemoryCollection(), size=1)
+    assert result["source"] == "summary"
+    assert result["facets"]["color"] == [{"value": "Red", "count": 2}]
+
+
+def test_filtered_facets_are_counted_from_matching_products():
+    collection = InMemoryCollection()
+    collection.insert_many(PRODUCTS)
+    result = FacetSummary(summary_collection(PRODUCTS)).facets(collection, {"brand": "Nike"})
+    assert result["source"] == "aggregation" and not result["truncated"]
+    assert result["facets"]["price"] == [{"value": "0-499", "count": 1}, {"value": "5000+", "count": 1}]
+
+
+def test_filtered_facets_use_the_catalog_state_when_given():
+    class State:
+        def facet_counts(self, columns, in_stock):
+            self.request = (columns, in_stock)
+            return Counter({("brand", "Nike"): 3})
+
+    state = State()
+    result = FacetSummary(summary_collection(PRODUCTS)).facets(
+        InMemoryCollection(), {"product_details.Color": "Red", "out_of_stock": False}, catalog_state=state
+    )
+    assert result["source"] == "catalog_state"
+    assert state.request == ({"color": "Red"}, True)
+    assert result["facets"]["brand"] == [{"value": "Nike", "count": 3}]
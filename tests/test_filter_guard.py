@@ -0,0 +1,106 @@
+import pytest
+
+from filter_guard import FIND_HARD_LIMIT, FIND_SCAN_LIMIT, MAX_DEPTH, MAX_IN_VALUES, FilterRejected, guard_filter
+
+
+def test_indexed_equality_plans_an_index_read():
+    guarded, projection, plan, limit = guard_filter({"brand": "Nike"}, {"title": 1})
+    assert guarded == {"brand": "Nike"}
+    assert projection == {"title": 1}
+    assert (plan, limit) == ("index", FIND_HARD_LIMIT)
+
+
+def test_unindexed_filter_gets_the_scan_limit():
+    guarded, _, plan, limit = guard_filter({"title": {"$regex": "shirt", "$options": "i"}})
+    assert guarded == {"title": {"$regex": "shirt", "$options": "i"}}
+    assert (plan, limit) == ("scan", min(FIND_HARD_LIMIT, FIND_SCAN_LIMIT))
+
+
+@pytest.mark.parametrize("filter_query, reason", [
+    ({"password": "x"}, "field"),
+    ({"product_details.Weight": "1kg"}, "field"),
+    ({"$where": "this.a > 1"}, "operator"),
+    ({"brand": {"$function": {}}}, "operator"),
+    ({"brand": {"$in": "Nike"}}, "value"),
+    ({"brand": {"$in": ["x"] * (MAX_IN_VALUES + 1)}}, "value"),
+    ({"$or": "brand"}, "shape"),
+    ({"title": {"$regex": 5}}, "regex"),
+])
+def test_rejections(filter_query, reason):
+    with pytest.raises(FilterRejected) as excinfo:
+        guard_filter(filter_query)
+    assert excinfo.value.reason == reason
+
+
+def test_nesting_is_bounded():
+    filter_query = {"brand": "Nike"}
+    for _ in range(MAX_DEPTH + 1):
+        filter_query = {"$and": [filter_query]}
+    with pytest.raises(FilterRejected) as excinfo:
+        guard_filter(filter_query)
+    assert excinfo.value.reason == "depth"
+
+
+def test_anchored_regex_becomes_equality():
+    guarded, _, plan, _ = guard_filter({"brand": {"$regex": "^Nike$"}})
+    assert guarded == {"brand": "Nike"}
+    assert plan == "index"
+
+
+def test_free_text_regex_is_dropped():
+    guarded, _, plan, _ = guard_filter({"description": {"$regex": "cotton"}, "brand": "Nike"})
+    assert guarded == {"brand": "Nike"}
+    assert plan == "index"
+
+
+def test_or_with_a_branch_that_matches_everything_is_dropped():
+    guarded, _, _, _ = guard_filter({"$or": [{"description": {"$regex": "cotton"}}, {"brand": "Nike"}]})
+    assert guarded == {}
+
+
+def test_or_is_only_selective_when_every_branch_is():
+    _, _, plan, _ = guard_filter({"$or": [{"brand": "Nike"}, {"title": "Shirt"}]})
+    assert plan == "scan"
+    _, _, plan, _ = guard_filter({"$or": [{"brand": "Nike"}, {"category": "Clothing"}]})
+    assert plan == "index"
+
+
+@pytest.mark.parametrize("projection", [
+    {"title": {"$slice": 2}},
+    {"$where": 1},
+    ["title"],
+])
+def test_unusable_projections_fall_back_to_all_fields(projection):
+    _, guarded, _, _ = guard_filter({"brand": "Nike"}, projection)
+    assert guarded == {}
+
+
+@pytest.mark.parametrize("elem_match", ["Red", ["Color"], {}])
+def test_elem_match_must_be_an_object(elem_match):
+    with pytest.raises(FilterRejected) as excinfo:
+        guard_filter({"product_details": {"$elemMatch": elem_match}})
+    assert excinfo.value.reason == "value"
+
+
+def test_mixed_projection_is_rejected():
+    with pytest.raises(FilterRejected) as excinfo:
+        guard_filter({"brand": "Nike"}, {"title": 1, "description": 0})
+    assert excinfo.value.reason == "projection"
+
+
+@pytest.mark.parametrize("projection", [{"title": 1, "_id": 0}, {"description": 0, "_id": 0}, {"_id": 1, "images": 0}])
+def test_id_can_be_toggled_in_either_projection_kind(projection):
+    _, guarded, _, _ = guard_filter({"brand": "Nike"}, projection)
+    assert guarded == projection
+
+
+def test_elem_match_on_product_details_is_validated():
+    elem_match = {"product_details": {"$elemMatch": {"Color": "Red", "Fabric": {"$in": ["Cotton"]}}}}
+    guarded, _, _, _ = guard_filter(elem_match)
+    assert guarded == elem_match
+    with pytest.raises(FilterRejected) as excinfo:
+        guard_filter({"product_details": {"$elemMatch": {"Weight": "1kg"}}})
+    assert excinfo.value.reason == "field"
+    with pytest.raises(FilterRejected) as excinfo:
+        guard_filter({"product_details": {"$size": 3}})
+    assert excinfo.value.reason == "operator"
@@ -0,0 +1,28 @@
+import pytest
+
+from filter_prompt import FULL_FILTER_PROMPT, PROMPT_PREFIX, detect_intents, filter_prompt
+
+
+@pytest.mark.parametrize("query, intents", [
+    ("nike shoes", []),
+    ("red shirts under 500", ["price", "color"]),
+    ("best rated cotton kurta in stock", ["rating", "stock", "details"]),
+    ("jeans with 40% off sold by RetailNet", ["discount", "seller"]),
+])
+def test_intents(query, intents):
+    assert detect_intents(query) == intents
+
+
+def test_compact_prompt_shares_a_prefix_and_ends_with_the_query():
+    prompt, intents = filter_prompt("blue jeans under 1000", mode="compact")
+    assert intents == ["price", "color"]
+    assert prompt.startswith(PROMPT_PREFIX)
+    assert prompt.index("actual_price") < prompt.index("product_details.Color")
+    assert "seller" not in prompt
+    assert prompt.format(user_query="blue jeans under 1000").endswith("Query: blue jeans under 1000")
+
+
+def test_full_prompt_and_unknown_mode():
+    assert filter_prompt("anything", mode="full") == (FULL_FILTER_PROMPT, [])
+    with pytest.raises(ValueError):
+        filter_prompt("anything", mode="verbose")
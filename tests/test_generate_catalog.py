@@ -0,0 +1,59 @@
+import io
+import json
+
+from generate_catalog import CatalogGenerator, generate, write_catalog, zipf_weights
+
+
+def test_same_seed_generates_the_same_catalog():
+    assert generate(50, seed=7) == generate(50, seed=7)
+    assert generate(50, seed=7) != generate(50, seed=8)
+
+
+def test_batching_does_not_change_counts_or_ids():
+    products = list(CatalogGenerator(batch_size=7).generate(30))
+    assert len(products) == 30
+    assert len({product["_id"] for product in products}) == 30
+    assert len({product["pid"] for product in products}) == 30
+
+
+def test_flipkart_products_keep_the_crawl_shape():
+    for product in generate(200, missing_rate=0):
+        assert len(product["pid"]) == 16
+        color = next(detail["Color"] for detail in product["product_details"] if "Color" in detail)
+        assert f" {color} " in product["title"]
+        actual = int(product["actual_price"].replace(",", ""))
+        selling = int(product["selling_price"].replace(",", ""))
+        assert 99 <= selling <= actual
+
+
+def test_missing_fields_never_drop_the_colour_detail():
+    for product in generate(300, missing_rate=0.5):
+        if "product_details" in product:
+            assert any("Color" in detail for detail in product["product_details"])
+
+
+def test_simple_schema_fields():
+    for product in generate(50, schema="simple", missing_rate=0):
+        assert set(product) == {"name", "color", "availability", "image_url"}
+        assert product["name"].lower().startswith(product["color"])
+
+
+def test_zipf_weights_are_cumulative():
+    assert zipf_weights(3, 0) == [1.0, 2.0, 3.0]
+    weights = zipf_weights(4, 1.5)
+    assert weights == sorted(weights)
+
+
+def test_write_catalog_formats():
+    products = generate(3, schema="simple")
+    lines = io.StringIO()
+    assert write_catalog(products, lines, "jsonl") == 3
+    assert [json.loads(line) for line in lines.getvalue().splitlines()] == products
+
+    array = io.StringIO()
+    assert write_catalog(products, array, "json") == 3
+    assert json.loads(array.getvalue()) == products
+
+    empty = io.StringIO()
+    assert write_catalog([], empty, "json") == 0
+    assert json.loads(empty.getvalue()) == []
@@ -0,0 +1,73 @@
+import threading
+
+import pytest
+
+import ingest_jobs
+from ingest_jobs import IngestJobQueue, QueueFull
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    # Replace the loader so jobs finish (or block) on demand
+    calls, release = [], threading.Event()
+
+    def ingest(sources, collection, facet_collection, view_collection, **options):
+        calls.append((sources, options))
+        release.wait(5)
+        if sources == ["bad"]:
+            raise FileNotFoundError("No files match bad")
+        if sources == ["partial"]:
+            options["progress"].add(failed=1)
+        return options["progress"].snapshot()
+
+    monkeypatch.setattr(ingest_jobs, "ingest", ingest)
+    return calls, release
+
+
+def wait_done(queue):
+    queue._queue.join()
+
+
+def test_jobs_run_with_their_options_and_report_status(loads):
+    calls, release = loads
+    completed = []
+    queue = IngestJobQueue(collection=None, on_complete=completed.append, workers=1, max_queued=4)
+    good = queue.submit(["a.jsonl"], processes=3, writers=2, max_docs_per_s=0)
+    partial = queue.submit(["partial"])
+    bad = queue.submit(["bad"])
+    release.set()
+    wait_done(queue)
+
+    assert calls[0][1]["processes"] == 3 and calls[0][1]["writers"] == 2 and calls[0][1]["max_docs_per_s"] == 0
+    assert (good.status, partial.status, bad.status) == ("completed", "completed_with_errors", "failed")
+    assert bad.error == "No files match bad"
+    assert completed == [good, partial]
+    assert queue.get(good.id).to_dict()["progress"] is not None
+    assert [job.id for job in queue.jobs()] == [good.id, partial.id, bad.id]
+
+
+def test_full_queue_refuses_submissions(loads):
+    _, release = loads
+    queue = IngestJobQueue(collection=None, workers=1, max_queued=1)
+    running = queue.submit(["a"])
+    while running.status == "queued":
+        threading.Event().wait(0.01)
+    queued = queue.submit(["b"])
+    with pytest.raises(QueueFull):
+        queue.submit(["c"])
+    assert queued.to_dict()["progress"] is None
+    assert queue.retry_after() == 30
+    release.set()
+    wait_done(queue)
+    assert queue.retry_after() >= 1
+
+
+def test_finished_jobs_beyond_the_history_are_forgotten(loads, monkeypatch):
+    _, release = loads
+    release.set()
+    monkeypatch.setattr(ingest_jobs, "INGEST_JOB_HISTORY", 2)
+    queue = IngestJobQueue(collection=None, workers=1, max_queued=10)
+    for index in range(4):
+        queue.submit([str(index)])
+        wait_done(queue)
+    assert [job.sources for job in queue.jobs()] == [["1"], ["2"], ["3"]]
@@ -0,0 +1,42 @@
+from types import SimpleNamespace
+
+from instrumentation import (
+    Counter, Histogram, Registry, _route_label, parse_server_timing, server_timing_header,
+)
+
+
+def test_label_values_are_escaped():
+    metric = Counter("test_requests_total", "Requests", ("path",))
+    metric.inc('/a"b\\c\nd')
+    assert metric.render()[-1] == 'test_requests_total{path="/a\\"b\\\\c\\nd"} 1'
+
+
+def test_histogram_buckets_are_cumulative():
+    metric = Histogram("test_seconds", "Latency", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        metric.observe(value, "db")
+    lines = metric.render()
+    assert 'test_seconds_bucket{stage="db",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{stage="db",le="1.0"} 3' in lines
+    assert 'test_seconds_bucket{stage="db",le="+Inf"} 4' in lines
+    assert 'test_seconds_count{stage="db"} 4' in lines
+    assert 'test_seconds_sum{stage="db"} 6.05' in lines
+
+
+def test_registry_returns_the_existing_metric_on_reregistration():
+    registry = Registry()
+    first = registry.register(Counter("test_total", "Total"))
+    assert registry.register(Counter("test_total", "Total")) is first
+
+
+def test_route_label_uses_the_route_template():
+    route = SimpleNamespace(path="/jobs/{job_id}")
+    assert _route_label(SimpleNamespace(scope={"route": route})) == "/jobs/{job_id}"
+    assert _route_label(SimpleNamespace(scope={})) == "other"
+
+
+def test_server_timing_round_trip():
+    header = server_timing_header([("llm_extraction", 0.012), ("mongo_query", 0.003)], 0.02)
+    assert parse_server_timing(header) == {"llm_extraction": 12.0, "mongo_query": 3.0, "total": 20.0}
+    assert parse_server_timing("a;desc=x;dur=1.5, a;dur=0.5") == {"a": 2.0}
+    assert parse_server_timing(None) == {}
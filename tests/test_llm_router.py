@@ -0,0 +1,156 @@
+import itertools
+import time
+
+import pytest
+
+import llm_router
+from extractors import Backend, is_fallback, register_backend
+from llm_router import ROUTER_FALLBACKS, ROUTER_HEDGES, CircuitBreaker, RoutedBackend
+
+_names = itertools.count()
+
+
+class FakeBackend(Backend):
+    delay = 0.0
+    fail = False
+
+    def __init__(self, app_name):
+        super().__init__(app_name)
+        self.calls = 0
+
+    def extract(self, user_query):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError(f"{self.name} is down")
+        return {"colors": [self.name], "item_types": []}
+
+
+def routed(*backends, **options):
+    """
+    A router over fake backends given as (delay, fail) pairs, registered
+    under fresh names.
+    """
+    names = []
+    for delay, fail in backends:
+        name = f"fake-{next(_names)}"
+        register_backend(name)(type(name, (FakeBackend,), {"delay": delay, "fail": fail}))
+        names.append(name)
+    return RoutedBackend("test", route=",".join(names), fallback="rules", **options)
+
+
+def answered_by(router, result):
+    return next(backend for backend in router.backends if result["colors"] == [backend.name])
+
+
+# -- circuit breaker -------------------------------------------------------
+
+def opened_breaker(cooldown_s=0.05):
+    breaker = CircuitBreaker("test", failure_rate=0.5, min_calls=4, window_s=60, cooldown_s=cooldown_s)
+    for ok in (True, False, True, False):
+        breaker.record(ok)
+    return breaker
+
+
+def test_breaker_opens_at_the_failure_rate():
+    breaker = opened_breaker()
+    assert not breaker.allow()
+
+
+def test_breaker_needs_min_calls():
+    breaker = CircuitBreaker("test", failure_rate=0.5, min_calls=4)
+    for _ in range(3):
+        breaker.record(False)
+    assert breaker.allow()
+
+
+def test_breaker_lets_one_probe_through_after_the_cooldown():
+    breaker = opened_breaker()
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record(True)
+    assert breaker.allow()
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens_the_breaker():
+    breaker = opened_breaker()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record(False)
+    assert not breaker.allow()
+
+
+# -- routing ---------------------------------------------------------------
+
+def test_healthy_primary_answers_alone():
+    router = routed((0.0, False), (0.0, False))
+    primary, secondary = router.backends
+    assert answered_by(router, router.extract("red shirt")) is primary
+    assert secondary.calls == 0
+
+
+def test_errors_fail_over_to_the_next_backend():
+    router = routed((0.0, True), (0.0, False))
+    primary, secondary = router.backends
+    assert answered_by(router, router.extract("red shirt")) is secondary
+    assert primary.calls == 1
+
+
+def test_slow_primary_is_hedged(monkeypatch):
+    monkeypatch.setattr(llm_router, "LLM_HEDGE_DEFAULT_MS", 20)
+    router = routed((0.5, False), (0.0, False), budget_ms=2000)
+    primary, secondary = router.backends
+    hedges = ROUTER_HEDGES.value(secondary.name)
+    started = time.perf_counter()
+    assert answered_by(router, router.extract("red shirt")) is secondary
+    assert time.perf_counter() - started < 0.4
+    assert ROUTER_HEDGES.value(secondary.name) == hedges + 1
+
+
+def test_budget_overrun_falls_back_to_rules(monkeypatch):
+    monkeypatch.setattr(llm_router, "LLM_HEDGE_DEFAULT_MS", 10)
+    router = routed((0.3, False), (0.3, False), budget_ms=50)
+    fallbacks = ROUTER_FALLBACKS.value("budget")
+    assert router.extract("red shirt") == {"colors": ["red"], "item_types": ["shirt"]}
+    assert ROUTER_FALLBACKS.value("budget") == fallbacks + 1
+
+
+def test_open_breaker_is_skipped_without_claiming_its_probe():
+    router = routed((0.0, False), (0.0, False))
+    primary, secondary = router.backends
+    breaker = router.breakers[primary.name]
+    breaker._opened_at = time.monotonic()
+    assert answered_by(router, router.extract("red shirt")) is secondary
+    assert primary.calls == 0
+    assert not breaker._probing
+
+
+def test_saturated_router_goes_straight_to_the_fallback():
+    router = routed((0.0, False))
+    held = 0
+    while router._slots.acquire(blocking=False):
+        held += 1
+    fallbacks = ROUTER_FALLBACKS.value("saturated")
+    try:
+        assert router.extract("red shirt")["colors"] == ["red"]
+        assert router.backends[0].calls == 0
+        assert ROUTER_FALLBACKS.value("saturated") == fallbacks + 1
+    finally:
+        for _ in range(held):
+            router._slots.release()
+
+
+def test_without_a_fallback_the_last_error_is_raised():
+    router = routed((0.0, True))
+    router.fallback = None
+    with pytest.raises(RuntimeError):
+        router.extract("red shirt")
+
+
+def test_fallback_filters_are_marked_as_rule_output():
+    router = routed((0.0, True))
+    result = router.generate_filter("red shirt", None)
+    assert is_fallback(result)
+    assert result[0]["product_details.Color"] == {"$in": ["Red"]}
@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+
+import pytest
+from pymongo import read_preferences
+
+import mongo_store
+from mongo_store import (
+    LazyCollection, _search_read_preference, bulk_write_batched, insert_many_batched, search_collection,
+    write_collection,
+)
+
+
+class RecordingCollection:
+    def __init__(self):
+        self.batches = []
+
+    def insert_many(self, batch, ordered=True):
+        assert not ordered
+        self.batches.append(list(batch))
+        return SimpleNamespace(inserted_ids=[None] * len(batch))
+
+    def bulk_write(self, batch, ordered=True):
+        assert not ordered
+        self.batches.append(list(batch))
+        return SimpleNamespace(
+            inserted_count=0, matched_count=len(batch), modified_count=len(batch), upserted_count=0, deleted_count=0
+        )
+
+
+def test_inserts_stream_in_batches():
+    collection = RecordingCollection()
+    assert insert_many_batched(collection, iter(range(7)), batch_size=3) == 7
+    assert [len(batch) for batch in collection.batches] == [3, 3, 1]
+
+
+def test_bulk_write_sums_batch_results():
+    collection = RecordingCollection()
+    totals = bulk_write_batched(collection, range(5), batch_size=2)
+    assert totals["matched"] == totals["modified"] == 5
+    assert [len(batch) for batch in collection.batches] == [2, 2, 1]
+
+
+@pytest.mark.parametrize("name, mode", [
+    ("primary", read_preferences.Primary),
+    ("secondaryPreferred", read_preferences.SecondaryPreferred),
+    ("NEAREST", read_preferences.Nearest),
+])
+def test_search_read_preference_from_env(monkeypatch, name, mode):
+    monkeypatch.setenv("MONGO_SEARCH_READ_PREFERENCE", name)
+    assert isinstance(_search_read_preference(), mode)
+
+
+def test_unknown_read_preference_is_an_error(monkeypatch):
+    monkeypatch.setenv("MONGO_SEARCH_READ_PREFERENCE", "fastest")
+    with pytest.raises(ValueError):
+        _search_read_preference()
+
+
+def test_handles_resolve_lazily_with_their_read_preference(monkeypatch):
+    monkeypatch.setenv("MONGO_URI", "mongodb://localhost:1")
+    monkeypatch.setenv("DATABASE_NAME", "catalog")
+    monkeypatch.setenv("COLLECTION_NAME", "products")
+    monkeypatch.setenv("MONGO_SEARCH_READ_PREFERENCE", "secondaryPreferred")
+    monkeypatch.setattr(mongo_store, "_client", None)
+    try:
+        reads, writes = search_collection(), write_collection("jobs")
+        assert isinstance(reads, LazyCollection) and mongo_store._client is None
+        assert reads.name == "products"
+        assert isinstance(reads.read_preference, read_preferences.SecondaryPreferred)
+        assert writes.name == "jobs"
+        assert isinstance(writes.read_preference, read_preferences.Primary)
+        assert writes.write_concern.document == {"w": "majority"}
+    finally:
+        mongo_store.close_client()
@@ -0,0 +1,115 @@
+import time
+
+import pytest
+from bson import ObjectId
+
+from benchmark import InMemoryCollection
+from sessions import SESSION_CANDIDATES, SessionStore, parse_refinement, replace_color
+
+PRODUCTS = [
+    {"_id": "a", "selling_price": "₹299", "average_rating": "4.5", "out_of_stock": False, "discount": "20% off"},
+    {"_id": "b", "selling_price": "₹499", "average_rating": "3.9", "out_of_stock": True, "discount": ""},
+    {"_id": "c", "selling_price": "₹1,299", "average_rating": "4.1", "out_of_stock": False, "discount": "5% off"},
+]
+
+
+def refined_ids(query):
+    return [product["_id"] for product in parse_refinement(query).apply(PRODUCTS)]
+
+
+@pytest.mark.parametrize("query, ids", [
+    ("only under 500", ["a", "b"]),
+    ("show me the ones over rs 400", ["b", "c"]),
+    ("just the cheaper ones", ["a"]),
+    ("rated above 4", ["a", "c"]),
+    ("only in stock", ["a", "c"]),
+    ("only discounted", ["a", "c"]),
+    ("in stock and under 1,000", ["a"]),
+])
+def test_follow_ups_narrow_the_candidates(query, ids):
+    refinement = parse_refinement(query)
+    assert refinement.kind == "narrowed"
+    assert refined_ids(query) == ids
+
+
+def test_colour_follow_up_changes_the_stored_filter():
+    refinement = parse_refinement("in blue instead")
+    assert refinement.kind == "delta"
+    assert refinement.color == "Blue"
+    assert refinement.predicates == []
+
+
+@pytest.mark.parametrize("query", [
+    "red shirts under 500",
+    "jeans",
+    "something for a wedding",
+    "a nice jacket for winter hiking trips in red",
+])
+def test_new_searches_are_not_refinements(query):
+    assert parse_refinement(query) is None
+
+
+def test_store_returns_what_was_put():
+    store = SessionStore()
+    store.put("s", {"brand": "Nike"}, {"title": 1}, ["a", "b"])
+    session = store.get("s")
+    assert (session.filter, session.projection, session.candidate_ids) == ({"brand": "Nike"}, {"title": 1}, ["a", "b"])
+    assert store.get("unknown") is None
+
+
+def test_candidates_are_capped():
+    store = SessionStore()
+    store.put("s", {}, {}, list(range(SESSION_CANDIDATES + 10)))
+    assert len(store.get("s").candidate_ids) == SESSION_CANDIDATES
+
+
+def test_least_recently_used_session_is_evicted():
+    store = SessionStore(max_sessions=2)
+    store.put("a", {}, {}, [])
+    store.put("b", {}, {}, [])
+    store.get("a")
+    store.put("c", {}, {}, [])
+    assert store.get("b") is None
+    assert store.get("a") is not None and store.get("c") is not None
+
+
+def test_idle_sessions_expire():
+    store = SessionStore(ttl=0.05)
+    store.put("s", {}, {}, [])
+    time.sleep(0.06)
+    assert store.get("s") is None
+
+
+@pytest.mark.parametrize("stored, expected", [
+    ({"brand": "Nike", "product_details.Color": "Red"}, {"brand": "Nike"}),
+    ({"color": {"$in": ["Red", "Black"]}}, {}),
+    ({"product_details": {"$elemMatch": {"Color": "Red"}}}, {}),
+    ({"product_details": {"$elemMatch": {"Color": "Red", "Fabric": "Cotton"}}},
+     {"product_details": {"$elemMatch": {"Fabric": "Cotton"}}}),
+    ({"attrs": {"$elemMatch": {"k": "Color", "v": "Red"}}, "title": {"$regex": "shirt"}}, {"title": {"$regex": "shirt"}}),
+    ({"$and": [{"product_details.Color": "Red"}, {"brand": "Nike"}]}, {"$and": [{"brand": "Nike"}]}),
+    ({"$and": [{"color": "Red"}]}, {}),
+])
+def test_every_colour_form_is_replaced(stored, expected):
+    assert replace_color(stored, "Blue") == {**expected, "product_details.Color": "Blue"}
+
+
+@pytest.mark.parametrize("stored", [
+    {"$or": [{"product_details.Color": "Red"}, {"brand": "Nike"}]},
+    {"$and": [{"$or": [{"color": "Red"}, {"color": "Black"}]}]},
+    {"$nor": [{"attrs": {"$elemMatch": {"k": "Color", "v": "Red"}}}]},
+])
+def test_colours_that_cannot_be_removed_alone_need_a_fresh_search(stored):
+    assert replace_color(stored, "Blue") is None
+
+
+def test_candidates_are_found_whatever_the_id_type():
+    legacy, current = ObjectId(), str(ObjectId())
+    collection = InMemoryCollection()
+    collection.insert_many([{"_id": legacy}, {"_id": current}, {"_id": "other"}])
+    store = SessionStore()
+    # Top-N views hand back every id as a string
+    store.put("s", {}, {}, [str(legacy), current])
+    session = store.get("s")
+    assert session.candidate_ids == [str(legacy), current]
+    assert [doc["_id"] for doc in collection.find(session.candidate_filter())] == [legacy, current]
@@ -0,0 +1,101 @@
+import pytest
+
+from extractors import LLMBackend, is_fallback
+from structured_output import (
+    STRUCTURED_FAILURES, STRUCTURED_RETRIES, Extraction, FilterQuery, RetryBudget, StructuredOutputError,
+    parse_structured, repair_prompt,
+)
+
+
+def test_valid_json_is_parsed_in_one_pass():
+    query, result = parse_structured(FilterQuery, '{"filter": {"brand": "Nike"}, "projection": {"title": 1}}')
+    assert result == "valid"
+    assert (query.filter, query.projection) == ({"brand": "Nike"}, {"title": 1})
+
+
+@pytest.mark.parametrize("text, filter_query", [
+    ('Here is the query:\n```json\n{"filter": {"brand": "Nike"}}\n```', {"brand": "Nike"}),
+    ('{"filter": {"brand": "Nike"}} I hope this helps {', {"brand": "Nike"}),
+    ('{"filter": {"product\\_details.Color": "Red"}}', {"product_details.Color": "Red"}),
+])
+def test_surrounding_text_is_repaired(text, filter_query):
+    query, result = parse_structured(FilterQuery, text)
+    assert result == "repaired"
+    assert query.filter == filter_query
+
+
+@pytest.mark.parametrize("text", ["no json here", '{"filter": ["brand"]}', "[1, 2]"])
+def test_invalid_responses_raise(text):
+    with pytest.raises(StructuredOutputError) as excinfo:
+        parse_structured(FilterQuery, text)
+    assert "errors.pydantic.dev" not in str(excinfo.value)
+
+
+def test_cursor_options_are_dropped_from_the_filter():
+    query, _ = parse_structured(FilterQuery, '{"filter": {"brand": "Nike", "$limit": 5, "$sort": {"price": 1}}}')
+    assert query.filter == {"brand": "Nike"}
+
+
+def test_projection_values_are_left_to_the_guard():
+    query, _ = parse_structured(FilterQuery, '{"filter": {}, "projection": {"title": 1, "images": {"$slice": 1}}}')
+    assert query.projection == {"title": 1, "images": {"$slice": 1}}
+
+
+def test_extraction_accepts_comma_separated_strings():
+    extraction, _ = parse_structured(Extraction, '{"colors": "Red, Blue", "item_types": ["Shirt", ""]}')
+    assert (extraction.colors, extraction.item_types) == (["red", "blue"], ["shirt"])
+
+
+def test_repair_prompt_quotes_a_bounded_error():
+    prompt = repair_prompt("Extract the filter.", "x" * 1000)
+    assert prompt.startswith("Extract the filter.")
+    assert "x" * 300 in prompt and "x" * 301 not in prompt
+
+
+def test_retry_budget_refills_by_ratio():
+    budget = RetryBudget(ratio=0.5, reserve=1)
+    assert budget.withdraw()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert budget.withdraw()
+
+
+class ScriptedBackend(LLMBackend):
+    name = "scripted"
+
+    def __init__(self, responses):
+        super().__init__("test")
+        self.responses = list(responses)
+        self.prompts = []
+
+    def complete(self, prompt, temperature, json_mode=False):
+        self.prompts.append(prompt)
+        return self.responses.pop(0), None
+
+
+def test_invalid_reply_is_retried_with_the_error():
+    backend = ScriptedBackend(["not json", '{"filter": {"brand": "Nike"}, "projection": {}}'])
+    result = backend.generate_filter("nike", "Query: {user_query}")
+    assert result == ({"brand": "Nike"}, {}) and not is_fallback(result)
+    assert len(backend.prompts) == 2
+    assert "Your previous reply was rejected" in backend.prompts[1]
+
+
+def test_exhausted_retries_fall_back_to_rules():
+    backend = ScriptedBackend(["not json"] * (STRUCTURED_RETRIES + 1))
+    failures = STRUCTURED_FAILURES.value("test", "scripted", "filter", "retries_exhausted")
+    result = backend.generate_filter("red shirt", "Query: {user_query}")
+    assert is_fallback(result)
+    filter_query, projection = result
+    assert filter_query["product_details.Color"] == {"$in": ["Red"]}
+    assert projection == {}
+    assert STRUCTURED_FAILURES.value("test", "scripted", "filter", "retries_exhausted") == failures + 1
+
+
+def test_empty_retry_budget_skips_the_retry():
+    backend = ScriptedBackend(["not json"])
+    backend.retry_budget = RetryBudget(ratio=0, reserve=0)
+    assert backend.extract("red shirt") == {"colors": ["red"], "item_types": ["shirt"]}
+    assert len(backend.prompts) == 1
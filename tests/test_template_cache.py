@@ -0,0 +1,85 @@
+from template_cache import QueryTemplateCache
+
+
+def learned_cache(**options):
+    cache = QueryTemplateCache(**options)
+    cache.learn("nike shoes under 500", {"brand": "Nike", "selling_price": {"$lt": 500}}, {"title": 1})
+    return cache
+
+
+def test_same_shape_reuses_the_template_with_new_values():
+    cache = learned_cache()
+    cache.learn("puma shoes under 700", {"brand": "Puma", "selling_price": {"$lt": 700}}, {"title": 1})
+    assert len(cache.templates) == 1
+    filter_query, projection = cache.lookup("Puma shoes under 1,200")
+    assert filter_query == {"brand": "Puma", "selling_price": {"$lt": 1200}}
+    assert projection == {"title": 1}
+
+
+def test_numbers_keep_the_type_the_model_used():
+    cache = QueryTemplateCache()
+    cache.learn("shoes under 500", {"selling_price": {"$lt": "500"}}, {})
+    assert cache.lookup("shoes under 2,000") == ({"selling_price": {"$lt": "2000"}}, {})
+
+
+def test_unknown_values_and_shapes_miss():
+    cache = learned_cache()
+    assert cache.lookup("adidas shoes under 100") is None
+    assert cache.lookup("nike shoes") is None
+
+
+def test_lookup_returns_copies():
+    cache = learned_cache()
+    filter_query, projection = cache.lookup("nike shoes under 500")
+    filter_query["brand"] = "changed"
+    projection["title"] = 0
+    assert cache.lookup("nike shoes under 500") == ({"brand": "Nike", "selling_price": {"$lt": 500}}, {"title": 1})
+
+
+def test_longest_term_wins():
+    cache = QueryTemplateCache()
+    cache.learn("blue shirts", {"product_details.Color": "Blue"}, {})
+    cache.learn("navy blue shirts", {"product_details.Color": "Navy Blue"}, {})
+    assert cache.lookup("navy blue shirts") == ({"product_details.Color": "Navy Blue"}, {})
+    assert cache.lookup("blue shirts") == ({"product_details.Color": "Blue"}, {})
+
+
+def test_plural_mentions_match_learned_terms():
+    cache = QueryTemplateCache()
+    cache.learn("kurta from biba", {"brand": "Biba", "sub_category": "Kurta"}, {})
+    assert cache.lookup("kurtas from biba") == ({"brand": "Biba", "sub_category": "Kurta"}, {})
+
+
+def test_vocabulary_is_capped():
+    cache = learned_cache(max_terms=1)
+    cache.learn("puma shoes under 700", {"brand": "Puma", "selling_price": {"$lt": 700}}, {})
+    assert cache.vocabulary == {"brand": {"nike": "Nike"}}
+    # Without a slot for the brand, the query is learned as a template of its own
+    assert len(cache.templates) == 2
+
+
+def test_least_used_template_is_evicted():
+    cache = learned_cache(max_templates=2)
+    cache.learn("shirts", {"sub_category": "Shirts"}, {})
+    cache.lookup("nike shoes under 500")
+    cache.learn("in stock", {"out_of_stock": False}, {})
+    assert list(cache.templates) == ["<brand:0> shoes under <number:0>", "in stock"]
+
+
+def test_save_and_load_prewarm_the_most_used_templates(tmp_path):
+    path = str(tmp_path / "templates.json")
+    cache = learned_cache()
+    cache.learn("shirts", {"sub_category": "Shirts"}, {})
+    cache.lookup("nike shoes under 500")
+    cache.save(path)
+
+    loaded = QueryTemplateCache.load(path, warm=1)
+    assert list(loaded.templates) == ["<brand:0> shoes under <number:0>"]
+    assert loaded.lookup("nike shoes under 900") == ({"brand": "Nike", "selling_price": {"$lt": 900}}, {"title": 1})
+
+
+def test_missing_or_corrupt_files_load_empty(tmp_path):
+    assert QueryTemplateCache.load(str(tmp_path / "missing.json")).templates == {}
+    corrupt = tmp_path / "corrupt.json"
+    corrupt.write_text("{")
+    assert QueryTemplateCache.load(str(corrupt)).templates == {}
@@ -0,0 +1,87 @@
+import json
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+import bulk_ingest
+from benchmark import InMemoryCollection
+from top_views import TOPN_SIZE, TopNViews, parse_top_n, view_documents
+
+
+def product(_id, rating, price, title="Slim Fit Shirt", sub_category="Topwear", **fields):
+    return {
+        "_id": _id, "title": title, "category": "Clothing", "sub_category": sub_category,
+        "average_rating": rating, "selling_price": price, "discount": "", **fields,
+    }
+
+
+PRODUCTS = [
+    product("a", "4.1", "999"),
+    product("b", "4.8", "1,499"),
+    product("c", "3.9", "499", title="Blue Jeans", sub_category="Bottomwear"),
+    product("d", "5.0", "299", _canonical=False, _group="b"),
+]
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("top 5 rated shirts", (5, "rating")),
+    ("best 3 jeans", (3, "rating")),
+    ("cheapest 10 kurtas", (10, "price")),
+    ("top 4 discounted shoes", (4, "discount")),
+    ("red shirts", None),
+    ("top 5 shirts", (5, "rating")),
+])
+def test_parse_top_n(query, expected):
+    assert parse_top_n(query) == expected
+
+
+@pytest.fixture
+def views():
+    collection = InMemoryCollection("views")
+    collection.insert_many(view_documents(PRODUCTS))
+    return TopNViews(collection)
+
+
+def test_views_rank_products_and_skip_variants(views):
+    assert [p["_id"] for p in views.lookup({}, 5, "rating")] == ["b", "a", "c"]
+    assert [p["_id"] for p in views.lookup({}, 2, "price")] == ["c", "a"]
+
+
+def test_scope_and_item_views(views):
+    assert [p["_id"] for p in views.lookup({"sub_category": {"$eq": "Topwear"}}, 5, "rating")] == ["b", "a"]
+    assert [p["_id"] for p in views.lookup({"category": "Clothing", "sub_category": "Bottomwear"}, 5, "rating")] == ["c"]
+    assert [p["_id"] for p in views.lookup({"title": {"$regex": "Jeans", "$options": "i"}}, 5, "price")] == ["c"]
+
+
+@pytest.mark.parametrize("filter_query, n", [
+    ({"brand": "Nike"}, 5),
+    ({"title": {"$regex": "jeans"}}, 5),
+    ({"title": {"$regex": "jeans", "$options": "i"}, "brand": "Nike"}, 5),
+    ({}, TOPN_SIZE + 1),
+    ({"sub_category": "Footwear"}, 5),
+])
+def test_unservable_or_missing_views(views, filter_query, n):
+    assert views.lookup(filter_query, n, "rating") is None
+
+
+class RejectingCollection(InMemoryCollection):
+    # Rejects products whose title says so, as a duplicate key error would
+    def insert_many(self, docs, **kwargs):
+        rejected = [index for index, doc in enumerate(docs) if doc["title"] == "Rejected"]
+        super().insert_many([doc for doc in docs if doc["title"] != "Rejected"])
+        if rejected:
+            raise BulkWriteError({"writeErrors": [{"index": index, "errmsg": "duplicate key"} for index in rejected]})
+        return type("Result", (), {"inserted_ids": [doc["_id"] for doc in docs]})()
+
+
+def test_ingest_refreshes_views_with_inserted_products_only(tmp_path, monkeypatch):
+    refreshed = []
+    monkeypatch.setattr(bulk_ingest, "refresh_views", lambda collection, products: refreshed.extend(products))
+    path = tmp_path / "catalog.jsonl"
+    path.write_text("\n".join(json.dumps(p) for p in [
+        {"_id": "a", "title": "Slim Fit Shirt"}, {"_id": "b", "title": "Rejected"},
+    ]))
+    summary = bulk_ingest.ingest([str(path)], RejectingCollection(), view_collection=InMemoryCollection("views"),
+                                 processes=1, writers=1)
+    assert (summary["inserted"], summary["failed"]) == (1, 1)
+    assert [p["_id"] for p in refreshed] == ["a"]
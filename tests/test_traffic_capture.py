@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+import traffic_capture
+from traffic_capture import ReplayBackend, TrafficRecorder, load_capture
+
+
+def test_sessions_are_sampled_whole():
+    recorder = TrafficRecorder(rate=0.3)
+    decisions = {session: recorder.sample(session) for session in map(str, range(1000))}
+    assert all(recorder.sample(session) == decision for session, decision in decisions.items())
+    assert 200 < sum(decisions.values()) < 400
+
+
+@pytest.mark.parametrize("rate, sampled", [(0, False), (1, True)])
+def test_off_and_full_capture(rate, sampled):
+    recorder = TrafficRecorder(rate=rate)
+    assert recorder.sample("s") is sampled and recorder.sample() is sampled
+
+
+def test_recorded_entries_are_written_and_loaded_in_arrival_order(tmp_path):
+    path = str(tmp_path / "capture.jsonl")
+    recorder = TrafficRecorder(path=path, rate=1)
+    recorder.record({"ts": 2.0, "query": "blue jeans", "status": 200})
+    recorder.record({"ts": 1.0, "query": "red shirts", "status": 200, "result_ids": [object()]})
+    recorder.flush()
+    with open(path, "a", encoding="utf-8") as file:
+        file.write("{truncated\n[1]\n" + json.dumps({"query": "no timestamp"}) + "\n")
+    assert [entry["query"] for entry in load_capture(path)] == ["red shirts", "blue jeans"]
+
+
+def test_full_queue_drops_instead_of_blocking(tmp_path):
+    recorder = TrafficRecorder(path=str(tmp_path / "capture.jsonl"), rate=1, max_queued=1)
+    recorder._start = lambda: None  # No writer draining the queue
+    dropped = traffic_capture.TRAFFIC_RECORDS.value("dropped")
+    recorder.record({"ts": 1.0, "query": "a"})
+    recorder.record({"ts": 2.0, "query": "b"})
+    assert traffic_capture.TRAFFIC_RECORDS.value("dropped") == dropped + 1
+
+
+def test_replay_returns_the_latest_recorded_extraction(tmp_path, monkeypatch):
+    monkeypatch.setattr(traffic_capture, "TRAFFIC_REPLAY_LLM_LATENCY", False)
+    path = tmp_path / "capture.jsonl"
+    entries = [
+        {"ts": 1.0, "query": "red shirts", "source": "llm", "extraction": {"filter": {"brand": "Old"}, "projection": {}}},
+        {"ts": 2.0, "query": "red shirts", "source": "llm", "extraction": {"filter": {"brand": "New"}, "projection": {"title": 1}}},
+        {"ts": 3.0, "query": "in blue instead", "source": "refinement", "extraction": {"filter": {"brand": "X"}}},
+    ]
+    path.write_text("".join(json.dumps(entry) + "\n" for entry in entries))
+    backend = ReplayBackend("test-app", path=str(path))
+    assert backend.generate_filter("red shirts") == ({"brand": "New"}, {"title": 1})
+    # Refinements and unknown queries fall back to the rules
+    assert backend.generate_filter("in blue instead") == backend._fallback.generate_filter("in blue instead")
@@ -0,0 +1,283 @@
+import argparse
+import os
+import re
+import time
+from collections import defaultdict
+
+from extractors import ITEM_TYPES
+from instrumentation import counter, get_logger
+
+# Materialized top-N product lists for "top 5 rated ..." style queries.
+#
+# For the whole catalog, for every category and sub_category, and for every
+# known item type (products whose title contains "shirt", "jeans", ...), a
+# view document holds the best TOPN_SIZE products by rating, by discount
+# and by price (cheapest first), already sorted. View ids are
+# "<scope>:<value>:<metric>", e.g. "sub_category:Topwear:rating" or
+# "item:shirt:rating", so serving a top-N request is a single _id point read
+# instead of a filtered string sort over the collection. A case-insensitive
+# title regex naming an item type, as the extractors generate for "top 5
+# rated shirts", is served from the item views.
+#
+# Ingest merges each inserted batch into the views it touches with one
+# $push / $sort / $slice update per view, on numeric per-metric sort keys
+# stored with each entry, so concurrent writers never overwrite each
+# other's merges; older copies of re-ingested products are $pull-ed first.
+# `rebuild_views` recomputes them all.
+#
+# Environment variables:
+#   TOPN_COLLECTION   view collection name (default "flipKart_top_products")
+#   TOPN_SIZE         products kept per view, the largest N served (default 50)
+#
+# Rebuild every view from scratch:
+#   python top_views.py --rebuild
+
+TOPN_COLLECTION = os.getenv("TOPN_COLLECTION", "flipKart_top_products")
+TOPN_SIZE = int(os.getenv("TOPN_SIZE", "50"))
+
+# Fields copied into the views, everything the search response shows
+VIEW_FIELDS = (
+    "title", "brand", "category", "sub_category", "color", "description", "selling_price",
+    "actual_price", "discount", "images", "out_of_stock", "average_rating", "product_details",
+)
+
+# Filter fields a view can answer, most specific first
+VIEW_SCOPES = ("sub_category", "category")
+# Title terms with a view of their own
+VIEW_ITEM_TYPES = tuple(ITEM_TYPES)
+
+TOPN_REQUESTS = counter("topn_view_requests_total", "Top-N requests by how they were answered", ("result",))
+
+logger = get_logger("top_views")
+
+
+def _number(value):
+    digits = re.sub(r"[^\d.]", "", str(value or ""))
+    try:
+        return float(digits)
+    except ValueError:
+        return None
+
+
+def _rating_key(product):
+    rating = _number(product.get("average_rating"))
+    return -(rating if rating is not None else -1)
+
+
+def _discount_key(product):
+    discount = _number(product.get("discount"))
+    return -(discount if discount is not None else -1)
+
+
+def _price_key(product):
+    price = _number(product.get("selling_price"))
+    return price if price is not None else float("inf")
+
+
+# metric -> sort key, smallest first
+METRICS = {"rating": _rating_key, "discount": _discount_key, "price": _price_key}
+
+METRIC_PATTERNS = (
+    ("discount", re.compile(r"\b(?:discount(?:ed|s)?|deals?|offers?|% off)\b")),
+    ("price", re.compile(r"\b(?:cheap(?:est)?|lowest price|least expensive|budget|affordable)\b")),
+    ("rating", re.compile(r"\b(?:rated|rating|ratings|best|top)\b")),
+)
+TOP_N_PATTERN = re.compile(r"\b(?:top|best|cheapest)\s+(\d+)\b", re.IGNORECASE)
+
+
+def parse_top_n(query):
+    """
+    Return (n, metric) when the query asks for the top N products by some
+    measure, otherwise None.
+    """
+    match = TOP_N_PATTERN.search(query)
+    if not match:
+        return None
+    text = query.lower()
+    for metric, pattern in METRIC_PATTERNS:
+        if pattern.search(text):
+            return int(match.group(1)), metric
+    return None
+
+
+def _view_entry(product):
+    entry = {field: product[field] for field in VIEW_FIELDS if field in product}
+    entry["_id"] = str(product.get("_id", product.get("pid", "")))
+    # Numeric sort keys, so views are merged and ranked by the database
+    for metric, key in METRICS.items():
+        entry[f"_rank_{metric}"] = key(product)
+    return entry
+
+
+def _view_keys(product):
+    yield "all", "all"
+    for scope in VIEW_SCOPES:
+        if product.get(scope):
+            yield scope, product[scope]
+    # The same test a case-insensitive, unanchored title regex applies
+    title = str(product.get("title") or "").lower()
+    for item in VIEW_ITEM_TYPES:
+        if item in title:
+            yield "item", item
+
+
+def _item_type(condition):
+    # The item type a title condition selects, when it is exactly an item view
+    if not isinstance(condition, dict) or set(condition) != {"$regex", "$options"}:
+        return None
+    pattern, options = condition["$regex"], condition["$options"]
+    if not isinstance(pattern, str) or not isinstance(options, str) or "i" not in options:
+        return None
+    pattern = pattern.lower()
+    return pattern if pattern in VIEW_ITEM_TYPES else None
+
+
+def _grouped(products):
+    # (scope, value) -> view entries of the products in it
+    grouped = defaultdict(list)
+    for product in products:
+        # Near-duplicate variants are represented by their canonical product
+        if product.get("_canonical") is False:
+            continue
+        entry = _view_entry(product)
+        for scope, value in _view_keys(product):
+            grouped[(scope, value)].append(entry)
+    return grouped
+
+
+def view_documents(products):
+    """
+    Compute every view of a set of products in memory, as refresh_views
+    would write them to an empty collection.
+    """
+    return [
+        {
+            "_id": f"{scope}:{value}:{metric}", "scope": scope, "value": value, "metric": metric,
+            "products": sorted(entries, key=lambda e: (e[f"_rank_{metric}"], e["_id"]))[:TOPN_SIZE],
+        }
+        for (scope, value), entries in _grouped(products).items()
+        for metric in METRICS
+    ]
+
+
+def refresh_views(view_collection, products):
+    """
+    Merge newly inserted products into the views they belong to, with
+    atomic per-view updates. Returns the number of views written.
+    """
+    from pymongo import UpdateOne
+    from mongo_store import bulk_write_batched
+
+    grouped = _grouped(products)
+    view_ids = {
+        (scope, value, metric): f"{scope}:{value}:{metric}" for scope, value in grouped for metric in METRICS
+    }
+    # Re-ingested products replace their older copies: pull them out before pushing
+    bulk_write_batched(view_collection, (
+        UpdateOne({"_id": view_id}, {"$pull": {"products": {"_id": {"$in": [e["_id"] for e in grouped[scope, value]]}}}})
+        for (scope, value, metric), view_id in view_ids.items()
+    ))
+    bulk_write_batched(view_collection, (
+        UpdateOne(
+            {"_id": view_id},
+            {
+                "$setOnInsert": {"scope": scope, "value": value, "metric": metric},
+                "$push": {"products": {
+                    "$each": grouped[scope, value],
+                    "$sort": {f"_rank_{metric}": 1, "_id": 1},
+                    "$slice": TOPN_SIZE,
+                }},
+            },
+            upsert=True,
+        )
+        for (scope, value, metric), view_id in view_ids.items()
+    ))
+    logger.debug("Refreshed %d top-N views", len(view_ids))
+    return len(view_ids)
+
+
+def rebuild_views(collection, view_collection, batch_size=5000):
+    """
+    Recompute every view from the product collection. Returns the number
+    of products read.
+    """
+    view_collection.delete_many({})
+    projection = {field: 1 for field in VIEW_FIELDS}
+    batch, total = [], 0
+    for product in collection.find({"_canonical": {"$ne": False}}, projection):
+        batch.append(product)
+        if len(batch) >= batch_size:
+            refresh_views(view_collection, batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        refresh_views(view_collection, batch)
+        total += len(batch)
+    return total
+
+
+class TopNViews:
+    def __init__(self, view_collection):
+        self.view_collection = view_collection
+
+    def lookup(self, filter_query, n, metric):
+        """
+        Return the top `n` products for a filter, or None when the filter is
+        not something a view can answer (anything beyond category and
+        sub_category equality, or an item-type title regex on its own) or
+        `n` exceeds the materialized size.
+        """
+        # {"field": {"$eq": value}} is the same point lookup as {"field": value}
+        filter_query = {
+            field: value["$eq"] if isinstance(value, dict) and list(value) == ["$eq"] else value
+            for field, value in filter_query.items()
+        }
+        if n > TOPN_SIZE:
+            TOPN_REQUESTS.inc("unservable")
+            return None
+        if "title" in filter_query:
+            item = _item_type(filter_query["title"])
+            if item is None or len(filter_query) > 1:
+                TOPN_REQUESTS.inc("unservable")
+                return None
+            scope, value = "item", item
+        elif (any(field not in VIEW_SCOPES for field in filter_query)
+                or any(not isinstance(value, str) for value in filter_query.values())):
+            TOPN_REQUESTS.inc("unservable")
+            return None
+        else:
+            scope = next((s for s in VIEW_SCOPES if s in filter_query), "all")
+            value = filter_query.get(scope, "all")
+        view = self.view_collection.find_one({"_id": f"{scope}:{value}:{metric}"}, {"products": 1})
+        if view is None:
+            TOPN_REQUESTS.inc("missing")
+            return None
+        # Writers racing on the same product can leave two copies of it
+        seen = set()
+        products = [p for p in view["products"] if p["_id"] not in seen and not seen.add(p["_id"])]
+        if scope == "sub_category" and "category" in filter_query:
+            products = [p for p in products if p.get("category") == filter_query["category"]]
+        TOPN_REQUESTS.inc("hit")
+        return products[:n]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the materialized top-N product views.")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute all views from the product collection")
+    parser.add_argument("--collection", default="flipKart_products", help="Product collection")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from mongo_store import write_collection
+
+    load_dotenv()
+    if args.rebuild:
+        start = time.perf_counter()
+        total = rebuild_views(write_collection(args.collection), write_collection(TOPN_COLLECTION))
+        print(f"Rebuilt top-N views from {total} products in {time.perf_counter() - start:.1f}s")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import atexit
+import copy
+import json
+import os
+import queue
+import random
+import threading
+import time
+import zlib
+
+from extractors import Backend, RuleBackend, register_backend
+from instrumentation import counter, get_logger, stage
+
+# Sampled /search traffic capture, and the extractor backend that replays it.
+#
+# With TRAFFIC_CAPTURE_RATE > 0 the complex app records a sample of its
+# /search requests as JSON lines: arrival time, query, session id, the
+# filter/projection the request was answered with and where it came from
+# (llm, template or refinement), the LLM call time, status, latency and the
+# returned product ids. Chat sessions are sampled whole, by a hash of the
+# session id, so a replayed follow-up always has the searches it refines;
+# requests without a session are sampled one by one. Request handlers only
+# put a dict on a bounded queue; a background thread serializes and writes
+# in batches, and entries are dropped (and counted) rather than slowing
+# requests down when it falls behind.
+#
+# The "replay" backend answers generate_filter() from a capture file
+# instead of a model, optionally sleeping for the recorded LLM time, so an
+# app variant can be re-driven with the exact extractions production saw
+# (see traffic_replay.py). Queries missing from the capture fall back to
+# the rule-based extractor.
+#
+# Environment variables:
+#   TRAFFIC_CAPTURE_RATE         share of /search requests recorded (default 0, off)
+#   TRAFFIC_CAPTURE_PATH         JSONL file appended to (default "traffic_capture.jsonl")
+#   TRAFFIC_CAPTURE_QUEUE        entries buffered before dropping (default 10000)
+#   TRAFFIC_REPLAY_PATH          capture file the "replay" backend reads (default TRAFFIC_CAPTURE_PATH)
+#   TRAFFIC_REPLAY_LLM_LATENCY   replay the recorded LLM call time (default 1)
+
+TRAFFIC_CAPTURE_RATE = float(os.getenv("TRAFFIC_CAPTURE_RATE", "0"))
+TRAFFIC_CAPTURE_PATH = os.getenv("TRAFFIC_CAPTURE_PATH", "traffic_capture.jsonl")
+TRAFFIC_CAPTURE_QUEUE = int(os.getenv("TRAFFIC_CAPTURE_QUEUE", "10000"))
+TRAFFIC_REPLAY_PATH = os.getenv("TRAFFIC_REPLAY_PATH", TRAFFIC_CAPTURE_PATH)
+TRAFFIC_REPLAY_LLM_LATENCY = os.getenv("TRAFFIC_REPLAY_LLM_LATENCY", "1") == "1"
+
+WRITE_BATCH = 256
+
+TRAFFIC_RECORDS = counter("traffic_capture_records_total", "Captured /search requests", ("outcome",))
+REPLAY_LOOKUPS = counter("traffic_replay_lookups_total", "Replay backend lookups", ("result",))
+
+logger = get_logger("traffic_capture")
+
+
+class TrafficRecorder:
+    """
+    Samples requests and appends them to a JSONL file from a background
+    writer thread.
+    """
+
+    def __init__(self, path=TRAFFIC_CAPTURE_PATH, rate=TRAFFIC_CAPTURE_RATE, max_queued=TRAFFIC_CAPTURE_QUEUE):
+        self.path = path
+        self.rate = rate
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def sample(self, session_id=None):
+        if self.rate <= 0 or self.rate >= 1:
+            return self.rate > 0
+        if session_id:
+            # The same decision for every request of a session
+            return zlib.crc32(str(session_id).encode("utf-8")) < self.rate * 2**32
+        return random.random() < self.rate
+
+    def record(self, entry):
+        """
+        Queue one entry for writing. The entry must not be changed afterwards.
+        """
+        self._start()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            TRAFFIC_RECORDS.inc("dropped")
+
+    def _start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._write, name="traffic-capture", daemon=True)
+                    self._thread.start()
+                    atexit.register(self.flush)
+
+    def _write(self):
+        with open(self.path, "a", encoding="utf-8") as file:
+            while True:
+                batch = [self._queue.get()]
+                while len(batch) < WRITE_BATCH:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                try:
+                    file.write("".join(json.dumps(entry, default=str) + "\n" for entry in batch))
+                    file.flush()
+                    TRAFFIC_RECORDS.inc("written", amount=len(batch))
+                except (OSError, TypeError, ValueError) as e:
+                    TRAFFIC_RECORDS.inc("failed", amount=len(batch))
+                    logger.error("Writing captured traffic to %s failed: %s", self.path, e)
+                finally:
+                    for _ in batch:
+                        self._queue.task_done()
+
+    def flush(self):
+        # Wait for the writer to catch up (at exit, and in tools and tests)
+        if self._thread is not None:
+            self._queue.join()
+
+
+def load_capture(path):
+    """
+    Read a capture file, skipping malformed lines. Returns entries in
+    arrival order.
+    """
+    entries = []
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(entry, dict) and "query" in entry and "ts" in entry:
+                entries.append(entry)
+    entries.sort(key=lambda entry: entry["ts"])
+    return entries
+
+
+@register_backend("replay")
+class ReplayBackend(Backend):
+    """
+    Extractor that returns the filter recorded for a query.
+    """
+
+    def __init__(self, app_name, path=None):
+        super().__init__(app_name)
+        self.path = path or TRAFFIC_REPLAY_PATH
+        self._fallback = RuleBackend(app_name)
+        self._recorded = None
+
+    def _lookup(self, user_query):
+        if self._recorded is None:
+            # Latest recording per query; loaded on first use
+            self._recorded = {
+                entry["query"]: entry for entry in load_capture(self.path)
+                if entry.get("extraction") and entry.get("source") != "refinement"
+            }
+        return self._recorded.get(user_query)
+
+    def extract(self, user_query):
+        return self._fallback.extract(user_query)
+
+    def generate_filter(self, user_query, prompt=None):
+        entry = self._lookup(user_query)
+        if entry is None:
+            REPLAY_LOOKUPS.inc("miss")
+            return self._fallback.generate_filter(user_query, prompt)
+        REPLAY_LOOKUPS.inc("hit")
+        with stage(self.app_name, "llm_extraction"):
+            if TRAFFIC_REPLAY_LLM_LATENCY and entry.get("llm_ms"):
+                time.sleep(entry["llm_ms"] / 1000.0)
+            extraction = copy.deepcopy(entry["extraction"])
+        return extraction.get("filter") or {}, extraction.get("projection") or {}
@@ -0,0 +1,196 @@
+import argparse
+import json
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+
+from benchmark import git_commit, summarize
+from traffic_capture import load_capture
+
+# Replay /search traffic captured by traffic_capture.py against a running app.
+#
+# Requests are sent at their recorded arrival offsets divided by --speed
+# (--speed 0 sends them as fast as --concurrency allows), with each chat
+# session's follow-ups kept in the session under a per-run prefix. Start
+# the app variant under test with the "replay" extractor to answer with the
+# recorded LLM output, and the recorded LLM latency, instead of a model,
+# and its own template cache file (an app with the replay backend never
+# saves templates, but would still pre-warm from the production file):
+#
+#   EXTRACTOR_BACKEND=replay TRAFFIC_REPLAY_PATH=traffic_capture.jsonl \
+#       TEMPLATE_CACHE_PATH=/tmp/replay_templates.json \
+#       uvicorn --app-dir "complex data" groq-app:app --port 8000
+#
+# The report compares the replay with the recording: status codes, latency
+# distributions, template cache hit rate (from the app's /metrics) and how
+# often the returned products differ.
+#
+# Example:
+#   python traffic_replay.py traffic_capture.jsonl --url http://127.0.0.1:8000 --speed 4
+#   python traffic_replay.py traffic_capture.jsonl --url http://127.0.0.1:8001 --speed 0 \
+#       --concurrency 64 --output replay_candidate.json --diffs 10
+
+METRIC_LINE = re.compile(r'^(\w+)\{result="(\w+)"\}\s+([\d.eE+-]+)$')
+
+
+def template_lookups(url):
+    # Template cache hit/miss counts from the app's /metrics, or None without metrics
+    try:
+        response = requests.get(f"{url}/metrics", timeout=10)
+        response.raise_for_status()
+    except requests.RequestException:
+        return None
+    counts = Counter()
+    for line in response.text.splitlines():
+        match = METRIC_LINE.match(line)
+        if match and match.group(1) == "template_cache_lookups_total":
+            counts[match.group(2)] += float(match.group(3))
+    return counts
+
+
+def hit_rate(hits, misses):
+    total = hits + misses
+    return round(hits / total, 4) if total else None
+
+
+def replay(url, entries, speed, concurrency, timeout):
+    """
+    Send the entries on their recorded schedule. Returns one result per
+    entry, in the same order.
+    """
+    run = uuid.uuid4().hex[:8]
+    origin = entries[0]["ts"]
+    results = [None] * len(entries)
+    session_local = threading.local()
+
+    def send(index, scheduled):
+        session = getattr(session_local, "session", None)
+        if session is None:
+            session = session_local.session = requests.Session()
+        entry = entries[index]
+        body = {"query": entry["query"]}
+        if entry.get("session_id"):
+            body["session_id"] = f"{run}:{entry['session_id']}"
+        sent = time.perf_counter()
+        try:
+            response = session.post(f"{url}/search", json=body, timeout=timeout)
+            status = response.status_code
+            products = response.json().get("products", []) if status == 200 else []
+        except (requests.RequestException, ValueError):
+            status, products = None, []
+        results[index] = {
+            "status": status,
+            "latency_ms": (time.perf_counter() - sent) * 1000.0,
+            "late_ms": (sent - scheduled) * 1000.0,
+            "result_ids": [product.get("id") for product in products],
+        }
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for index, entry in enumerate(entries):
+            scheduled = start + ((entry["ts"] - origin) / speed if speed else 0.0)
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, index, scheduled)
+    return results, time.perf_counter() - start
+
+
+def compare_results(entries, results):
+    # Per-request comparison of replayed responses with the recorded ones
+    statuses = Counter()
+    same, changed, overlaps, diffs = 0, 0, [], []
+    for entry, result in zip(entries, results):
+        statuses[f"{entry.get('status')}->{result['status']}"] += 1
+        if entry.get("status") != 200 or result["status"] != 200:
+            continue
+        recorded, replayed = entry.get("result_ids") or [], result["result_ids"]
+        if recorded == replayed:
+            same += 1
+            continue
+        changed += 1
+        union = set(recorded) | set(replayed)
+        overlaps.append(len(set(recorded) & set(replayed)) / len(union) if union else 1.0)
+        diffs.append({"query": entry["query"], "recorded": recorded, "replayed": replayed})
+    return {
+        "statuses": dict(sorted(statuses.items())),
+        "results_identical": same,
+        "results_changed": changed,
+        "mean_overlap_when_changed": round(sum(overlaps) / len(overlaps), 4) if overlaps else None,
+    }, diffs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured /search traffic against a running app.")
+    parser.add_argument("capture", help="JSONL file written by traffic_capture.py")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Base URL of the app under test")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed multiple, 0 for as fast as possible")
+    parser.add_argument("--concurrency", type=int, default=32, help="Requests in flight at most")
+    parser.add_argument("--limit", type=int, help="Replay only the first N captured requests")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout in seconds")
+    parser.add_argument("--diffs", type=int, default=0, metavar="N", help="Print the first N queries whose results changed")
+    parser.add_argument("--output", default="replay_results.json", help="Where to write machine-readable results")
+    args = parser.parse_args()
+
+    entries = load_capture(args.capture)[:args.limit]
+    if not entries:
+        parser.error(f"No captured requests in {args.capture}")
+    url = args.url.rstrip("/")
+
+    before = template_lookups(url)
+    print(f"Replaying {len(entries)} requests against {url} at {'max' if not args.speed else f'{args.speed:g}x'} speed ...")
+    results, elapsed = replay(url, entries, args.speed, args.concurrency, args.timeout)
+    after = template_lookups(url)
+
+    comparison, diffs = compare_results(entries, results)
+    sources = Counter(entry.get("source") for entry in entries if entry.get("status") == 200)
+    replay_hit_rate = None
+    if before is not None and after is not None:
+        replay_hit_rate = hit_rate(after["hit"] - before["hit"], after["miss"] - before["miss"])
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "capture": args.capture,
+            "url": url,
+            "speed": args.speed,
+            "concurrency": args.concurrency,
+            "requests": len(entries),
+        },
+        "elapsed_s": round(elapsed, 3),
+        "recorded": {
+            "latency": summarize([entry["latency_ms"] for entry in entries if "latency_ms" in entry]),
+            "template_hit_rate": hit_rate(sources["template"], sources["llm"]),
+            "sources": dict(sources),
+        },
+        "replayed": {
+            "latency": summarize([result["latency_ms"] for result in results if result["status"] is not None]),
+            "lateness": summarize([result["late_ms"] for result in results]),
+            "template_hit_rate": replay_hit_rate,
+        },
+        "comparison": comparison,
+    }
+
+    recorded, replayed = report["recorded"]["latency"], report["replayed"]["latency"]
+    for key in ("p50_ms", "p95_ms", "p99_ms"):
+        print(f"  latency {key:<7} {recorded[key]} -> {replayed[key]}")
+    print(f"  template hit rate {report['recorded']['template_hit_rate']} -> {replay_hit_rate}")
+    print(f"  statuses (recorded->replayed) {comparison['statuses']}")
+    print(f"  results identical {comparison['results_identical']}, changed {comparison['results_changed']}")
+    print(f"  schedule lateness p99 {report['replayed']['lateness']['p99_ms']} ms")
+    for diff in diffs[:args.diffs]:
+        print(f"  {diff['query']!r}: {diff['recorded']} -> {diff['replayed']}")
+
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2, sort_keys=True)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()